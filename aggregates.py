@@ -0,0 +1,76 @@
+import datetime
+from availability import parse_date
+
+UPSERT_VEHICLE_STATS = (
+    "INSERT INTO RentalVehicleStats (vehicle_id, rentals, rental_days, revenue) VALUES (%s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE rentals = rentals + VALUES(rentals), rental_days = rental_days + VALUES(rental_days), "
+    "revenue = revenue + VALUES(revenue)"
+)
+UPSERT_DAILY_STATS = (
+    "INSERT INTO RentalDailyStats (day, rentals_started, revenue, vehicles_out) VALUES (%s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE rentals_started = rentals_started + VALUES(rentals_started), "
+    "revenue = revenue + VALUES(revenue), vehicles_out = vehicles_out + VALUES(vehicles_out)"
+)
+
+
+class RentalAggregates:
+    # The changes a set of rental writes makes to the summary tables from migrations/002, collected in
+    # memory and applied with one executemany per table inside the write's own transaction, so the
+    # summaries commit or roll back together with the rentals.
+    # - RentalVehicleStats: rentals, rental days and revenue per vehicle
+    # - RentalDailyStats: rentals started and revenue booked per date_from, and vehicles on hire per day
+    # Both dates count as rental days, as in the double-booking check.
+    def __init__(self):
+        self.vehicles = {}  # vehicle_id -> [rentals, rental_days, revenue]
+        self.days = {}  # date -> [rentals_started, revenue, vehicles_out]
+
+    def add(self, vehicle_id, date_from, date_to, total_cost, sign=1):
+        date_from, date_to = parse_date(date_from), parse_date(date_to)
+        days = (date_to - date_from).days + 1
+        revenue = float(total_cost or 0) * sign
+
+        if vehicle_id is not None:
+            totals = self.vehicles.setdefault(vehicle_id, [0, 0, 0.0])
+            totals[0] += sign
+            totals[1] += days * sign
+            totals[2] += revenue
+
+        started = self.days.setdefault(date_from, [0, 0.0, 0])
+        started[0] += sign
+        started[1] += revenue
+        for offset in range(days):
+            self.days.setdefault(date_from + datetime.timedelta(days=offset), [0, 0.0, 0])[2] += sign
+
+    def remove(self, vehicle_id, date_from, date_to, total_cost):
+        self.add(vehicle_id, date_from, date_to, total_cost, sign=-1)
+
+    def apply(self, cursor):
+        # Rows go out in key order, so two transactions touching the same keys lock them in the same order
+        vehicles = [
+            (vehicle_id, rentals, rental_days, round(revenue, 2))
+            for vehicle_id, (rentals, rental_days, revenue) in sorted(self.vehicles.items())
+            if rentals or rental_days or round(revenue, 2)
+        ]
+        days = [
+            (day, rentals_started, round(revenue, 2), vehicles_out)
+            for day, (rentals_started, revenue, vehicles_out) in sorted(self.days.items())
+            if rentals_started or vehicles_out or round(revenue, 2)
+        ]
+        if vehicles:
+            cursor.executemany(UPSERT_VEHICLE_STATS, vehicles)
+        if days:
+            cursor.executemany(UPSERT_DAILY_STATS, days)
+
+
+def rebuild_summaries(cursor, load):
+    # Recomputes both summary tables from scratch; load() yields (vehicle_id, date_from, date_to, total_cost)
+    # for every rental. Deleting first locks the summary rows, so a rental write that lands meanwhile
+    # waits for this transaction and then applies its own delta on top of the rebuilt totals.
+    cursor.execute("DELETE FROM RentalVehicleStats")
+    cursor.execute("DELETE FROM RentalDailyStats")
+
+    aggregates = RentalAggregates()
+    for vehicle_id, date_from, date_to, total_cost in load():
+        aggregates.add(vehicle_id, date_from, date_to, total_cost)
+    aggregates.apply(cursor)
+    return aggregates
@@ -1,10 +1,31 @@
-from flask import Flask, jsonify, request
-from flask_mysqldb import MySQL
+from flask import Flask, jsonify, request, Response, stream_with_context, g
+from db_pool import PooledMySQL, PoolTimeout
+from store import UserStore, TableVersions, ReadPins, IdempotencyStore, EventLog
+from response_cache import ResponseCache
+from availability import RentalIndex, FleetSnapshot, parse_date
+from pricing import RateTable, quote
+from aggregates import RentalAggregates, rebuild_summaries
+from listing import ListSpec, parse_bool, parse_iso_date, parse_number
+from serialize import RowEncoder, stream_page, stream_changes, iso_date
+from metrics import Metrics
+from compression import Compressor
+from idempotency import IdempotencyKeys
+from batch import BatchConnection, resolve_references
+from events import parse_topics, parse_last_event_id, poll_events, PUBLIC_TOPICS
+from slow_queries import SlowQueryLog
+import numpy as np
+from auth_cache import CredentialCache, TokenCache
+from MySQLdb.cursors import SSCursor
 from flask_httpauth import HTTPBasicAuth
 import jwt
 import datetime
-import json
+import csv
+import io
+import click
+import sqlite3
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
 from functools import wraps
 
 app = Flask(__name__)
@@ -14,28 +35,217 @@ app.config["MYSQL_USER"] = "root"
 app.config["MYSQL_PASSWORD"] = "root"
 app.config["MYSQL_DB"] = "vehicle_rental_db"
 app.config["SECRET_KEY"] = "kyle123"
+app.config["MYSQL_POOL_MIN_SIZE"] = 2
+app.config["MYSQL_POOL_MAX_SIZE"] = 10
+app.config["MYSQL_POOL_TIMEOUT"] = 5.0
+app.config["MYSQL_POOL_MAX_USES"] = 1000
+app.config["MYSQL_POOL_MAX_AGE"] = 3600.0
+app.config["MYSQL_REPLICAS"] = []  # e.g. [{"host": "10.0.0.12"}, {"host": "10.0.0.13", "port": 3307}]
+app.config["MYSQL_REPLICA_BALANCE"] = "least_loaded"
+app.config["MYSQL_REPLICA_CHECK_INTERVAL"] = 5.0
+app.config["MYSQL_REPLICA_MAX_LAG"] = 30
+app.config["READ_YOUR_WRITES_WINDOW"] = 5.0
+app.config["MYSQL_ASYNC_POOL_MIN_SIZE"] = 2
+app.config["MYSQL_ASYNC_POOL_MAX_SIZE"] = 50
+app.config["ASGI_FALLBACK_WORKERS"] = 32
+app.config["CREDENTIAL_CACHE_SIZE"] = 1024
+app.config["CREDENTIAL_CACHE_TTL"] = 300.0
+app.config["TOKEN_CACHE_SIZE"] = 10000
+app.config["RESPONSE_CACHE_SIZE"] = 256
+app.config["PRICING_WEEKEND_MULTIPLIER"] = 1.0
+app.config["PRICING_LONG_HIRE_DAYS"] = 7
+app.config["PRICING_LONG_HIRE_MULTIPLIER"] = 1.0
+app.config["SLOW_QUERY_THRESHOLD"] = 0.5
+app.config["SLOW_QUERY_EXPLAIN_FILE"] = None
+app.config["SLOW_QUERY_EXPLAIN_INTERVAL"] = 300.0
+app.config["COMPRESSION_MIN_SIZE"] = 1024
+app.config["COMPRESSION_ENCODINGS"] = ("zstd", "br", "gzip")
+app.config["COMPRESSION_GZIP_LEVEL"] = 6
+app.config["COMPRESSION_BR_LEVEL"] = 5
+app.config["COMPRESSION_ZSTD_LEVEL"] = 3
+app.config["IDEMPOTENCY_TTL"] = 86400.0
+app.config["IDEMPOTENCY_MAX_KEYS"] = 100000
+app.config["IDEMPOTENCY_WAIT"] = 10.0
+app.config["IDEMPOTENCY_STALE_AFTER"] = 60.0
+app.config["EVENTS_RETAIN"] = 10000
+app.config["EVENTS_POLL_INTERVAL"] = 0.25
+app.config["EVENTS_HEARTBEAT"] = 15.0
+app.config["EVENTS_SYNC_STREAM_SECONDS"] = 60.0
+app.config["SYNC_SETTLE_SECONDS"] = 1.0
+
+# Statements slower than SLOW_QUERY_THRESHOLD seconds are logged, and EXPLAINed into
+# SLOW_QUERY_EXPLAIN_FILE when it is set; server-side (SSCursor) exports are only logged
+slow_queries = SlowQueryLog(
+    app.config["SLOW_QUERY_THRESHOLD"],
+    app.config["SLOW_QUERY_EXPLAIN_FILE"],
+    app.config["SLOW_QUERY_EXPLAIN_INTERVAL"],
+    unbuffered=(SSCursor,),
+)
+
+# Request, SQL and auth metrics for GET /metrics; every connection handed out by the pool is instrumented
+metrics = Metrics(slow_queries=slow_queries)
+metrics.init_app(app)
+
+mysql = PooledMySQL(app, wrap=metrics.wrap)
+
+# gzip (and br/zstd when brotli/zstandard are installed) for JSON, NDJSON and CSV bodies of
+# COMPRESSION_MIN_SIZE bytes or more, negotiated from Accept-Encoding; streamed bodies included
+compressor = Compressor(app)
 
-mysql = MySQL(app)
 auth = HTTPBasicAuth()
 
 USER_DATA_FILE = "users.json"
-
-def load_users():
+STATE_DB_FILE = "state.db"
+
+# Keyset pagination: unpaged requests get DEFAULT_PAGE_SIZE rows, no request gets more than MAX_PAGE_SIZE
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows pulled from the server-side cursor per chunk of an export
+EXPORT_CHUNK_SIZE = 1000
+
+RENTAL_COLUMNS = ("rental_id", "customer_id", "vehicle_id", "date_from", "date_to", "total_cost")
+
+# What each list endpoint can return (?fields=) and filter on (?column=value, and
+# ?column__gte= / __lte= / __gt= / __lt= for the range columns)
+CUSTOMER_LIST = ListSpec("Customers", "customer_id", {
+    "customer_id": int,
+    "customer_name": str,
+    "customer_contact": str
+})
+VEHICLE_LIST = ListSpec("Vehicles", "vehicle_id", {
+    "vehicle_id": int,
+    "reg_number": str,
+    "model_name": str,
+    "daily_hire_rate": parse_number,
+    "vehicle_type": str
+}, ranges=("daily_hire_rate",))
+LOCATION_LIST = ListSpec("Locations", "location_id", {
+    "location_id": int,
+    "location_name": str,
+    "vehicle_id": int,
+    "is_available": parse_bool
+})
+RENTAL_LIST = ListSpec("Rentals", "rental_id", {
+    "rental_id": int,
+    "customer_id": int,
+    "vehicle_id": int,
+    "date_from": parse_iso_date,
+    "date_to": parse_iso_date,
+    "total_cost": parse_number
+}, ranges=("date_from", "date_to", "total_cost"))
+
+# Vehicle/date-range combinations priced per POST /quotes
+MAX_QUOTES = 1000
+
+# Longest date range one GET /stats/daily request may cover
+MAX_STATS_DAYS = 366
+
+# Bulk create: items accepted per request, and rows sent per multi-row INSERT
+MAX_BULK_ITEMS = 5000
+BULK_CHUNK_SIZE = 500
+
+# Operations accepted per POST /batch, and the methods they may use
+MAX_BATCH_OPERATIONS = 50
+BATCH_METHODS = ("POST", "PUT", "DELETE")
+
+# Users live in a SQLite table shared by every worker; users.json is imported on first use
+users = UserStore(STATE_DB_FILE, legacy_file=USER_DATA_FILE)
+credential_cache = CredentialCache(app.config["CREDENTIAL_CACHE_SIZE"], app.config["CREDENTIAL_CACHE_TTL"])
+token_cache = TokenCache(app.config["TOKEN_CACHE_SIZE"])
+
+# After a successful write, the writer's reads stay on the primary for READ_YOUR_WRITES_WINDOW seconds
+read_pins = ReadPins(STATE_DB_FILE)
+
+# POSTs retried with the same Idempotency-Key get the first response back instead of inserting again
+idempotency = IdempotencyKeys(
+    IdempotencyStore(STATE_DB_FILE),
+    ttl=app.config["IDEMPOTENCY_TTL"],
+    max_keys=app.config["IDEMPOTENCY_MAX_KEYS"],
+    wait=app.config["IDEMPOTENCY_WAIT"],
+    stale_after=app.config["IDEMPOTENCY_STALE_AFTER"],
+)
+
+# Vehicle, location and rental writes are appended here for GET /events; the newest EVENTS_RETAIN are kept
+change_log = EventLog(STATE_DB_FILE, retain=app.config["EVENTS_RETAIN"])
+
+# Public GET /vehicles and /locations are served from here until a write bumps the table's version
+versions = TableVersions(STATE_DB_FILE)
+response_cache = ResponseCache(versions, app.config["RESPONSE_CACHE_SIZE"], compressor=compressor)
+
+# Yields the rows of a query through a server-side cursor, so loading a whole table keeps memory flat
+def stream_rows(query, params=None):
+    cursor = mysql.connection.cursor(SSCursor)
     try:
-        with open(USER_DATA_FILE, "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return {}
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+RENTAL_INTERVALS_QUERY = "SELECT rental_id, vehicle_id, date_from, date_to FROM Rentals WHERE vehicle_id IS NOT NULL AND date_to >= %s"
+
+def load_rental_intervals(start):
+    return stream_rows(RENTAL_INTERVALS_QUERY, (start,))
+
+def load_rental_intervals_by_id(rental_ids, start):
+    cursor = mysql.connection.cursor()
+    for offset in range(0, len(rental_ids), MAX_BULK_ITEMS):
+        chunk = rental_ids[offset:offset + MAX_BULK_ITEMS]
+        cursor.execute(f"{RENTAL_INTERVALS_QUERY} AND rental_id IN ({', '.join(['%s'] * len(chunk))})", [start] + chunk)
+        yield from cursor.fetchall()
+
+def load_available_fleet():
+    cursor = mysql.connection.cursor()
+    cursor.execute(
+        "SELECT v.vehicle_id, v.reg_number, v.model_name, v.daily_hire_rate, v.vehicle_type, l.location_id, l.location_name "
+        "FROM Vehicles v JOIN Locations l ON l.vehicle_id = v.vehicle_id WHERE l.is_available = TRUE"
+    )
+    return cursor.fetchall()
 
-def save_users(users):
-    with open(USER_DATA_FILE, "w") as file:
-        json.dump(users, file)
+# Availability search runs against these in memory; the index follows rental writes through change_log
+rental_index = RentalIndex(change_log, load_rental_intervals, load_rental_intervals_by_id)
+fleet = FleetSnapshot(versions, load_available_fleet)
 
-users = load_users()
+def load_rates():
+    cursor = mysql.connection.cursor()
+    cursor.execute("SELECT vehicle_id, daily_hire_rate FROM Vehicles")
+    return cursor.fetchall()
+
+rate_table = RateTable(versions, load_rates)
+
+# Prices rentals from the cached daily hire rates; returns (costs, days, found) arrays
+def price_rentals(vehicle_ids, dates_from, dates_to):
+    rates, found = rate_table.lookup(vehicle_ids)
+    costs, days = quote(
+        rates,
+        np.array([parse_date(date) for date in dates_from], dtype="datetime64[D]"),
+        np.array([parse_date(date) for date in dates_to], dtype="datetime64[D]"),
+        weekend_multiplier=app.config["PRICING_WEEKEND_MULTIPLIER"],
+        long_hire_days=app.config["PRICING_LONG_HIRE_DAYS"],
+        long_hire_multiplier=app.config["PRICING_LONG_HIRE_MULTIPLIER"],
+    )
+    return costs, days, found
+
+# Returns the user when the password matches. Successful checks are cached, failed ones always pay the KDF.
+def check_credentials(username, password):
+    user = users.get(username)
+    if not user or not password:
+        return None
+
+    if credential_cache.check(username, password, user['password']):
+        return user
+    if check_password_hash(user['password'], password):
+        credential_cache.add(username, password, user['password'])
+        return user
+    return None
 
 @auth.verify_password
 def verify_password(username, password):
-    if username in users and check_password_hash(users[username]['password'], password):
+    if check_credentials(username, password):
         return username
 
 # Generate JWT
@@ -45,19 +255,21 @@ def login():
     username = data.get("username")
     password = data.get("password")
 
-    if username not in users or not check_password_hash(users[username]['password'], password):
+    user = check_credentials(username, password)
+    if not user:
+        metrics.auth_outcome("login", "failure")
         return jsonify({"error": "Invalid credentials"}), 401
+    metrics.auth_outcome("login", "success")
 
     # Check if token already exists for the user
-    if 'token' not in users[username]:
+    if 'token' not in user:
         token = jwt.encode({
             "username": username,
             "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)
         }, app.config["SECRET_KEY"], algorithm="HS256")
-        users[username]['token'] = token
-        save_users(users)
+        users.set_token(username, token)
     else:
-        token = users[username]['token']
+        token = user['token']
 
     return jsonify({"token": token})
 
@@ -72,50 +284,286 @@ def register():
     if not username or not password:
         return jsonify({"error": "Username and password are required"}), 400
 
-    if username in users:
+    # The insert itself is the existence check, so two workers cannot register the same name
+    if not users.add(username, generate_password_hash(password), role):
         return jsonify({"error": "User already exists"}), 400
 
-    users[username] = {
-        "password": generate_password_hash(password),
-        "role": role
-    }
-    save_users(users)
-
     return jsonify({"message": "User registered successfully"}), 201
 
 # JWT Token validation
-def token_required(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        token = request.headers.get("Authorization")
-
-        if not token:
-            return jsonify({"error": "Token is missing"}), 401
-
+# Returns (username, None) for a valid token, or (None, (error message, status)); shared with asgi.py
+def authenticate(token):
+    if not token:
+        metrics.auth_outcome("token", "missing")
+        return None, ("Token is missing", 401)
+
+    decoded_token = token_cache.get(token)
+    if decoded_token is None:
         try:
             decoded_token = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
-            request.username = decoded_token["username"]
         except jwt.ExpiredSignatureError:
-            return jsonify({"error": "Token has expired"}), 401
+            metrics.auth_outcome("token", "expired")
+            return None, ("Token has expired", 401)
         except jwt.InvalidTokenError:
-            return jsonify({"error": "Invalid token"}), 401
+            metrics.auth_outcome("token", "invalid")
+            return None, ("Invalid token", 401)
+        token_cache.add(token, decoded_token)
+    metrics.auth_outcome("token", "valid")
+    return decoded_token["username"], None
+
+def token_required(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        username, error = authenticate(request.headers.get("Authorization"))
+        if error:
+            return jsonify({"error": error[0]}), error[1]
+        request.username = username
+        if mysql.replicas.replicas and read_pins.pinned(username):
+            g.read_primary = True
 
         return f(*args, **kwargs)
     return wrapper
 
 # Role-based access control
+def has_role(username, required_roles):
+    user_role = (users.get(username) or {}).get("role")
+    if not user_role or user_role not in required_roles:
+        metrics.auth_outcome("role", "forbidden")
+        return False
+    metrics.auth_outcome("role", "allowed")
+    return True
+
 def role_required(required_roles):
     def decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            username = getattr(request, "username", None)
-            user_role = users.get(username, {}).get("role")
-            if not user_role or user_role not in required_roles:
+            if not has_role(getattr(request, "username", None), required_roles):
                 return jsonify({"error": "Access forbidden: insufficient permissions"}), 403
             return f(*args, **kwargs)
         return wrapper
     return decorator
 
+# Pagination helpers
+def page_args(args=None):
+    args = request.args if args is None else args
+    limit = args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    after = args.get("after", 0, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE)), after
+
+# Seek past the last key of the previous page instead of OFFSET, so every page costs the same.
+# One extra row is fetched to tell whether there is a next page. Projection (fields=) and filters
+# are compiled into the SELECT by the ListSpec, so MySQL only reads and sends what was asked for.
+# Returns ((sql, params, columns, limit), None) or (None, error message)
+def page_query(spec, args):
+    limit, after = page_args(args)
+    query, error = spec.query(args, after, limit + 1)
+    if error:
+        return None, error
+    return query + (limit,), None
+
+# The rows are encoded straight from the cursor tuples and streamed out in chunks
+def page_body(spec, name, columns, rows, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][columns.index(spec.key)]
+    return stream_page(name, RowEncoder(columns), rows, next_cursor)
+
+# Delta sync (?since=<version>&after=<id>) on the list endpoints. The triggers from migrations/003 stamp
+# every inserted or updated row with the time of the statement, in microseconds, and leave a tombstone
+# stamped the same way for every deleted row. A version is stamped before its transaction commits, so
+# changes are read in (version, id) order up to sync_horizon(), which stays behind the oldest transaction
+# still open. It is read first, in a statement that reads no table rows, so the reads after it see every
+# transaction that committed below it. Stamps come from the primary's clock, so the sync reads there too.
+SYNC_HORIZON_QUERY = "SELECT sync_clock(), sync_horizon(%s)"
+SYNC_TABLE_QUERY = "SELECT pruned_version FROM SyncTables WHERE table_name = %s"
+TOMBSTONE_QUERY = (
+    "SELECT row_id, row_version FROM Tombstones WHERE table_name = %s "
+    "AND row_version >= %s AND (row_version > %s OR row_id > %s) AND row_version < %s "
+    "ORDER BY row_version, row_id LIMIT %s"
+)
+
+# Returns ((sql, columns, since, after, limit), None) or (None, error message)
+def sync_query(spec, args):
+    since = args.get("since", type=int)
+    if since is None or since < 0:
+        return None, "Since must be a non-negative integer"
+    query, error = spec.changes(args)
+    if error:
+        return None, error
+    limit, after = page_args(args)
+    return query + (since, after, limit), None
+
+def sync_horizon_args():
+    return (int(app.config["SYNC_SETTLE_SECONDS"] * 1000000),)
+
+def sync_changes_args(since, after, horizon, limit):
+    return since, since, after, horizon, limit + 1
+
+# Returns (horizon, None), or (None, (error message, status)) when the client has to reload instead.
+# A since ahead of the clock means the clock went back, and rows written since then may be stamped
+# below versions already handed out. The horizon itself can fall back below since, while a transaction
+# that started just before since is still open, and then there is nothing new to send yet. since=0 is a
+# full sync, which needs no tombstones, so pruning does not refuse it.
+def sync_horizon(clock_row, table_row, since):
+    if table_row is None:
+        return None, ("Delta sync is not set up for this table", 501)
+    clock, horizon = clock_row
+    if since > clock or 0 < since < table_row[0]:
+        return None, ("Changes since this version are no longer available, sync again from since=0", 410)
+    return max(horizon, since), None
+
+# Rows and tombstones are merged in (version, id) order and cut at limit. When cut, version and after are
+# those of the last change sent and more is true, so the client asks again from there; otherwise version
+# is the horizon and every change before it has been sent.
+def sync_body(spec, name, columns, rows, tombstones, horizon, limit):
+    key = columns.index(spec.key)
+    changes = sorted(
+        [(row[-1], row[key], row[:-1], None) for row in rows] +
+        [(row_version, row_id, None, row_id) for row_id, row_version in tombstones],
+        key=lambda change: change[:2],
+    )
+    more = len(changes) > limit
+    version, after = horizon, None
+    if more:
+        changes = changes[:limit]
+        version, after = changes[-1][:2]
+    return stream_changes(
+        name,
+        RowEncoder(columns),
+        [row for _, _, row, _ in changes if row is not None],
+        [row_id for _, _, row, row_id in changes if row is None],
+        version,
+        after,
+        more,
+    )
+
+def sync_page(spec, name):
+    query, error = sync_query(spec, request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+    sql, columns, since, after, limit = query
+    cursor = mysql.connection.cursor()
+    cursor.execute(SYNC_HORIZON_QUERY, sync_horizon_args())
+    clock_row = cursor.fetchone()
+    cursor.execute(SYNC_TABLE_QUERY, (spec.table,))
+    horizon, error = sync_horizon(clock_row, cursor.fetchone(), since)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+
+    cursor.execute(sql, sync_changes_args(since, after, horizon, limit))
+    rows = cursor.fetchall()
+    cursor.execute(TOMBSTONE_QUERY, (spec.table,) + sync_changes_args(since, after, horizon, limit))
+    tombstones = cursor.fetchall()
+    return Response(sync_body(spec, name, columns, rows, tombstones, horizon, limit), mimetype="application/json"), 200
+
+# Cached lists pass from_replica=False: a page read from a lagging replica would be cached under the
+# new table version and outlive the lag
+def list_page(spec, name, not_found, from_replica=True):
+    if "since" in request.args:
+        return sync_page(spec, name)
+
+    query, error = page_query(spec, request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+    sql, params, columns, limit = query
+    cursor = (mysql.read_connection if from_replica else mysql.connection).cursor()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+
+    if not rows:
+        return jsonify({"error": not_found}), 404
+    return Response(page_body(spec, name, columns, rows, limit), mimetype="application/json"), 200
+
+
+# Work that must wait until a write is committed (cache invalidation, the availability index, change
+# events) goes through here. It runs at once, unless POST /batch is holding it until its own commit.
+def after_commit(callback, *args, **kwargs):
+    pending = g.get("after_commit")
+    if pending is None:
+        callback(*args, **kwargs)
+    else:
+        pending.append((callback, args, kwargs))
+
+# Called after a write has committed. A failure here must not turn the committed write into an
+# error response, so it is only logged; subscribers that miss the event catch up on the next one.
+def publish(topic, action, ids):
+    if not ids:
+        return
+    try:
+        change_log.append(topic, action, ids)
+    except sqlite3.Error as e:
+        app.logger.warning("could not record %s %s event: %s", topic, action, e)
+
+# Read-your-writes: a successful write pins its user's replica-capable reads to the primary for a while
+@app.after_request
+def pin_writer(response):
+    if mysql.replicas.replicas and request.method in ("POST", "PUT", "DELETE") and response.status_code < 400:
+        username = getattr(request, "username", None)
+        if username:
+            read_pins.pin(username, app.config["READ_YOUR_WRITES_WINDOW"])
+    return response
+
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(e):
+    return jsonify({"error": "Database busy, try again later"}), 503
+
+# Pool health for load balancers and dashboards
+@app.route("/health", methods=["GET"])
+def health():
+    return jsonify({
+        "status": "ok",
+        "pool": mysql.pool.stats(),
+        "replicas": mysql.replicas.stats(),
+        "credential_cache": credential_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "slow_queries": slow_queries.stats(),
+        "compression": compressor.stats(),
+        "idempotency": idempotency.stats()
+    }), 200
+
+# Prometheus scrape endpoint
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+# Server-Sent Events for vehicle, location and rental writes (?topics=vehicles,locations by default).
+# Each event's id is its sequence number, so a reconnecting EventSource resumes from Last-Event-ID.
+# Under a sync server each stream holds a worker thread, so it ends after EVENTS_SYNC_STREAM_SECONDS
+# and the client reconnects; asgi.py serves the same stream from one poller per worker without threads.
+def event_stream_args(headers, args):
+    topics, error = parse_topics(args.get("topics"))
+    if error:
+        return None, (error, 400)
+    if any(topic not in PUBLIC_TOPICS for topic in topics):
+        username, error = authenticate(headers.get("Authorization"))
+        if error:
+            return None, error
+        if not has_role(username, ["staff", "admin"]):
+            return None, ("Access forbidden: insufficient permissions", 403)
+    last_seq = parse_last_event_id(headers.get("Last-Event-ID") or args.get("last_event_id"))
+    return (topics, last_seq), None
+
+EVENT_STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.route("/events", methods=["GET"])
+def get_events():
+    stream, error = event_stream_args(request.headers, request.args)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+    topics, last_seq = stream
+    events = poll_events(
+        change_log, last_seq, topics,
+        poll_interval=app.config["EVENTS_POLL_INTERVAL"],
+        heartbeat=app.config["EVENTS_HEARTBEAT"],
+        duration=app.config["EVENTS_SYNC_STREAM_SECONDS"],
+    )
+    return Response(events, mimetype="text/event-stream", headers=EVENT_STREAM_HEADERS)
+
 
 @app.route("/")
 def hello_world():
@@ -158,116 +606,458 @@ def hello_world():
 @app.route("/customers", methods=["GET"])
 @token_required
 def get_customers():
-    cursor = mysql.connection.cursor()
-    cursor.execute("SELECT * FROM Customers")
-    customers = cursor.fetchall()
-
-    if not customers:
-        return jsonify({"error": "No customers found"}), 404
-
-    customers_list = [
-        {
-        "customer_id": customer[0], 
-        "customer_name": customer[1], 
-        "customer_contact": customer[2]
-        }
-        for customer in customers
-    ]
-
-    return jsonify(customers_list), 200
+    return list_page(CUSTOMER_LIST, "customers", "No customers found")
 
 #READ VEHICLES
 @app.route("/vehicles", methods=["GET"])
+@response_cache.cached("Vehicles")
 def get_vehicles():
-    cursor = mysql.connection.cursor()
-    cursor.execute("SELECT * FROM Vehicles")
-    vehicles = cursor.fetchall()
-
-    if not vehicles:
-        return jsonify({"error": "No vehicles found"}), 404
+    return list_page(VEHICLE_LIST, "vehicles", "No vehicles found", from_replica=False)
 
+#VEHICLE AVAILABILITY
+@app.route("/vehicles/available", methods=["GET"])
+def get_available_vehicles():
+    try:
+        date_from = parse_date(request.args.get("from", ""))
+        date_to = parse_date(request.args.get("to", ""))
+    except ValueError:
+        return jsonify({"error": "From and to are required and must be valid dates (YYYY-MM-DD)"}), 400
+    if date_from > date_to:
+        return jsonify({"error": "From must not be after to"}), 400
+
+    type_filter = request.args.get("type")
+    location_filter = request.args.get("location")
+
+    rental_index.ensure_current()
+    booked = None
+    if not rental_index.covers(date_from):
+        # The index only keeps rentals that had not ended when it was loaded
+        cursor = mysql.connection.cursor()
+        cursor.execute(
+            "SELECT DISTINCT vehicle_id FROM Rentals WHERE vehicle_id IS NOT NULL AND date_to >= %s AND date_from <= %s",
+            (date_from, date_to),
+        )
+        booked = {row[0] for row in cursor.fetchall()}
     vehicles_list = [
         {
-            "vehicle_id": vehicle[0],
-            "reg_number": vehicle[1],
-            "model_name": vehicle[2],
-            "daily_hire_rate": vehicle[3],
-            "vehicle_type": vehicle[4]
+            "vehicle_id": vehicle_id,
+            "reg_number": reg_number,
+            "model_name": model_name,
+            "daily_hire_rate": daily_hire_rate,
+            "vehicle_type": vehicle_type,
+            "location_id": location_id,
+            "location_name": location_name
         }
-        for vehicle in vehicles
+        for vehicle_id, reg_number, model_name, daily_hire_rate, vehicle_type, location_id, location_name in fleet.rows()
+        if (not type_filter or vehicle_type == type_filter)
+        and (not location_filter or location_filter in (str(location_id), location_name))
+        and (rental_index.is_free(vehicle_id, date_from, date_to) if booked is None else vehicle_id not in booked)
     ]
-    
-    return jsonify(vehicles_list), 200
+
+    return jsonify({"vehicles": vehicles_list}), 200
 
 #READ LOCATIONS
 @app.route("/locations", methods=["GET"])
+@response_cache.cached("Locations")
 def get_locations():
-    cursor = mysql.connection.cursor()
-    cursor.execute("SELECT * FROM Locations")
-    locations = cursor.fetchall()
-
-    if not locations:
-        return jsonify({"error": "No locations found"}), 404
-
-    locations_list = [
-        {
-            "location_id": location[0],
-            "location_name": location[1],
-            "vehicle_id": location[2],
-            "is_available": location[3]
-        }
-        for location in locations
-    ]
-    
-    return jsonify(locations_list), 200
+    return list_page(LOCATION_LIST, "locations", "No locations found", from_replica=False)
 
 #READ RENTAL
 @app.route("/rentals", methods=["GET"])
 @token_required
 @role_required("staff")
 def get_rentals():
-    cursor = mysql.connection.cursor()
-    cursor.execute("SELECT * FROM Rentals")
-    rentals = cursor.fetchall()
+    return list_page(RENTAL_LIST, "rentals", "No rentals found")
 
-    if not rentals:
-        return jsonify({"error": "No rentals found"}), 404
+#EXPORT RENTALS
+@app.route("/rentals/export", methods=["GET"])
+@token_required
+@role_required("staff")
+def export_rentals():
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in ("ndjson", "csv"):
+        return jsonify({"error": "Format must be ndjson or csv"}), 400
+
+    columns = RENTAL_COLUMNS
+    encoder = RowEncoder(columns, date_format=iso_date)
+
+    def generate():
+        # SSCursor leaves the result set on the server and fetchmany() pulls it over in chunks,
+        # so memory stays flat however large Rentals gets
+        cursor = mysql.read_connection.cursor(SSCursor)
+        try:
+            cursor.execute(f"SELECT {', '.join(columns)} FROM Rentals ORDER BY rental_id")
+
+            if export_format == "csv":
+                yield ",".join(columns) + "\r\n"
+
+            while True:
+                rentals = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+                if not rentals:
+                    break
+
+                if export_format == "csv":
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(rentals)
+                    yield buffer.getvalue()
+                else:
+                    yield encoder.ndjson(rentals)
+        finally:
+            cursor.close()
+
+    if export_format == "csv":
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/csv",
+            headers={"Content-Disposition": "attachment; filename=rentals.csv"},
+        )
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# QUOTES
+# Prices a list of {vehicle_id, date_from, date_to} in one vectorized pass over the cached rates
+@app.route("/quotes", methods=["POST"])
+def create_quotes():
+    items = request.get_json()
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "A non-empty list of quote requests is required"}), 400
+    if len(items) > MAX_QUOTES:
+        return jsonify({"error": f"At most {MAX_QUOTES} quotes can be requested at once"}), 400
+
+    quotes = [None] * len(items)
+    positions = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get("vehicle_id"), int):
+            quotes[index] = {"error": "Vehicle ID is required and must be a valid number"}
+            continue
+        error = check_date_range(item.get("date_from"), item.get("date_to"))
+        if error:
+            quotes[index] = {"error": error}
+            continue
+        positions.append(index)
+
+    if positions:
+        costs, days, found = price_rentals(
+            [items[index]["vehicle_id"] for index in positions],
+            [items[index]["date_from"] for index in positions],
+            [items[index]["date_to"] for index in positions],
+        )
+        for index, cost, day_count, known in zip(positions, costs.tolist(), days.tolist(), found.tolist()):
+            item = items[index]
+            if not known:
+                quotes[index] = {"error": "Vehicle not found"}
+                continue
+            quotes[index] = {
+                "vehicle_id": item["vehicle_id"],
+                "date_from": item["date_from"],
+                "date_to": item["date_to"],
+                "days": day_count,
+                "total_cost": cost
+            }
 
-    rentals_list = [
+    return jsonify({"quotes": quotes}), 200
+
+# REVENUE AND UTILIZATION
+# Served from the summary tables the rental write handlers maintain (migrations/002), so every
+# query costs O(groups) however long the rental history gets
+@app.route("/stats/revenue/vehicles", methods=["GET"])
+@token_required
+@role_required(["staff", "admin"])
+def get_vehicle_revenue():
+    limit, after = page_args()
+    cursor = mysql.read_connection.cursor()
+    cursor.execute(
+        "SELECT s.vehicle_id, v.reg_number, v.vehicle_type, s.rentals, s.rental_days, s.revenue "
+        "FROM RentalVehicleStats s JOIN Vehicles v ON v.vehicle_id = s.vehicle_id "
+        "WHERE s.vehicle_id > %s ORDER BY s.vehicle_id LIMIT %s",
+        (after, limit + 1),
+    )
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][0]
+
+    vehicles_list = [
         {
-            "rental_id": rental[0],
-            "customer_id": rental[1],
-            "vehicle_id": rental[2],
-            "date_from": rental[3],
-            "date_to": rental[4],
-            "total_cost": rental[5]
+            "vehicle_id": vehicle_id,
+            "reg_number": reg_number,
+            "vehicle_type": vehicle_type,
+            "rentals": rentals,
+            "rental_days": rental_days,
+            "revenue": float(revenue)
         }
-        for rental in rentals
+        for vehicle_id, reg_number, vehicle_type, rentals, rental_days, revenue in rows
     ]
-    
-    return jsonify(rentals_list), 200
 
-# ADD CUSTOMERS
-@app.route("/customers", methods=["POST"])
+    return jsonify({"vehicles": vehicles_list, "next": next_cursor}), 200
+
+@app.route("/stats/revenue/vehicle-types", methods=["GET"])
 @token_required
 @role_required(["staff", "admin"])
-def add_customer():
-    data = request.get_json()
+def get_vehicle_type_revenue():
+    cursor = mysql.read_connection.cursor()
+    cursor.execute(
+        "SELECT v.vehicle_type, COUNT(*), SUM(s.rentals), SUM(s.rental_days), SUM(s.revenue) "
+        "FROM RentalVehicleStats s JOIN Vehicles v ON v.vehicle_id = s.vehicle_id "
+        "GROUP BY v.vehicle_type ORDER BY v.vehicle_type"
+    )
+
+    types_list = [
+        {
+            "vehicle_type": vehicle_type,
+            "vehicles": vehicles,
+            "rentals": int(rentals),
+            "rental_days": int(rental_days),
+            "revenue": float(revenue)
+        }
+        for vehicle_type, vehicles, rentals, rental_days, revenue in cursor.fetchall()
+    ]
+
+    return jsonify({"vehicle_types": types_list}), 200
+
+# Revenue is booked on the day a rental starts; utilization is vehicles on hire over the current fleet size
+@app.route("/stats/daily", methods=["GET"])
+@token_required
+@role_required(["staff", "admin"])
+def get_daily_stats():
+    try:
+        date_from = parse_date(request.args.get("from", ""))
+        date_to = parse_date(request.args.get("to", ""))
+    except ValueError:
+        return jsonify({"error": "From and to are required and must be valid dates (YYYY-MM-DD)"}), 400
+    if date_from > date_to:
+        return jsonify({"error": "From must not be after to"}), 400
+    span = (date_to - date_from).days + 1
+    if span > MAX_STATS_DAYS:
+        return jsonify({"error": f"At most {MAX_STATS_DAYS} days can be requested at once"}), 400
+
+    cursor = mysql.read_connection.cursor()
+    cursor.execute(
+        "SELECT day, rentals_started, revenue, vehicles_out FROM RentalDailyStats WHERE day BETWEEN %s AND %s",
+        (date_from, date_to),
+    )
+    stats = {parse_date(row[0]): row[1:] for row in cursor.fetchall()}
+    cursor.execute("SELECT COUNT(*) FROM Vehicles")
+    fleet_size = cursor.fetchone()[0]
+
+    days_list = []
+    for offset in range(span):
+        day = date_from + datetime.timedelta(days=offset)
+        rentals_started, revenue, vehicles_out = stats.get(day, (0, 0, 0))
+        days_list.append({
+            "day": day.isoformat(),
+            "rentals_started": rentals_started,
+            "revenue": float(revenue),
+            "vehicles_out": vehicles_out,
+            "utilization": round(vehicles_out / fleet_size, 4) if fleet_size else None
+        })
+
+    vehicle_days = sum(day["vehicles_out"] for day in days_list)
+    return jsonify({
+        "days": days_list,
+        "fleet_size": fleet_size,
+        "revenue": round(sum(day["revenue"] for day in days_list), 2),
+        "utilization": round(vehicle_days / (fleet_size * span), 4) if fleet_size else None
+    }), 200
+
+# VALIDATION
+# Each validator returns (values, None) with the values in INSERT column order, or (None, error message)
+def validate_customer(data):
     customer_name = data.get("customer_name")
     customer_contact = data.get("customer_contact")
 
-    #VALIDATION
     if not customer_name or not isinstance(customer_name, str):
-        return jsonify({"error": "Customer name is required and must be a valid string"}), 400
+        return None, "Customer name is required and must be a valid string"
     if not customer_contact or not isinstance(customer_contact, str):
-        return jsonify({"error": "Customer contact is required and must be a valid string"}), 400
+        return None, "Customer contact is required and must be a valid string"
+    return (customer_name, customer_contact), None
+
+def validate_vehicle(data):
+    reg_number = data.get("reg_number")
+    model_name = data.get("model_name")
+    daily_hire_rate = data.get("daily_hire_rate")
+    vehicle_type = data.get("vehicle_type")
+
+    if not reg_number or not isinstance(reg_number, str):
+        return None, "Registration number is required and must be a valid string"
+    if not model_name or not isinstance(model_name, str):
+        return None, "Model name is required and must be a valid string"
+    if not daily_hire_rate or not isinstance(daily_hire_rate, (int, float)):
+        return None, "Daily hire rate is required and must be a valid number"
+    if not vehicle_type or not isinstance(vehicle_type, str):
+        return None, "Vehicle type is required and must be a valid string"
+    return (reg_number, model_name, daily_hire_rate, vehicle_type), None
+
+def validate_location(data):
+    location_name = data.get("location_name")
+    vehicle_id = data.get("vehicle_id")
+    is_available = data.get("is_available")
+
+    if not location_name or not isinstance(location_name, str):
+        return None, "Location name is required and must be a valid string"
+    if not vehicle_id or not isinstance(vehicle_id, int):
+        return None, "Vehicle ID is required and must be a valid number"
+    if not is_available or not isinstance(is_available, bool):
+        return None, "Availability is required and must be a valid boolean"
+    return (location_name, vehicle_id, is_available), None
+
+def validate_rental(data):
+    customer_id = data.get("customer_id")
+    vehicle_id = data.get("vehicle_id")
+    date_from = data.get("date_from")
+    date_to = data.get("date_to")
+    total_cost = data.get("total_cost")
+
+    if not customer_id or not isinstance(customer_id, int):
+        return None, "Customer ID is required and must be a valid number"
+    if not vehicle_id or not isinstance(vehicle_id, int):
+        return None, "Vehicle ID is required and must be a valid number"
+    if not date_from or not isinstance(date_from, str):
+        return None, "Date from is required and must be a valid string"
+    if not date_to or not isinstance(date_to, str):
+        return None, "Date to is required and must be a valid string"
+    # Left out, the cost is computed server-side by fill_rental_costs
+    if total_cost is not None and (not total_cost or not isinstance(total_cost, (int, float))):
+        return None, "Total cost must be a valid number"
+    return (customer_id, vehicle_id, date_from, date_to, total_cost), check_date_range(date_from, date_to)
+
+# Prices the validated rental rows that came without a total_cost, all in one vectorized call
+def fill_rental_costs(rows):
+    missing = [position for position, row in enumerate(rows) if row[4] is None]
+    if not missing:
+        return rows
+
+    costs, _, found = price_rentals(
+        [rows[position][1] for position in missing],
+        [rows[position][2] for position in missing],
+        [rows[position][3] for position in missing],
+    )
+    rows = list(rows)
+    for position, cost, known in zip(missing, costs, found):
+        if known:
+            rows[position] = rows[position][:4] + (float(cost),)
+    return rows
+
+def check_date_range(date_from, date_to):
+    try:
+        if parse_date(date_from) > parse_date(date_to):
+            return "Date from must not be after date to"
+    except (TypeError, ValueError):
+        return "Dates must be valid dates (YYYY-MM-DD)"
+    return None
+
+# DOUBLE-BOOKING CHECKS
+# The vehicle row is locked FOR UPDATE until the transaction ends, so two workers booking the same
+# vehicle queue up here. The overlap query is a locking read (LOCK IN SHARE MODE): a plain SELECT
+# would read the REPEATABLE READ snapshot taken at the transaction's first read (the rate reload in
+# fill_rental_costs, or an earlier operation of a POST /batch), which can predate the rental the
+# worker ahead of us just committed. A locking read always sees the latest committed rows. It seeks
+# on idx_rentals_vehicle_dates (migrations/001) and only reads rentals that end on or after
+# date_from, so its cost does not grow with a vehicle's past rentals.
+def find_rental_conflict(cursor, vehicle_id, date_from, date_to, rental_id=0):
+    cursor.execute("SELECT vehicle_id FROM Vehicles WHERE vehicle_id = %s FOR UPDATE", (vehicle_id,))
+    if cursor.fetchone() is None:
+        return jsonify({"error": "Vehicle not found"}), 404
+
+    cursor.execute(
+        f"SELECT {', '.join(RENTAL_COLUMNS)} FROM Rentals "
+        "WHERE vehicle_id = %s AND date_to >= %s AND date_from <= %s AND rental_id <> %s LIMIT 1 LOCK IN SHARE MODE",
+        (vehicle_id, date_from, date_to, rental_id),
+    )
+    conflict = cursor.fetchone()
+    if conflict is not None:
+        return jsonify({
+            "error": "Vehicle is already booked for these dates",
+            "conflict": dict(zip(RENTAL_COLUMNS, conflict))
+        }), 409
+    return None
+
+# Same check for a whole batch: one lock statement and one overlap query, then rows are compared in
+# memory against existing rentals and against earlier rows of the same batch
+def find_rental_batch_conflicts(cursor, rows):
+    vehicle_ids = sorted({row[1] for row in rows})
+    placeholders = ", ".join(["%s"] * len(vehicle_ids))
+    cursor.execute(f"SELECT vehicle_id FROM Vehicles WHERE vehicle_id IN ({placeholders}) FOR UPDATE", vehicle_ids)
+    known_vehicles = {vehicle[0] for vehicle in cursor.fetchall()}
+
+    ranges = [(parse_date(row[2]), parse_date(row[3])) for row in rows]
+    cursor.execute(
+        "SELECT rental_id, vehicle_id, date_from, date_to FROM Rentals "
+        f"WHERE vehicle_id IN ({placeholders}) AND date_to >= %s AND date_from <= %s LOCK IN SHARE MODE",
+        vehicle_ids + [min(r[0] for r in ranges), max(r[1] for r in ranges)],
+    )
+    booked = {}
+    for rental_id, vehicle_id, date_from, date_to in cursor.fetchall():
+        booked.setdefault(vehicle_id, []).append((parse_date(date_from), parse_date(date_to), {"conflict_rental_id": rental_id}))
+
+    rejected = {}
+    for position, (row, (date_from, date_to)) in enumerate(zip(rows, ranges)):
+        vehicle_id = row[1]
+        if vehicle_id not in known_vehicles:
+            rejected[position] = {"error": "Vehicle not found"}
+            continue
+
+        clash = next((other for start, end, other in booked.get(vehicle_id, []) if start <= date_to and end >= date_from), None)
+        if clash is not None:
+            rejected[position] = {"error": "Vehicle is already booked for these dates", **clash}
+        else:
+            booked.setdefault(vehicle_id, []).append((date_from, date_to, {"conflict_position": position}))
+    return rejected
+
+# SUMMARY TABLES
+# Rental writes keep RentalVehicleStats and RentalDailyStats (migrations/002) in step within their own
+# transaction; rows are in INSERT_RENTAL order
+def add_rental_totals(cursor, rows):
+    aggregates = RentalAggregates()
+    for row in rows:
+        aggregates.add(row[1], row[2], row[3], row[4])
+    aggregates.apply(cursor)
+
+def remove_rental_totals(cursor, rental_ids):
+    placeholders = ", ".join(["%s"] * len(rental_ids))
+    cursor.execute(
+        f"SELECT vehicle_id, date_from, date_to, total_cost FROM Rentals WHERE rental_id IN ({placeholders}) FOR UPDATE",
+        list(rental_ids),
+    )
+    aggregates = RentalAggregates()
+    for rental in cursor.fetchall():
+        aggregates.remove(*rental)
+    aggregates.apply(cursor)
+
+# Cascade of a parent delete: locks the child rows that point at the parents and sets the column to
+# NULL. Returns the child ids, so they can be published as updated once the delete commits.
+def detach_children(cursor, child_table, column, child_key, parent_ids):
+    placeholders = ", ".join(["%s"] * len(parent_ids))
+    cursor.execute(f"SELECT {child_key} FROM {child_table} WHERE {column} IN ({placeholders}) FOR UPDATE", list(parent_ids))
+    child_ids = sorted(row[0] for row in cursor.fetchall())
+    cursor.execute(f"UPDATE {child_table} SET {column} = NULL WHERE {column} IN ({placeholders})", list(parent_ids))
+    return child_ids
+
+# The rentals of a deleted vehicle keep their revenue in RentalDailyStats, but its per-vehicle row goes
+def drop_vehicle_totals(cursor, vehicle_ids):
+    placeholders = ", ".join(["%s"] * len(vehicle_ids))
+    cursor.execute(f"DELETE FROM RentalVehicleStats WHERE vehicle_id IN ({placeholders})", list(vehicle_ids))
+
+INSERT_CUSTOMER = "INSERT INTO Customers (customer_name, customer_contact) VALUES (%s, %s)"
+INSERT_VEHICLE = "INSERT INTO Vehicles (reg_number, model_name, daily_hire_rate, vehicle_type) VALUES (%s, %s, %s, %s)"
+INSERT_LOCATION = "INSERT INTO Locations (location_name, vehicle_id, is_available) VALUES (%s, %s, %s)"
+INSERT_RENTAL = "INSERT INTO Rentals (customer_id, vehicle_id, date_from, date_to, total_cost) VALUES (%s, %s, %s, %s, %s)"
+
+# ADD CUSTOMERS
+@app.route("/customers", methods=["POST"])
+@token_required
+@role_required(["staff", "admin"])
+@idempotency.idempotent
+def add_customer():
+    values, error = validate_customer(request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
 
     try:
         cursor = mysql.connection.cursor()
-        cursor.execute(
-            "INSERT INTO Customers (customer_name, customer_contact) VALUES (%s, %s)",
-            (customer_name, customer_contact),
-        )
+        cursor.execute(INSERT_CUSTOMER, values)
         mysql.connection.commit()
         return jsonify({"message": "Customer created successfully", "customer_id": cursor.lastrowid}), 201
     except Exception as e:
@@ -277,30 +1067,18 @@ def add_customer():
 @app.route("/vehicles", methods=["POST"])
 @token_required
 @role_required(["staff", "admin"])
+@idempotency.idempotent
 def add_vehicle():
-    data = request.get_json()
-    reg_number = data.get("reg_number")
-    model_name = data.get("model_name")
-    daily_hire_rate = data.get("daily_hire_rate")
-    vehicle_type = data.get("vehicle_type")
-
-    # VALIDATION
-    if not reg_number or not isinstance(reg_number, str):
-        return jsonify({"error": "Registration number is required and must be a valid string"}), 400
-    if not model_name or not isinstance(model_name, str):
-        return jsonify({"error": "Model name is required and must be a valid string"}), 400
-    if not daily_hire_rate or not isinstance(daily_hire_rate, (int, float)):
-        return jsonify({"error": "Daily hire rate is required and must be a valid number"}), 400
-    if not vehicle_type or not isinstance(vehicle_type, str):
-        return jsonify({"error": "Vehicle type is required and must be a valid string"}), 400
+    values, error = validate_vehicle(request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
 
     try:
         cursor = mysql.connection.cursor()
-        cursor.execute(
-            "INSERT INTO Vehicles (reg_number, model_name, daily_hire_rate, vehicle_type) VALUES (%s, %s, %s, %s)",
-            (reg_number, model_name, daily_hire_rate, vehicle_type),
-        )
+        cursor.execute(INSERT_VEHICLE, values)
         mysql.connection.commit()
+        after_commit(response_cache.invalidate, "Vehicles")
+        after_commit(publish, "vehicles", "created", [cursor.lastrowid])
         return jsonify({"message": "Vehicle created successfully", "vehicle_id": cursor.lastrowid}), 201
     except Exception as e:
         return jsonify({"error": "Database error", "details": str(e)}), 500
@@ -309,27 +1087,18 @@ def add_vehicle():
 @app.route("/locations", methods=["POST"])
 @token_required
 @role_required(["staff", "admin"])
+@idempotency.idempotent
 def add_location():
-    data = request.get_json()
-    location_name = data.get("location_name")
-    vehicle_id = data.get("vehicle_id")
-    is_available = data.get("is_available")
-
-    # VALIDATION
-    if not location_name or not isinstance(location_name, str):
-        return jsonify({"error": "Location name is required and must be a valid string"}), 400
-    if not vehicle_id or not isinstance(vehicle_id, int):
-        return jsonify({"error": "Vehicle ID is required and must be a valid number"}), 400
-    if not is_available or not isinstance(is_available, bool):
-        return jsonify({"error": "Availability is required and must be a valid boolean"}), 400
+    values, error = validate_location(request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
 
     try:
         cursor = mysql.connection.cursor()
-        cursor.execute(
-            "INSERT INTO Locations (location_name, vehicle_id, is_available) VALUES (%s, %s, %s)",
-            (location_name, vehicle_id, is_available),
-        )
+        cursor.execute(INSERT_LOCATION, values)
         mysql.connection.commit()
+        after_commit(response_cache.invalidate, "Locations")
+        after_commit(publish, "locations", "created", [cursor.lastrowid])
         return jsonify({"message": "Location created successfully", "location_id": cursor.lastrowid}), 201
     except Exception as e:
         return jsonify({"error": "Database error", "details": str(e)}), 500
@@ -338,37 +1107,162 @@ def add_location():
 @app.route("/rentals", methods=["POST"])
 @token_required
 @role_required(["staff", "admin"])
+@idempotency.idempotent
 def add_rental():
-    data = request.get_json()
-    customer_id = data.get("customer_id")
-    vehicle_id = data.get("vehicle_id")
-    date_from = data.get("date_from")
-    date_to = data.get("date_to")
-    total_cost = data.get("total_cost")
-
-    # VALIDATION
-    if not customer_id or not isinstance(customer_id, int):
-        return jsonify({"error": "Customer ID is required and must be a valid number"}), 400
-    if not vehicle_id or not isinstance(vehicle_id, int):
-        return jsonify({"error": "Vehicle ID is required and must be a valid number"}), 400
-    if not date_from or not isinstance(date_from, str):
-        return jsonify({"error": "Date from is required and must be a valid string"}), 400
-    if not date_to or not isinstance(date_to, str):
-        return jsonify({"error": "Date to is required and must be a valid string"}), 400
-    if not total_cost or not isinstance(total_cost, (int, float)):
-        return jsonify({"error": "Total cost is required and must be a valid number"}), 400
+    values, error = validate_rental(request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
 
     try:
+        values = fill_rental_costs([values])[0]
         cursor = mysql.connection.cursor()
-        cursor.execute(
-            "INSERT INTO Rentals (customer_id, vehicle_id, date_from, date_to, total_cost) VALUES (%s, %s, %s, %s, %s)",
-            (customer_id, vehicle_id, date_from, date_to, total_cost),
-        )
+        conflict = find_rental_conflict(cursor, values[1], values[2], values[3])
+        if conflict:
+            mysql.connection.rollback()
+            return conflict
+
+        cursor.execute(INSERT_RENTAL, values)
+        rental_id = cursor.lastrowid
+        add_rental_totals(cursor, [values])
         mysql.connection.commit()
-        return jsonify({"message": "Rental created successfully", "rental_id": cursor.lastrowid}), 201
+        after_commit(publish, "rentals", "created", [rental_id])
+        return jsonify({"message": "Rental created successfully", "rental_id": rental_id, "total_cost": values[4]}), 201
     except Exception as e:
         return jsonify({"error": "Database error", "details": str(e)}), 500
 
+# BULK ADD
+# Validates every item, then inserts the valid ones with executemany and commits once.
+# Per-item failures are reported by index; with ?atomic=true any failure rolls back the whole batch.
+# prepare(rows), if given, can rewrite the validated rows before anything touches the database.
+# check(cursor, rows), if given, runs in the same transaction before the INSERT and returns
+# {position in rows: error dict} for rows that must not go in.
+# after(cursor, rows), if given, runs just before the commit with the rows that went in.
+def bulk_insert(insert_query, validate, check=None, prepare=None, after=None):
+    items = request.get_json()
+    atomic = request.args.get("atomic", "false").lower() in ("1", "true", "yes")
+
+    if not isinstance(items, list) or not items:
+        return {"error": "A non-empty list of items is required"}, 400
+    if len(items) > MAX_BULK_ITEMS:
+        return {"error": f"At most {MAX_BULK_ITEMS} items can be sent at once"}, 400
+
+    ids = [None] * len(items)
+    errors = []
+    positions = []
+    rows = []
+    for index, item in enumerate(items):
+        values, error = validate(item) if isinstance(item, dict) else (None, "Item must be an object")
+        if error:
+            errors.append({"index": index, "error": error})
+        else:
+            positions.append(index)
+            rows.append(values)
+
+    if errors and atomic:
+        return {"error": "Validation failed", "errors": errors}, 400
+    if rows and prepare:
+        rows = prepare(rows)
+
+    if rows:
+        connection = mysql.connection
+        cursor = connection.cursor()
+        # Send each chunk as a single multi-row INSERT; InnoDB gives the rows of one such statement
+        # consecutive auto-increment ids starting at lastrowid
+        cursor.max_stmt_length = 1 << 24
+        try:
+            rejected = check(cursor, rows) if check else {}
+            if rejected and atomic:
+                connection.rollback()
+                errors = [{"index": positions[position], **error} for position, error in rejected.items()]
+                return {"error": "Conflicting items", "errors": errors}, 409
+
+            accepted = [(index, values) for position, (index, values) in enumerate(zip(positions, rows)) if position not in rejected]
+            for start in range(0, len(accepted), BULK_CHUNK_SIZE):
+                chunk = accepted[start:start + BULK_CHUNK_SIZE]
+                cursor.executemany(insert_query, [values for _, values in chunk])
+                for offset, (index, _) in enumerate(chunk):
+                    ids[index] = cursor.lastrowid + offset
+            if after:
+                after(cursor, [values for _, values in accepted])
+            connection.commit()
+        except Exception as e:
+            connection.rollback()
+            ids = [None] * len(items)
+            if atomic:
+                return {"error": "Database error", "details": str(e)}, 500
+
+            # Retry row by row to single out the rows the database rejects; a failed statement
+            # only rolls back itself, so the rest still go in under one commit
+            try:
+                rejected = check(cursor, rows) if check else {}
+                inserted = []
+                for position, (index, values) in enumerate(zip(positions, rows)):
+                    if position in rejected:
+                        continue
+                    try:
+                        cursor.execute(insert_query, values)
+                        ids[index] = cursor.lastrowid
+                        inserted.append(values)
+                    except Exception as e:
+                        errors.append({"index": index, "error": "Database error", "details": str(e)})
+                if after:
+                    after(cursor, inserted)
+                connection.commit()
+            except Exception as e:
+                connection.rollback()
+                return {"error": "Database error", "details": str(e)}, 500
+
+        errors.extend({"index": positions[position], **error} for position, error in rejected.items())
+
+    created = sum(1 for new_id in ids if new_id is not None)
+    result = {"ids": ids, "created": created, "errors": sorted(errors, key=lambda error: error["index"])}
+    if not errors:
+        return result, 201
+    return result, 207 if created else 400
+
+def created_ids(result):
+    return [new_id for new_id in result["ids"] if new_id is not None]
+
+@app.route("/customers/bulk", methods=["POST"])
+@token_required
+@role_required(["staff", "admin"])
+@idempotency.idempotent
+def add_customers_bulk():
+    result, status = bulk_insert(INSERT_CUSTOMER, validate_customer)
+    return jsonify(result), status
+
+@app.route("/vehicles/bulk", methods=["POST"])
+@token_required
+@role_required(["staff", "admin"])
+@idempotency.idempotent
+def add_vehicles_bulk():
+    result, status = bulk_insert(INSERT_VEHICLE, validate_vehicle)
+    if result.get("created"):
+        after_commit(response_cache.invalidate, "Vehicles")
+        after_commit(publish, "vehicles", "created", created_ids(result))
+    return jsonify(result), status
+
+@app.route("/locations/bulk", methods=["POST"])
+@token_required
+@role_required(["staff", "admin"])
+@idempotency.idempotent
+def add_locations_bulk():
+    result, status = bulk_insert(INSERT_LOCATION, validate_location)
+    if result.get("created"):
+        after_commit(response_cache.invalidate, "Locations")
+        after_commit(publish, "locations", "created", created_ids(result))
+    return jsonify(result), status
+
+@app.route("/rentals/bulk", methods=["POST"])
+@token_required
+@role_required(["staff", "admin"])
+@idempotency.idempotent
+def add_rentals_bulk():
+    result, status = bulk_insert(INSERT_RENTAL, validate_rental, find_rental_batch_conflicts, fill_rental_costs, add_rental_totals)
+    if result.get("created"):
+        after_commit(publish, "rentals", "created", created_ids(result))
+    return jsonify(result), status
+
 # UPDATE CUSTOMERS
 @app.route("/customers/<int:customer_id>", methods=["PUT"])
 @token_required
@@ -427,6 +1321,8 @@ def update_vehicle(vehicle_id):
         mysql.connection.commit()
         if cursor.rowcount == 0:
             return jsonify({"error": "Vehicle not found"}), 404
+        after_commit(response_cache.invalidate, "Vehicles")
+        after_commit(publish, "vehicles", "updated", [vehicle_id])
         return jsonify({"message": "Vehicle updated successfully"}), 200
     except Exception as e:
         return jsonify({"error": "Database error", "details": str(e)}), 500
@@ -458,6 +1354,8 @@ def update_location(location_id):
         if cursor.rowcount == 0:
             return jsonify({"error": "Location not found"}), 404
 
+        after_commit(response_cache.invalidate, "Locations")
+        after_commit(publish, "locations", "updated", [location_id])
         return jsonify({"message": "Location updated successfully"}), 200
     except Exception as e:
         return jsonify({"error": "Database error", "details": str(e)}), 500
@@ -481,21 +1379,42 @@ def update_rental(rental_id):
         return jsonify({"error": "Vehicle ID is required and must be a valid integer"}), 400
     if not date_from or not date_to:
         return jsonify({"error": "Date range is required"}), 400
-    if not total_cost or not isinstance(total_cost, (int, float)):
-        return jsonify({"error": "Total cost is required and must be a valid number"}), 400
+    # Left out, the cost is priced for the new vehicle and dates, as add_rental does
+    if total_cost is not None and (not total_cost or not isinstance(total_cost, (int, float))):
+        return jsonify({"error": "Total cost must be a valid number"}), 400
+    date_error = check_date_range(date_from, date_to)
+    if date_error:
+        return jsonify({"error": date_error}), 400
 
     try:
+        total_cost = fill_rental_costs([(customer_id, vehicle_id, date_from, date_to, total_cost)])[0][4]
         cursor = mysql.connection.cursor()
+        cursor.execute(
+            "SELECT vehicle_id, date_from, date_to, total_cost FROM Rentals WHERE rental_id = %s FOR UPDATE",
+            (rental_id,),
+        )
+        previous = cursor.fetchone()
+        if previous is None:
+            mysql.connection.rollback()
+            return jsonify({"error": "Rental not found"}), 404
+
+        conflict = find_rental_conflict(cursor, vehicle_id, date_from, date_to, rental_id)
+        if conflict:
+            mysql.connection.rollback()
+            return conflict
+
         cursor.execute(
             "UPDATE Rentals SET customer_id = %s, vehicle_id = %s, date_from = %s, date_to = %s, total_cost = %s WHERE rental_id = %s",
             (customer_id, vehicle_id, date_from, date_to, total_cost, rental_id),
         )
+        aggregates = RentalAggregates()
+        aggregates.remove(*previous)
+        aggregates.add(vehicle_id, date_from, date_to, total_cost)
+        aggregates.apply(cursor)
         mysql.connection.commit()
 
-        if cursor.rowcount == 0:
-            return jsonify({"error": "Rental not found"}), 404
-
-        return jsonify({"message": "Rental updated successfully"}), 200
+        after_commit(publish, "rentals", "updated", [rental_id])
+        return jsonify({"message": "Rental updated successfully", "total_cost": total_cost}), 200
     except Exception as e:
         return jsonify({"error": "Database error", "details": str(e)}), 500
 
@@ -509,19 +1428,21 @@ def delete_customer(customer_id):
         cursor = mysql.connection.cursor()
 
         # Set customer_id to NULL in Rentals table where this customer has a rental
-        update_rentals_query = "UPDATE Rentals SET customer_id = NULL WHERE customer_id = %s"
-        cursor.execute(update_rentals_query, (customer_id,))
-        mysql.connection.commit()
+        rental_ids = detach_children(cursor, "Rentals", "customer_id", "rental_id", [customer_id])
 
         # Delete the customer
         cursor.execute("DELETE FROM Customers WHERE customer_id = %s", (customer_id,))
-        mysql.connection.commit()
 
         if cursor.rowcount == 0:
+            mysql.connection.rollback()
             return jsonify({"error": "Customer not found"}), 404
 
+        # One commit for the whole cascade, so a failure part way leaves nothing half-detached
+        mysql.connection.commit()
+        after_commit(publish, "rentals", "updated", rental_ids)
         return jsonify({"message": "Customer deleted successfully"}), 200
     except Exception as e:
+        mysql.connection.rollback()
         return jsonify({"error": "Database error", "details": str(e)}), 500
 
 
@@ -534,24 +1455,30 @@ def delete_vehicle(vehicle_id):
         cursor = mysql.connection.cursor()
 
         # Set vehicle_id to NULL in Locations table where this vehicle is located
-        update_locations_query = "UPDATE Locations SET vehicle_id = NULL WHERE vehicle_id = %s"
-        cursor.execute(update_locations_query, (vehicle_id,))
-        mysql.connection.commit()
+        location_ids = detach_children(cursor, "Locations", "vehicle_id", "location_id", [vehicle_id])
 
         # Set vehicle_id to NULL in Rentals table where this vehicle is rented
-        update_rentals_query = "UPDATE Rentals SET vehicle_id = NULL WHERE vehicle_id = %s"
-        cursor.execute(update_rentals_query, (vehicle_id,))
-        mysql.connection.commit()
+        rental_ids = detach_children(cursor, "Rentals", "vehicle_id", "rental_id", [vehicle_id])
+        drop_vehicle_totals(cursor, [vehicle_id])
 
         delete_vehicle_query = "DELETE FROM Vehicles WHERE vehicle_id = %s"
         cursor.execute(delete_vehicle_query, (vehicle_id,))
-        mysql.connection.commit()
 
         if cursor.rowcount == 0:
+            mysql.connection.rollback()
             return jsonify({"error": "Vehicle not found"}), 404
 
+        # One commit for the whole cascade, so a failure part way leaves nothing half-detached
+        mysql.connection.commit()
+
+        # The cascade above also detached the vehicle from its locations and rentals
+        after_commit(response_cache.invalidate, "Vehicles", "Locations")
+        after_commit(publish, "vehicles", "deleted", [vehicle_id])
+        after_commit(publish, "locations", "updated", location_ids)
+        after_commit(publish, "rentals", "updated", rental_ids)
         return jsonify({"message": "Vehicle deleted successfully"}), 200
     except Exception as e:
+        mysql.connection.rollback()
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
 # DELETE LOCATIONS
@@ -569,6 +1496,8 @@ def delete_location(location_id):
         if cursor.rowcount == 0:
             return jsonify({"error": "Location not found"}), 404
 
+        after_commit(response_cache.invalidate, "Locations")
+        after_commit(publish, "locations", "deleted", [location_id])
         return jsonify({"message": "Location deleted successfully"}), 200
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
@@ -581,18 +1510,240 @@ def delete_location(location_id):
 def delete_rental(rental_id):
     try:
         cursor = mysql.connection.cursor()
+        remove_rental_totals(cursor, [rental_id])
 
         delete_rental_query = "DELETE FROM Rentals WHERE rental_id = %s"
         cursor.execute(delete_rental_query, (rental_id,))
-        mysql.connection.commit()
 
         if cursor.rowcount == 0:
+            mysql.connection.rollback()
             return jsonify({"error": "Rental not found"}), 404
 
+        mysql.connection.commit()
+        after_commit(publish, "rentals", "deleted", [rental_id])
         return jsonify({"message": "Rental deleted successfully"}), 200
     except Exception as e:
+        mysql.connection.rollback()
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
 
+# BULK DELETE
+# Deletes every listed id that exists with set-based statements in one transaction: the parent rows
+# are locked, their children detached per (child table, column, child key) in cascades, then one DELETE.
+# before(cursor, ids), if given, runs right after the lock with the ids that exist.
+# Returns (response body, status, ids actually deleted, each once, {child table: detached child ids}).
+def bulk_delete(table, key, cascades, before=None):
+    data = request.get_json(silent=True) or {}
+    ids = data.get("ids")
+
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return {"error": "A non-empty list of integer ids is required"}, 400, [], {}
+    if len(ids) > MAX_BULK_ITEMS:
+        return {"error": f"At most {MAX_BULK_ITEMS} ids can be sent at once"}, 400, [], {}
+
+    ids = list(dict.fromkeys(ids))
+    connection = mysql.connection
+    try:
+        cursor = connection.cursor()
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(f"SELECT {key} FROM {table} WHERE {key} IN ({placeholders}) FOR UPDATE", ids)
+        found = sorted(row[0] for row in cursor.fetchall())
+
+        detached = {}
+        if found:
+            if before:
+                before(cursor, found)
+            for child_table, column, child_key in cascades:
+                detached[child_table] = detach_children(cursor, child_table, column, child_key, found)
+            placeholders = ", ".join(["%s"] * len(found))
+            cursor.execute(f"DELETE FROM {table} WHERE {key} IN ({placeholders})", found)
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        return {"error": "Database error", "details": str(e)}, 500, [], {}
+
+    found_ids = set(found)
+    return {"deleted": len(found), "not_found": [i for i in ids if i not in found_ids]}, 200, found, detached
+
+@app.route("/customers/bulk", methods=["DELETE"])
+@token_required
+@role_required(["staff", "admin"])
+def delete_customers_bulk():
+    result, status, deleted, detached = bulk_delete("Customers", "customer_id", [("Rentals", "customer_id", "rental_id")])
+    if deleted:
+        after_commit(publish, "rentals", "updated", detached["Rentals"])
+    return jsonify(result), status
+
+@app.route("/vehicles/bulk", methods=["DELETE"])
+@token_required
+@role_required("admin")
+def delete_vehicles_bulk():
+    result, status, deleted, detached = bulk_delete(
+        "Vehicles", "vehicle_id", [("Locations", "vehicle_id", "location_id"), ("Rentals", "vehicle_id", "rental_id")],
+        drop_vehicle_totals,
+    )
+    if deleted:
+        after_commit(response_cache.invalidate, "Vehicles", "Locations")
+        after_commit(publish, "vehicles", "deleted", deleted)
+        after_commit(publish, "locations", "updated", detached["Locations"])
+        after_commit(publish, "rentals", "updated", detached["Rentals"])
+    return jsonify(result), status
+
+@app.route("/locations/bulk", methods=["DELETE"])
+@token_required
+@role_required("admin")
+def delete_locations_bulk():
+    result, status, deleted, _ = bulk_delete("Locations", "location_id", [])
+    if deleted:
+        after_commit(response_cache.invalidate, "Locations")
+        after_commit(publish, "locations", "deleted", deleted)
+    return jsonify(result), status
+
+@app.route("/rentals/bulk", methods=["DELETE"])
+@token_required
+@role_required("admin")
+def delete_rentals_bulk():
+    result, status, deleted, _ = bulk_delete("Rentals", "rental_id", [], remove_rental_totals)
+    if deleted:
+        after_commit(publish, "rentals", "deleted", deleted)
+    return jsonify(result), status
+
+
+# BATCH
+# Runs an ordered list of write operations against the routes above, each through its own handler
+# (so validation and role checks are unchanged), on this request's connection with one commit:
+#   {"operations": [{"method": "POST", "path": "/customers", "body": {...}}, ...]}
+# A later operation's path segments and body values can refer to an earlier response, e.g.
+# "$0.customer_id". A failed operation is rolled back to the savepoint taken before it and the rest
+# still run; with ?atomic=true the first failure rolls back the whole batch. Cache invalidation and
+# change events of the operations are held back until the batch commits.
+def run_operation(operation, results):
+    # Returns (status, response body)
+    if not isinstance(operation, dict):
+        return 400, {"error": "Operation must be an object"}
+    method = operation.get("method")
+    path = operation.get("path")
+    if method not in BATCH_METHODS:
+        return 400, {"error": f"Method must be one of {', '.join(BATCH_METHODS)}"}
+    if not isinstance(path, str) or not path.startswith("/"):
+        return 400, {"error": "Path must start with /"}
+
+    path, body, error = resolve_references(path, operation.get("body"), results)
+    if error:
+        return 400, {"error": error}
+    try:
+        endpoint, view_args = app.create_url_adapter(request).match(path.partition("?")[0], method=method)
+    except HTTPException as e:
+        return e.code, {"error": e.description}
+    if endpoint == request.endpoint:
+        return 400, {"error": "Batches cannot be nested"}
+
+    environ = EnvironBuilder(
+        path=path, method=method, json=body, headers={"Authorization": request.headers.get("Authorization")}
+    ).get_environ()
+    with app.request_context(environ):
+        try:
+            response = app.make_response(app.view_functions[endpoint](**view_args))
+        except HTTPException as e:
+            return e.code, {"error": e.description}
+        return response.status_code, response.get_json(silent=True)
+
+@app.route("/batch", methods=["POST"])
+@token_required
+@idempotency.idempotent
+def run_batch():
+    data = request.get_json(silent=True)
+    operations = data.get("operations") if isinstance(data, dict) else None
+    atomic = request.args.get("atomic", "false").lower() in ("1", "true", "yes")
+
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "A non-empty list of operations is required"}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({"error": f"At most {MAX_BATCH_OPERATIONS} operations can be sent at once"}), 400
+
+    connection = mysql.connection
+    batch = BatchConnection(connection)
+    g.db_handle = batch
+    g.after_commit = pending = []
+    results = []
+    try:
+        for index, operation in enumerate(operations):
+            held = len(pending)
+            batch.savepoint()
+            status, body = run_operation(operation, results)
+            results.append({"status": status, "body": body})
+            if status < 400:
+                continue
+
+            batch.rollback()
+            del pending[held:]
+            if atomic:
+                connection.rollback()
+                return jsonify({
+                    "error": f"Operation {index} failed, nothing was committed",
+                    "index": index,
+                    "results": results
+                }), status
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        g.db_handle = connection
+        g.pop("after_commit", None)
+
+    for callback, args, kwargs in pending:
+        callback(*args, **kwargs)
+    failed = sum(1 for result in results if result["status"] >= 400)
+    if not failed:
+        return jsonify({"results": results}), 200
+    return jsonify({"results": results}), 207 if failed < len(results) else 400
+
+
+# SUMMARY REBUILD
+# Recovery path for the summary tables: flask --app app rebuild-aggregates
+def load_rental_totals():
+    return stream_rows("SELECT vehicle_id, date_from, date_to, total_cost FROM Rentals")
+
+@app.cli.command("rebuild-aggregates", help="Recompute the revenue and utilization summary tables from Rentals.")
+def rebuild_aggregates():
+    connection = mysql.connection
+    try:
+        aggregates = rebuild_summaries(connection.cursor(), load_rental_totals)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    click.echo(f"Rebuilt totals for {len(aggregates.vehicles)} vehicles and {len(aggregates.days)} days")
+
+# TOMBSTONE PRUNING
+# Tombstones older than --days are dropped: flask --app app prune-tombstones --days 30
+# Clients that last synced before the newest dropped tombstone get 410 and sync again from since=0
+@app.cli.command("prune-tombstones", help="Drop delete tombstones older than --days.")
+@click.option("--days", default=30, show_default=True, help="Keep tombstones this many days old or newer.")
+def prune_tombstones(days):
+    connection = mysql.connection
+    try:
+        cursor = connection.cursor()
+        # Versions are microseconds on the database's clock
+        cursor.execute(
+            "SELECT table_name, MAX(row_version) FROM Tombstones WHERE row_version < sync_clock() - %s GROUP BY table_name",
+            (days * 86400 * 1000000,),
+        )
+        horizons = cursor.fetchall()
+        pruned = 0
+        for table, version in horizons:
+            cursor.execute("DELETE FROM Tombstones WHERE table_name = %s AND row_version <= %s", (table, version))
+            pruned += cursor.rowcount
+            cursor.execute(
+                "UPDATE SyncTables SET pruned_version = GREATEST(pruned_version, %s) WHERE table_name = %s",
+                (version + 1, table),
+            )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    click.echo(f"Pruned {pruned} tombstones from {len(horizons)} tables")
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import time
+from urllib.parse import parse_qsl
+from a2wsgi import WSGIMiddleware
+from werkzeug.datastructures import Headers, MultiDict
+from app import (
+    app, authenticate, has_role, page_query, page_body, sync_query, sync_horizon_args, sync_changes_args,
+    sync_horizon, sync_body, metrics, compressor, change_log, event_stream_args, CUSTOMER_LIST, RENTAL_LIST,
+    EVENT_STREAM_HEADERS, SYNC_HORIZON_QUERY, SYNC_TABLE_QUERY, TOMBSTONE_QUERY
+)
+from async_db import AsyncMySQL
+from db_pool import PoolTimeout
+from events import EventBroadcaster
+from serialize import dumps
+
+logger = logging.getLogger(__name__)
+
+# Routes served as coroutines on the async pool: (method, path) -> (spec, name, not found message, roles).
+# These are the list endpoints that go to MySQL on every request; the public /vehicles and /locations
+# are answered from the response cache and stay on the Flask side.
+NATIVE_ROUTES = {
+    ("GET", "/customers"): (CUSTOMER_LIST, "customers", "No customers found", None),
+    ("GET", "/rentals"): (RENTAL_LIST, "rentals", "No rentals found", "staff"),
+}
+
+
+class AsyncApp:
+    # ASGI entry point: the routes in NATIVE_ROUTES run on the event loop and await their query on
+    # an AsyncMySQL pool, so a worker keeps thousands of them in flight on a handful of connections.
+    # Every other route is handed to the sync Flask app on a pool of fallback_workers threads, so the
+    # whole API stays reachable from one server and the WSGI deployment keeps working unchanged.
+    # With a broadcaster, GET /events streams are coroutines too, with no time limit.
+    def __init__(self, flask_app, database, routes=NATIVE_ROUTES, fallback_workers=32, broadcaster=None, heartbeat=15.0):
+        self.flask_app = flask_app
+        self.database = database
+        self.routes = routes
+        self.broadcaster = broadcaster
+        self.heartbeat = heartbeat
+        self.fallback = WSGIMiddleware(flask_app, workers=fallback_workers)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+
+        if self.broadcaster and scope["type"] == "http" and (scope["method"], scope["path"]) == ("GET", "/events"):
+            return await self.events(scope, receive, send)
+
+        route = self.routes.get((scope["method"], scope["path"])) if scope["type"] == "http" else None
+        if route is None:
+            return await self.fallback(scope, receive, send)
+
+        started = time.perf_counter()
+        status = await self.list_page(scope, send, *route)
+        metrics.requests.labels(scope["method"], scope["path"], str(status)).observe(time.perf_counter() - started)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # A database that is down at boot does not stop the server, as in sync mode;
+                # the first request opens the pool instead
+                try:
+                    await self.database.start()
+                except Exception as e:
+                    logger.warning("async pool not started: %s", e)
+                if self.broadcaster:
+                    self.broadcaster.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.broadcaster:
+                    await self.broadcaster.stop()
+                await self.database.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def list_page(self, scope, send, spec, name, not_found, roles):
+        # Same checks, query and body as app.list_page behind token_required/role_required
+        headers = dict(scope["headers"])
+        token = headers.get(b"authorization")
+        username, error = authenticate(token.decode("latin-1") if token else None)
+        if error:
+            return await send_json(send, {"error": error[0]}, error[1])
+        if roles and not has_role(username, roles):
+            return await send_json(send, {"error": "Access forbidden: insufficient permissions"}, 403)
+
+        args = MultiDict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+        encoding = compressor.choose(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if "since" in args:
+            return await self.sync_page(send, spec, name, args, encoding)
+
+        query, error = page_query(spec, args)
+        if error:
+            return await send_json(send, {"error": error}, 400)
+
+        sql, params, columns, limit = query
+        try:
+            rows = await self.database.fetchall(sql, params)
+        except PoolTimeout:
+            return await send_json(send, {"error": "Database busy, try again later"}, 503)
+
+        if not rows:
+            return await send_json(send, {"error": not_found}, 404)
+        return await send_stream(send, page_body(spec, name, columns, rows, limit), encoding)
+
+    async def sync_page(self, send, spec, name, args, encoding):
+        # Same queries as app.sync_page; each may run on a different connection, which is safe
+        # because they autocommit and the rows and tombstones are bounded by the horizon read first
+        query, error = sync_query(spec, args)
+        if error:
+            return await send_json(send, {"error": error}, 400)
+
+        sql, columns, since, after, limit = query
+        try:
+            clock_rows = await self.database.fetchall(SYNC_HORIZON_QUERY, sync_horizon_args())
+            table_rows = await self.database.fetchall(SYNC_TABLE_QUERY, (spec.table,))
+            horizon, error = sync_horizon(tuple(clock_rows[0]), tuple(table_rows[0]) if table_rows else None, since)
+            if error:
+                return await send_json(send, {"error": error[0]}, error[1])
+            rows = await self.database.fetchall(sql, sync_changes_args(since, after, horizon, limit))
+            tombstones = await self.database.fetchall(
+                TOMBSTONE_QUERY, (spec.table,) + sync_changes_args(since, after, horizon, limit)
+            )
+        except PoolTimeout:
+            return await send_json(send, {"error": "Database busy, try again later"}, 503)
+
+        return await send_stream(send, sync_body(spec, name, columns, rows, tombstones, horizon, limit), encoding)
+
+    async def events(self, scope, receive, send):
+        # Same checks as app.get_events; the stream runs until the client goes away
+        headers = Headers([(name.decode("latin-1"), value.decode("latin-1")) for name, value in scope["headers"]])
+        args = MultiDict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+        stream, error = event_stream_args(headers, args)
+        if error:
+            return await send_json(send, {"error": error[0]}, error[1])
+
+        topics, last_seq = stream
+        response_headers = [(b"content-type", b"text/event-stream")]
+        response_headers.extend((name.lower().encode(), value.encode()) for name, value in EVENT_STREAM_HEADERS.items())
+        await send({"type": "http.response.start", "status": 200, "headers": response_headers})
+
+        frames = self.broadcaster.subscribe(last_seq, topics, self.heartbeat)
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            while True:
+                frame = asyncio.ensure_future(frames.__anext__())
+                await asyncio.wait((frame, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if not frame.done():
+                    frame.cancel()
+                    await asyncio.gather(frame, return_exceptions=True)
+                    break
+                await send({"type": "http.response.body", "body": frame.result(), "more_body": True})
+        finally:
+            disconnected.cancel()
+            await frames.aclose()
+        return 200
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def send_json(send, value, status):
+    body = dumps(value)
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+    return status
+
+
+async def send_stream(send, chunks, encoding=None, status=200):
+    # Compressed as in the Flask app (compression.Compressor) when the client accepts an encoding
+    headers = [(b"content-type", b"application/json"), (b"vary", b"Accept-Encoding")]
+    if encoding is not None:
+        chunks, encoding = compressor.encode_stream(encoding, chunks)
+        if encoding is not None:
+            headers.append((b"content-encoding", encoding.encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    for chunk in chunks:
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+    return status
+
+
+# uvicorn asgi:application
+database = AsyncMySQL(app.config, metrics=metrics)
+broadcaster = EventBroadcaster(change_log, poll_interval=app.config["EVENTS_POLL_INTERVAL"])
+application = AsyncApp(
+    app, database,
+    fallback_workers=app.config["ASGI_FALLBACK_WORKERS"],
+    broadcaster=broadcaster,
+    heartbeat=app.config["EVENTS_HEARTBEAT"],
+)
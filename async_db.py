@@ -0,0 +1,95 @@
+import asyncio
+import time
+from db_pool import PoolTimeout
+
+
+def aiomysql_pool(config):
+    async def create_pool():
+        # Imported here so the async mode can be exercised without aiomysql installed
+        import aiomysql
+
+        kwargs = {
+            "host": config["MYSQL_HOST"],
+            "user": config["MYSQL_USER"],
+            "password": config["MYSQL_PASSWORD"],
+            "db": config["MYSQL_DB"],
+            "port": config.get("MYSQL_PORT", 3306),
+            "charset": config.get("MYSQL_CHARSET", "utf8mb4"),
+            "connect_timeout": config.get("MYSQL_CONNECT_TIMEOUT", 10),
+            "minsize": config["MYSQL_ASYNC_POOL_MIN_SIZE"],
+            "maxsize": config["MYSQL_ASYNC_POOL_MAX_SIZE"],
+            "pool_recycle": config["MYSQL_POOL_MAX_AGE"],
+            "autocommit": True,
+        }
+        if config.get("MYSQL_UNIX_SOCKET"):
+            kwargs["unix_socket"] = config["MYSQL_UNIX_SOCKET"]
+        return await aiomysql.create_pool(**kwargs)
+    return create_pool
+
+
+class AsyncMySQL:
+    # Connection pool of the async serving mode (see asgi.py), separate from the sync PooledMySQL.
+    # start() opens it inside the ASGI server's event loop and close() drains it on shutdown.
+    # Waiting longer than MYSQL_POOL_TIMEOUT for a connection raises PoolTimeout, as in sync mode.
+    # metrics, if given, times every statement into sql_query_duration_seconds.
+    def __init__(self, config, create_pool=None, metrics=None):
+        config.setdefault("MYSQL_ASYNC_POOL_MIN_SIZE", 1)
+        config.setdefault("MYSQL_ASYNC_POOL_MAX_SIZE", 50)
+        config.setdefault("MYSQL_POOL_TIMEOUT", 5.0)
+        config.setdefault("MYSQL_POOL_MAX_AGE", 3600.0)
+        self.config = config
+        self.timeout = config["MYSQL_POOL_TIMEOUT"]
+        self.metrics = metrics
+        self._create_pool = create_pool or aiomysql_pool(config)
+        self.pool = None
+        self.timeouts = 0
+        self._starting = None
+
+    async def start(self):
+        # Concurrent first requests share one pool creation
+        if self.pool is None:
+            if self._starting is None:
+                self._starting = asyncio.ensure_future(self._create_pool())
+            try:
+                self.pool = await self._starting
+            finally:
+                self._starting = None
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    async def fetchall(self, query, args=None):
+        if self.pool is None:
+            await self.start()
+        try:
+            conn = await asyncio.wait_for(self.pool.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PoolTimeout(f"no connection available within {self.timeout}s")
+
+        try:
+            async with conn.cursor() as cursor:
+                started = time.perf_counter()
+                try:
+                    await cursor.execute(query, args)
+                    return await cursor.fetchall()
+                finally:
+                    if self.metrics is not None:
+                        seconds = time.perf_counter() - started
+                        self.metrics.queries.labels(*self.metrics.statement_label(query)).observe(seconds)
+        finally:
+            self.pool.release(conn)
+
+    def stats(self):
+        if self.pool is None:
+            return {"started": False, "timeouts": self.timeouts}
+        return {
+            "started": True,
+            "size": self.pool.size,
+            "idle": self.pool.freesize,
+            "max_size": self.pool.maxsize,
+            "timeouts": self.timeouts,
+        }
@@ -0,0 +1,95 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class CredentialCache:
+    # LRU of recently verified (username, password) pairs, so repeat Basic-auth and /login calls
+    # skip the password KDF. Keys are an HMAC of the pair under a per-process random key, so no
+    # plaintext or cheaply brute-forced digest of a password is kept. Each entry also records the
+    # stored password hash it was verified against: if the user's password changes, the entry misses.
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()  # digest -> (username, password_hash, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _digest(self, username, password):
+        message = f"{len(username)}:{username}{password}".encode()
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def check(self, username, password, password_hash):
+        digest = self._digest(username, password)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                if entry[0] == username and entry[1] == password_hash and entry[2] > time.monotonic():
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return True
+                del self._entries[digest]
+            self.misses += 1
+            return False
+
+    def add(self, username, password, password_hash):
+        digest = self._digest(username, password)
+        with self._lock:
+            self._entries[digest] = (username, password_hash, time.monotonic() + self.ttl)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class TokenCache:
+    # Claims of JWTs that already passed jwt.decode, kept until their own exp so a hot token costs
+    # one dict lookup. Only successfully decoded tokens get in, and an entry past its exp is dropped
+    # and the token re-decoded, so expired and tampered tokens fail exactly as they did before.
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._entries = {}  # token -> (claims, exp)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        entry = self._entries.get(token)
+        if entry is not None:
+            if entry[1] > time.time():
+                self.hits += 1
+                return entry[0]
+            with self._lock:
+                self._entries.pop(token, None)
+        self.misses += 1
+        return None
+
+    def add(self, token, claims):
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)):
+            return
+
+        with self._lock:
+            if len(self._entries) >= self.maxsize:
+                # Dicts keep insertion order, so this drops the oldest entry
+                self._entries.pop(next(iter(self._entries)), None)
+            self._entries[token] = (claims, exp)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,156 @@
+import bisect
+import datetime
+import json
+import re
+import threading
+
+# Only YYYY-MM-DD: since Python 3.11 date.fromisoformat also takes forms like 20240501 and 2024-W01-1,
+# which numpy's datetime64 and MySQL read differently or not at all
+ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# Change feed events read per query while catching up
+EVENT_BATCH_SIZE = 500
+
+
+def parse_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    if not isinstance(value, str) or not ISO_DATE.fullmatch(value):
+        raise ValueError(f"Not a YYYY-MM-DD date: {value!r}")
+    return datetime.date.fromisoformat(value)
+
+
+class RentalIndex:
+    # In-memory interval index over Rentals (date_from and date_to both inclusive), per vehicle.
+    # Each vehicle keeps its rentals sorted by date_from along with the longest rental it has had,
+    # so an overlap check only bisects to the rentals that start late enough to reach the range.
+    #
+    # Only rentals that end on or after the day of the load are kept (see covers()). After the load
+    # the index follows the shared change feed (store.EventLog): the ids of "rentals" events written
+    # since, by this worker or any other, are read back from MySQL and replaced in the index. A full
+    # reload only happens when the feed has been trimmed past the last event applied.
+    def __init__(self, log, load, load_ids, today=datetime.date.today):
+        self.log = log
+        self._load = load  # load(start): (rental_id, vehicle_id, date_from, date_to) ending on or after start
+        self._load_ids = load_ids  # load_ids(ids, start): the same, for just these rental ids
+        self._today = today
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._starts = {}  # vehicle_id -> sorted date_from list
+        self._rentals = {}  # vehicle_id -> [(date_from, date_to, rental_id)] in the same order
+        self._longest = {}  # vehicle_id -> longest rental as a timedelta
+        self._by_id = {}  # rental_id -> (vehicle_id, date_from)
+        self.start = None
+        self.seq = None
+        self.reloads = 0
+        self.updates = 0
+
+    def ensure_current(self):
+        with self._refresh_lock:
+            first, latest = self.log.bounds()
+            if latest == self.seq:
+                return
+            if self.seq is None or self.seq < first - 1 or self.seq > latest:
+                self._reload(latest)
+                return
+
+            seq, changed = self.seq, set()
+            while seq < latest:
+                events = self.log.since(seq, EVENT_BATCH_SIZE)
+                if not events:
+                    break
+                for _, topic, _, ids in events:
+                    if topic == "rentals":
+                        changed.update(json.loads(ids))
+                seq = events[-1][0]
+
+            # Events are appended after their commit, so MySQL already has these rows as written
+            rentals = list(self._load_ids(sorted(changed), self.start)) if changed else []
+            with self._lock:
+                for rental_id in changed:
+                    self._remove(rental_id)
+                for rental_id, vehicle_id, date_from, date_to in rentals:
+                    if vehicle_id is not None:
+                        self._put(rental_id, vehicle_id, parse_date(date_from), parse_date(date_to))
+                self.seq = seq
+                self.updates += 1
+
+    def _reload(self, latest):
+        # Read the feed position first: events appended during the load are applied again next time,
+        # which is harmless because applying one replaces the rentals with their rows as they are now
+        start = self._today()
+        rentals = self._load(start)
+        with self._lock:
+            self._starts, self._rentals, self._longest, self._by_id = {}, {}, {}, {}
+            for rental_id, vehicle_id, date_from, date_to in rentals:
+                if vehicle_id is not None:
+                    self._put(rental_id, vehicle_id, parse_date(date_from), parse_date(date_to))
+            self.start = start
+            self.seq = latest
+            self.reloads += 1
+
+    # Whether every rental that could overlap a range starting on date_from is in the index
+    def covers(self, date_from):
+        return self.start is not None and date_from >= self.start
+
+    # Lookups do not check the feed themselves: call ensure_current() once per request first
+    def overlapping(self, vehicle_id, date_from, date_to):
+        with self._lock:
+            starts = self._starts.get(vehicle_id)
+            if not starts:
+                return []
+
+            low = bisect.bisect_left(starts, date_from - self._longest[vehicle_id])
+            high = bisect.bisect_right(starts, date_to)
+            return [
+                rental_id
+                for start, end, rental_id in self._rentals[vehicle_id][low:high]
+                if end >= date_from
+            ]
+
+    def is_free(self, vehicle_id, date_from, date_to):
+        return not self.overlapping(vehicle_id, date_from, date_to)
+
+    def _put(self, rental_id, vehicle_id, date_from, date_to):
+        starts = self._starts.setdefault(vehicle_id, [])
+        position = bisect.bisect_right(starts, date_from)
+        starts.insert(position, date_from)
+        self._rentals.setdefault(vehicle_id, []).insert(position, (date_from, date_to, rental_id))
+        self._longest[vehicle_id] = max(self._longest.get(vehicle_id, datetime.timedelta(0)), date_to - date_from)
+        self._by_id[rental_id] = (vehicle_id, date_from)
+
+    def _remove(self, rental_id):
+        entry = self._by_id.pop(rental_id, None)
+        if entry is None:
+            return
+
+        vehicle_id, date_from = entry
+        starts = self._starts[vehicle_id]
+        rentals = self._rentals[vehicle_id]
+        position = bisect.bisect_left(starts, date_from)
+        while rentals[position][2] != rental_id:
+            position += 1
+        del starts[position]
+        del rentals[position]
+
+
+class FleetSnapshot:
+    # Vehicles joined with the locations they are parked at, reloaded only when the Vehicles or
+    # Locations version moves, so availability searches filter a list in memory instead of querying.
+    def __init__(self, versions, load):
+        self.versions = versions
+        self._load = load
+        self._lock = threading.Lock()
+        self._rows = []
+        self.version = None
+
+    def rows(self):
+        version = (self.versions.get("Vehicles"), self.versions.get("Locations"))
+        if version != self.version:
+            rows = list(self._load())
+            with self._lock:
+                self._rows = rows
+                self.version = version
+        return self._rows
@@ -0,0 +1,74 @@
+import re
+
+# "$<operation index>.<field>[.<field>...]": a value from the response of an earlier operation,
+# e.g. "$0.customer_id" or "$1.ids.0" for the first id a bulk create returned
+REFERENCE = re.compile(r"\$(\d+)((?:\.[A-Za-z0-9_]+)+)")
+
+SAVEPOINT = "batch_operation"
+
+
+class BatchConnection:
+    # Stands in for the request's connection while POST /batch runs its operations through the
+    # ordinary handlers: their commit() is held back for the batch's single commit, and their
+    # rollback() only undoes the operation in progress, back to the savepoint taken before it.
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def savepoint(self):
+        self._conn.cursor().execute(f"SAVEPOINT {SAVEPOINT}")
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self._conn.cursor().execute(f"ROLLBACK TO SAVEPOINT {SAVEPOINT}")
+
+
+class UnresolvedReference(Exception):
+    pass
+
+
+def lookup(match, results):
+    index = int(match.group(1))
+    if index >= len(results):
+        raise UnresolvedReference(f"{match.group(0)} refers to an operation that has not run yet")
+    status, value = results[index]["status"], results[index]["body"]
+    if status >= 400:
+        raise UnresolvedReference(f"{match.group(0)} refers to a failed operation")
+
+    for field in match.group(2)[1:].split("."):
+        if isinstance(value, dict) and field in value:
+            value = value[field]
+        elif isinstance(value, list) and field.isdigit() and int(field) < len(value):
+            value = value[int(field)]
+        else:
+            raise UnresolvedReference(f"{match.group(0)} is not in the response of operation {index}")
+    return value
+
+
+def substitute(value, results):
+    # Strings that are exactly one reference take the referenced value, type and all
+    if isinstance(value, str):
+        match = REFERENCE.fullmatch(value)
+        return lookup(match, results) if match else value
+    if isinstance(value, list):
+        return [substitute(item, results) for item in value]
+    if isinstance(value, dict):
+        return {key: substitute(item, results) for key, item in value.items()}
+    return value
+
+
+def resolve_references(path, body, results):
+    # Returns (path, body, None) with every reference replaced, or (None, None, error).
+    # In the path, each whole segment before the query string may be a reference.
+    try:
+        path, _, query = path.partition("?")
+        path = "/".join(str(substitute(segment, results)) for segment in path.split("/"))
+        if query:
+            path = f"{path}?{query}"
+        return path, substitute(body, results), None
+    except UnresolvedReference as e:
+        return None, None, str(e)
@@ -0,0 +1,74 @@
+# Rows per second of the old list-endpoint path (per-row dict comprehension + flask.jsonify)
+# against serialize.RowEncoder, on rows shaped like MySQLdb returns them for Rentals.
+#
+#   python benchmarks/bench_serialize.py [rows] [repeats]
+import datetime
+import decimal
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from flask import Flask, jsonify
+import serialize
+from serialize import RowEncoder, stream_page
+
+COLUMNS = ("rental_id", "customer_id", "vehicle_id", "date_from", "date_to", "total_cost")
+
+
+def make_rows(count):
+    start = datetime.date(2024, 1, 1)
+    return [
+        (
+            n,
+            n % 500 + 1,
+            n % 80 + 1,
+            start + datetime.timedelta(days=n % 365),
+            start + datetime.timedelta(days=n % 365 + 3),
+            decimal.Decimal(f"{100 + n % 900}.50"),
+        )
+        for n in range(1, count + 1)
+    ]
+
+
+def before(app, rows):
+    with app.app_context():
+        rentals_list = [
+            {
+                "rental_id": rental[0],
+                "customer_id": rental[1],
+                "vehicle_id": rental[2],
+                "date_from": rental[3],
+                "date_to": rental[4],
+                "total_cost": rental[5]
+            }
+            for rental in rows
+        ]
+        return jsonify({"rentals": rentals_list, "next": None}).get_data()
+
+
+def after(app, rows):
+    return b"".join(stream_page("rentals", RowEncoder(COLUMNS), rows, None))
+
+
+def measure(name, encode, app, rows, repeats):
+    best = min(timed(encode, app, rows) for _ in range(repeats))
+    print(f"{name:<40} {len(rows) / best:>12,.0f} rows/s")
+
+
+def timed(encode, app, rows):
+    started = time.perf_counter()
+    encode(app, rows)
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    app = Flask(__name__)
+    rows = make_rows(count)
+
+    print(f"{count} rows, best of {repeats}, orjson {'installed' if serialize.orjson else 'not installed'}")
+    measure("before: dict comprehension + jsonify", before, app, rows, repeats)
+    measure("after: RowEncoder + stream_page", after, app, rows, repeats)
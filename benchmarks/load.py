@@ -0,0 +1,370 @@
+# Load benchmark for the endpoints in app.py against a seeded local MySQL database.
+# Each scenario sends --requests requests from --concurrency threads and reports throughput and
+# p50/p95/p99 latency as JSON, so runs can be diffed and compared against a saved baseline.
+#
+#   python benchmarks/load.py --rows 10000 --concurrency 8 --requests 2000 --output before.json
+#   python benchmarks/load.py --rows 10000 --concurrency 8 --requests 2000 --baseline before.json
+#
+# The database named by --db is dropped and recreated from benchmarks/schema.sql and migrations/,
+# so point it at a throwaway schema. By default the app runs in-process behind Flask's test client;
+# with --url the requests go over HTTP to a running server that must use the same database.
+import argparse
+import datetime
+import glob
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT)
+
+VEHICLE_TYPES = ("Car", "Van", "Truck", "Motorbike")
+USERNAME = f"bench_staff_{os.getpid()}"
+ADMIN_USERNAME = f"bench_admin_{os.getpid()}"
+PASSWORD = "bench-password"
+
+# Seeded rentals start here; rentals created by the benchmark start at CREATE_FROM, clear of them
+SEED_FROM = datetime.date(2020, 1, 1)
+CREATE_FROM = datetime.date(2040, 1, 1)
+SEED_CHUNK_SIZE = 1000
+CASCADE_RENTALS = 5
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load benchmark for the vehicle rental API")
+    parser.add_argument("--rows", type=int, default=10000, help="customers and rentals to seed (vehicles: rows / 10)")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset to run")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for data and request parameters")
+    parser.add_argument("--url", help="benchmark a running server instead of the app in-process")
+    parser.add_argument("--pool-size", type=int, help="override MYSQL_POOL_MAX_SIZE (in-process only)")
+    parser.add_argument("--host", default=os.environ.get("MYSQL_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("MYSQL_PORT", 3306)))
+    parser.add_argument("--user", default=os.environ.get("MYSQL_USER", "root"))
+    parser.add_argument("--password", default=os.environ.get("MYSQL_PASSWORD", "root"))
+    parser.add_argument("--db", default="vehicle_rental_bench")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", help="JSON report of an earlier run; exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed throughput drop / p95 rise (0.2 = 20%%)")
+    return parser.parse_args()
+
+
+# SEEDING
+def run_sql_file(cursor, path):
+    # Statements end at a line ending with the delimiter, which DELIMITER lines change as in the mysql
+    # client, so trigger bodies with ; inside them go through as one statement
+    delimiter = ";"
+    statement = []
+    with open(path) as file:
+        for line in file:
+            stripped = line.strip()
+            if stripped.startswith("--"):
+                continue
+            if stripped.upper().startswith("DELIMITER "):
+                delimiter = stripped.split()[1]
+                continue
+            statement.append(line)
+            if stripped.endswith(delimiter):
+                sql = "".join(statement).rstrip()[:-len(delimiter)]
+                if sql.strip():
+                    cursor.execute(sql)
+                statement = []
+    if "".join(statement).strip():
+        cursor.execute("".join(statement))
+
+
+def insert_rows(cursor, query, rows):
+    rows = list(rows)
+    for start in range(0, len(rows), SEED_CHUNK_SIZE):
+        cursor.executemany(query, rows[start:start + SEED_CHUNK_SIZE])
+
+
+def seed(args):
+    import MySQLdb
+    from aggregates import rebuild_summaries
+
+    if args.db == "vehicle_rental_db":
+        sys.exit("Refusing to drop vehicle_rental_db; pass a throwaway --db")
+
+    conn = MySQLdb.connect(host=args.host, port=args.port, user=args.user, passwd=args.password, charset="utf8mb4")
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{args.db}`")
+    cursor.execute(f"CREATE DATABASE `{args.db}`")
+    cursor.execute(f"USE `{args.db}`")
+    run_sql_file(cursor, os.path.join(ROOT, "benchmarks", "schema.sql"))
+    for path in sorted(glob.glob(os.path.join(ROOT, "migrations", "*.sql"))):
+        run_sql_file(cursor, path)
+
+    rng = random.Random(args.seed)
+    rows = args.rows
+    # Customers past `rows` and vehicles past `vehicles` exist only to be deleted by
+    # delete_customer_cascade and delete_vehicle_cascade, one per request
+    customers = rows + args.requests
+    vehicles = max(1, rows // 10)
+    all_vehicles = vehicles + args.requests
+
+    insert_rows(cursor, "INSERT INTO Customers (customer_name, customer_contact) VALUES (%s, %s)", (
+        (f"Customer {n}", f"07{n:08d}") for n in range(1, customers + 1)
+    ))
+    insert_rows(cursor, "INSERT INTO Vehicles (reg_number, model_name, daily_hire_rate, vehicle_type) VALUES (%s, %s, %s, %s)", (
+        (f"REG{n:06d}", f"Model {n % 50}", 20 + n % 80, VEHICLE_TYPES[n % len(VEHICLE_TYPES)]) for n in range(1, all_vehicles + 1)
+    ))
+    insert_rows(cursor, "INSERT INTO Locations (location_name, vehicle_id, is_available) VALUES (%s, %s, %s)", (
+        (f"Location {n % 20}", n, n % 5 != 0) for n in range(1, all_vehicles + 1)
+    ))
+    # Rental k goes to vehicle k % vehicles in its own 5-day slot, so seeded rentals never overlap
+    rentals = []
+    for k in range(rows):
+        date_from = SEED_FROM + datetime.timedelta(days=(k // vehicles) * 5)
+        date_to = date_from + datetime.timedelta(days=rng.randint(0, 3))
+        rentals.append((rng.randint(1, customers), k % vehicles + 1, date_from, date_to, rng.randint(50, 900)))
+    # Each vehicle to be deleted gets CASCADE_RENTALS rentals for the cascade to detach
+    for vehicle_id in range(vehicles + 1, all_vehicles + 1):
+        for k in range(CASCADE_RENTALS):
+            date_from = SEED_FROM + datetime.timedelta(days=k * 5)
+            rentals.append((rng.randint(1, customers), vehicle_id, date_from, date_from + datetime.timedelta(days=2), rng.randint(50, 900)))
+    insert_rows(cursor, "INSERT INTO Rentals (customer_id, vehicle_id, date_from, date_to, total_cost) VALUES (%s, %s, %s, %s, %s)", rentals)
+
+    cursor.execute("SELECT vehicle_id, date_from, date_to, total_cost FROM Rentals")
+    totals = cursor.fetchall()
+    rebuild_summaries(cursor, lambda: totals)
+    conn.commit()
+    conn.close()
+    return {"customers": customers, "vehicles": vehicles, "rentals": rows, "cascade_vehicles": args.requests}
+
+
+# SCENARIOS
+# Each builds request n of its run as (method, path, json body, role whose token it needs or None)
+def random_range(rng):
+    date_from = SEED_FROM + datetime.timedelta(days=rng.randint(0, 50))
+    return date_from.isoformat(), (date_from + datetime.timedelta(days=rng.randint(0, 6))).isoformat()
+
+
+def build_scenarios(counts):
+    rows, vehicles = counts["rentals"], counts["vehicles"]
+
+    def list_vehicles(n, rng):
+        return "GET", f"/vehicles?limit=100&after={rng.randint(0, vehicles)}", None, None
+
+    def list_customers(n, rng):
+        return "GET", f"/customers?limit=100&after={rng.randint(0, rows)}", None, "staff"
+
+    def list_rentals_filtered(n, rng):
+        return "GET", f"/rentals?customer_id={rng.randint(1, rows)}&fields=rental_id,date_from,total_cost", None, "staff"
+
+    def available_vehicles(n, rng):
+        date_from, date_to = random_range(rng)
+        return "GET", f"/vehicles/available?from={date_from}&to={date_to}&type=Car", None, None
+
+    def quotes(n, rng):
+        items = []
+        for _ in range(50):
+            date_from, date_to = random_range(rng)
+            items.append({"vehicle_id": rng.randint(1, vehicles), "date_from": date_from, "date_to": date_to})
+        return "POST", "/quotes", items, None
+
+    def create_customer(n, rng):
+        return "POST", "/customers", {"customer_name": f"Bench {n}", "customer_contact": f"08{n:08d}"}, "staff"
+
+    def create_rental(n, rng):
+        date_from = CREATE_FROM + datetime.timedelta(days=(n // vehicles) * 3)
+        return "POST", "/rentals", {
+            "customer_id": rng.randint(1, rows),
+            "vehicle_id": n % vehicles + 1,
+            "date_from": date_from.isoformat(),
+            "date_to": (date_from + datetime.timedelta(days=1)).isoformat()
+        }, "staff"
+
+    def update_customer(n, rng):
+        return "PUT", f"/customers/{rng.randint(1, rows)}", {"customer_name": f"Renamed {n}", "customer_contact": f"09{n:08d}"}, "staff"
+
+    def delete_customer_cascade(n, rng):
+        return "DELETE", f"/customers/{rows + n + 1}", None, "staff"
+
+    # Detaches the vehicle's location and rentals, drops its per-vehicle totals, then deletes it
+    def delete_vehicle_cascade(n, rng):
+        return "DELETE", f"/vehicles/{vehicles + n + 1}", None, "admin"
+
+    def login(n, rng):
+        return "POST", "/login", {"username": USERNAME, "password": PASSWORD}, None
+
+    return {
+        "list_vehicles": list_vehicles,
+        "list_customers": list_customers,
+        "list_rentals_filtered": list_rentals_filtered,
+        "available_vehicles": available_vehicles,
+        "quotes": quotes,
+        "create_customer": create_customer,
+        "create_rental": create_rental,
+        "update_customer": update_customer,
+        "delete_customer_cascade": delete_customer_cascade,
+        "delete_vehicle_cascade": delete_vehicle_cascade,
+        "login": login,
+    }
+
+
+SCENARIOS = (
+    "list_vehicles", "list_customers", "list_rentals_filtered", "available_vehicles", "quotes",
+    "create_customer", "create_rental", "update_customer", "delete_customer_cascade", "delete_vehicle_cascade", "login",
+)
+
+
+# TRANSPORTS
+# send(method, path, body, headers) -> (status, response body)
+def in_process_sender(args):
+    # The app keeps users and table versions in ./state.db: give each run a fresh one
+    os.chdir(tempfile.mkdtemp(prefix="vehicle-rental-bench-"))
+    import app as app_module
+
+    app = app_module.app
+    app.config.update(
+        MYSQL_HOST=args.host, MYSQL_PORT=args.port, MYSQL_USER=args.user, MYSQL_PASSWORD=args.password, MYSQL_DB=args.db
+    )
+    if args.pool_size:
+        app_module.mysql.pool.max_size = args.pool_size
+
+    local = threading.local()
+
+    def send(method, path, body, headers):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        response = client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_data()
+    return send
+
+
+def http_sender(base_url):
+    def send(method, path, body, headers):
+        request = urllib.request.Request(
+            base_url.rstrip("/") + path,
+            data=json.dumps(body).encode() if body is not None else None,
+            method=method,
+            headers={"Content-Type": "application/json", **headers},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+    return send
+
+
+def login_tokens(send):
+    # {role: token}; routes check for one exact role, so admin-only routes need their own user
+    tokens = {}
+    for username, role in ((USERNAME, "staff"), (ADMIN_USERNAME, "admin")):
+        send("POST", "/register", {"username": username, "password": PASSWORD, "role": role}, {})
+        status, body = send("POST", "/login", {"username": username, "password": PASSWORD}, {})
+        if status != 200:
+            sys.exit(f"Could not log in as {username}: {status} {body[:200]!r}")
+        tokens[role] = json.loads(body)["token"]
+    return tokens
+
+
+# RUNNER
+def percentile(ordered, p):
+    # Nearest-rank percentile of sorted latencies, in milliseconds
+    index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return round(ordered[index] * 1000, 3)
+
+
+def run_scenario(build, send, tokens, args):
+    latencies = [0.0] * args.requests
+    statuses = [0] * args.requests
+    counter = itertools.count()
+
+    def worker(worker_id):
+        rng = random.Random(args.seed * 1000 + worker_id)
+        while True:
+            n = next(counter)
+            if n >= args.requests:
+                return
+            method, path, body, role = build(n, rng)
+            started = time.perf_counter()
+            statuses[n], _ = send(method, path, body, {"Authorization": tokens[role]} if role else {})
+            latencies[n] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(worker, range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        "requests": args.requests,
+        "errors": sum(1 for status in statuses if status >= 400),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 1),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": percentile(ordered, 50),
+        "p95_ms": percentile(ordered, 95),
+        "p99_ms": percentile(ordered, 99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def regressions(report, baseline, tolerance):
+    found = []
+    for name, current in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        if current["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            found.append(f"{name}: throughput {before['throughput_rps']} -> {current['throughput_rps']} req/s")
+        if current["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            found.append(f"{name}: p95 {before['p95_ms']} -> {current['p95_ms']} ms")
+    return found
+
+
+def main():
+    args = parse_args()
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenario: {unknown[0]} (choose from {', '.join(SCENARIOS)})")
+
+    counts = seed(args)
+    send = http_sender(args.url) if args.url else in_process_sender(args)
+    tokens = login_tokens(send)
+    scenarios = build_scenarios(counts)
+
+    report = {
+        "config": {
+            "rows": args.rows, "requests": args.requests, "concurrency": args.concurrency,
+            "seed": args.seed, "target": args.url or "in-process", "pool_size": args.pool_size,
+        },
+        "seeded": counts,
+        "scenarios": {},
+    }
+    for name in names:
+        print(f"running {name}...", file=sys.stderr)
+        report["scenarios"][name] = run_scenario(scenarios[name], send, tokens, args)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            found = regressions(report, json.load(file), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+-- Stand-in for the vehicle_rental_db tables, used only to seed the throwaway benchmark database.
+-- benchmarks/load.py applies this file and then every file in migrations/.
+CREATE TABLE Customers (
+    customer_id INT AUTO_INCREMENT PRIMARY KEY,
+    customer_name VARCHAR(100) NOT NULL,
+    customer_contact VARCHAR(100) NOT NULL
+);
+
+CREATE TABLE Vehicles (
+    vehicle_id INT AUTO_INCREMENT PRIMARY KEY,
+    reg_number VARCHAR(20) NOT NULL,
+    model_name VARCHAR(100) NOT NULL,
+    daily_hire_rate DECIMAL(10, 2) NOT NULL,
+    vehicle_type VARCHAR(50) NOT NULL
+);
+
+CREATE TABLE Locations (
+    location_id INT AUTO_INCREMENT PRIMARY KEY,
+    location_name VARCHAR(100) NOT NULL,
+    vehicle_id INT NULL,
+    is_available BOOLEAN NOT NULL DEFAULT TRUE,
+    FOREIGN KEY (vehicle_id) REFERENCES Vehicles (vehicle_id)
+);
+
+CREATE TABLE Rentals (
+    rental_id INT AUTO_INCREMENT PRIMARY KEY,
+    customer_id INT NULL,
+    vehicle_id INT NULL,
+    date_from DATE NOT NULL,
+    date_to DATE NOT NULL,
+    total_cost DECIMAL(10, 2) NOT NULL,
+    FOREIGN KEY (customer_id) REFERENCES Customers (customer_id),
+    FOREIGN KEY (vehicle_id) REFERENCES Vehicles (vehicle_id)
+);
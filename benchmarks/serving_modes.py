@@ -0,0 +1,155 @@
+# Sync (gunicorn, threads) against async (uvicorn + asgi.py) serving of the same app at high
+# concurrency. The database is seeded once with benchmarks/load.py, then each mode is started as
+# a server on it in turn and driven over HTTP with load.py's scenarios; the JSON report has both
+# runs side by side and the async/sync throughput ratio per scenario.
+#
+#   python benchmarks/serving_modes.py --rows 10000 --concurrency 256 --requests 5000
+#
+# Needs gunicorn and uvicorn on PATH. Only read scenarios are run by default so that both modes
+# see the same data; --db is dropped and rebuilt as in load.py.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load import ROOT, SCENARIOS, seed, http_sender, login_tokens, build_scenarios, run_scenario
+
+# Imported by both servers: points the app at the benchmark database before any request. The sync
+# pool is built when app is imported, so its size is set on the pool itself (as load.py --pool-size
+# does); asgi builds the async pool from the config after the update.
+SERVER_MODULE = """\
+import json
+import os
+from app import app, mysql
+app.config.update(json.loads(os.environ["BENCH_APP_CONFIG"]))
+mysql.pool.max_size = app.config["MYSQL_POOL_MAX_SIZE"]
+from asgi import application
+"""
+
+# What the ratio does not measure, copied into the report
+LIMITS = [
+    "Only GET /customers and GET /rentals are native coroutines in async mode; every other route "
+    "runs on the ASGI_FALLBACK_WORKERS thread pool, as in sync mode.",
+    "authenticate() and has_role() are blocking calls on the event loop in async mode: a JWT decode "
+    "on a token cache miss, and a SQLite (state.db) read of the user's role for GET /rentals.",
+]
+
+READ_SCENARIOS = ("list_customers", "list_rentals_filtered", "list_vehicles", "available_vehicles")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sync vs async serving benchmark for the vehicle rental API")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=5000, help="requests per scenario and mode")
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--scenarios", default=",".join(READ_SCENARIOS))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1, help="server processes per mode")
+    parser.add_argument("--threads", type=int, default=32, help="gunicorn threads per worker (sync mode)")
+    parser.add_argument("--async-pool-size", type=int, default=50, help="MYSQL_ASYNC_POOL_MAX_SIZE (async mode)")
+    parser.add_argument("--server-port", type=int, default=8765, help="port the servers listen on")
+    parser.add_argument("--host", default=os.environ.get("MYSQL_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("MYSQL_PORT", 3306)))
+    parser.add_argument("--user", default=os.environ.get("MYSQL_USER", "root"))
+    parser.add_argument("--password", default=os.environ.get("MYSQL_PASSWORD", "root"))
+    parser.add_argument("--db", default="vehicle_rental_bench")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    return parser.parse_args()
+
+
+def server_commands(args):
+    bind = f"127.0.0.1:{args.server_port}"
+    return {
+        "sync": ["gunicorn", "--workers", str(args.workers), "--threads", str(args.threads),
+                 "--bind", bind, "serving_app:app"],
+        "async": ["uvicorn", "serving_app:application", "--workers", str(args.workers),
+                  "--host", "127.0.0.1", "--port", str(args.server_port), "--no-access-log", "--log-level", "warning"],
+    }
+
+
+def start_server(command, config):
+    # Each server gets its own working directory, so users and table versions (state.db) start empty
+    workdir = tempfile.mkdtemp(prefix="vehicle-rental-serving-")
+    with open(os.path.join(workdir, "serving_app.py"), "w") as file:
+        file.write(SERVER_MODULE)
+    env = dict(os.environ, BENCH_APP_CONFIG=json.dumps(config))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [workdir, ROOT, env.get("PYTHONPATH")]))
+    return subprocess.Popen(command, cwd=workdir, env=env)
+
+
+def wait_ready(base_url, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"Server exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(base_url + "/", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    sys.exit(f"Server did not answer on {base_url} within {timeout}s")
+
+
+def main():
+    args = parse_args()
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenario: {unknown[0]} (choose from {', '.join(SCENARIOS)})")
+
+    counts = seed(args)
+    scenarios = build_scenarios(counts)
+
+    config = {
+        "MYSQL_HOST": args.host, "MYSQL_PORT": args.port, "MYSQL_USER": args.user,
+        "MYSQL_PASSWORD": args.password, "MYSQL_DB": args.db,
+        # One connection per gunicorn thread, so sync mode does not queue on its own pool
+        "MYSQL_POOL_MAX_SIZE": args.threads,
+        "MYSQL_ASYNC_POOL_MAX_SIZE": args.async_pool_size,
+    }
+    base_url = f"http://127.0.0.1:{args.server_port}"
+    report = {
+        "config": {
+            "rows": args.rows, "requests": args.requests, "concurrency": args.concurrency, "seed": args.seed,
+            "workers": args.workers, "threads": args.threads, "async_pool_size": args.async_pool_size,
+        },
+        "seeded": counts,
+        "limits": LIMITS,
+        "modes": {},
+    }
+
+    for mode, command in server_commands(args).items():
+        process = start_server(command, config)
+        try:
+            wait_ready(base_url, process)
+            send = http_sender(base_url)
+            tokens = login_tokens(send)
+            report["modes"][mode] = {}
+            for name in names:
+                print(f"{mode}: running {name}...", file=sys.stderr)
+                report["modes"][mode][name] = run_scenario(scenarios[name], send, tokens, args)
+        finally:
+            process.terminate()
+            process.wait()
+
+    report["async_over_sync"] = {
+        name: round(report["modes"]["async"][name]["throughput_rps"] / report["modes"]["sync"][name]["throughput_rps"], 2)
+        for name in names
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import zlib
+from flask import request
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:  # optional: without it "br" is never negotiated
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional: without it "zstd" is never negotiated
+    zstandard = None
+
+# Only these bodies are worth compressing; images and other binary payloads are left alone
+COMPRESSIBLE = {"application/json", "application/x-ndjson", "text/csv", "text/html", "text/plain"}
+
+
+class BrotliStream:
+    # Gives brotli's streaming compressor the compress()/flush() interface of zlib's
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+class Compressor:
+    # Negotiated Content-Encoding for response bodies of COMPRESSIBLE types and at least
+    # COMPRESSION_MIN_SIZE bytes. The client's Accept-Encoding q-values pick the encoding; ties go to
+    # the first of COMPRESSION_ENCODINGS whose library is installed. Streamed bodies are compressed
+    # chunk by chunk as they are sent, after buffering just enough of them to know they are large enough.
+    def __init__(self, app=None):
+        self.min_size = 1024
+        self.encodings = ()
+        self.levels = {}
+        self.compressed = 0
+        self.streamed = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        config.setdefault("COMPRESSION_MIN_SIZE", 1024)
+        config.setdefault("COMPRESSION_ENCODINGS", ("zstd", "br", "gzip"))
+        config.setdefault("COMPRESSION_GZIP_LEVEL", 6)
+        config.setdefault("COMPRESSION_BR_LEVEL", 5)
+        config.setdefault("COMPRESSION_ZSTD_LEVEL", 3)
+
+        self.min_size = config["COMPRESSION_MIN_SIZE"]
+        self.levels = {
+            "gzip": config["COMPRESSION_GZIP_LEVEL"],
+            "br": config["COMPRESSION_BR_LEVEL"],
+            "zstd": config["COMPRESSION_ZSTD_LEVEL"],
+        }
+        available = {"gzip": True, "br": brotli is not None, "zstd": zstandard is not None}
+        self.encodings = tuple(encoding for encoding in config["COMPRESSION_ENCODINGS"] if available.get(encoding))
+        app.after_request(self.compress_response)
+
+    def choose(self, accept_encoding):
+        # Best encoding the client accepts, or None for identity
+        if not accept_encoding or not self.encodings:
+            return None
+        accepted = parse_accept_header(accept_encoding)
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            quality = accepted.quality(encoding)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compressible(self, mimetype):
+        return mimetype in COMPRESSIBLE
+
+    def stream(self, encoding):
+        level = self.levels[encoding]
+        if encoding == "gzip":
+            return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        if encoding == "br":
+            return BrotliStream(level)
+        return zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, encoding, data):
+        stream = self.stream(encoding)
+        self.compressed += 1
+        return stream.compress(data) + stream.flush()
+
+    def encode_stream(self, encoding, chunks, close=None):
+        # Returns (chunks, encoding applied). Chunks are buffered until min_size bytes have been seen:
+        # a body that ends before that is returned whole and uncompressed, a longer one is compressed
+        # as it is iterated. close, if given, is called once the source has been consumed or abandoned.
+        iterator = iter(chunks)
+        head, size = [], 0
+        for chunk in iterator:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            head.append(chunk)
+            size += len(chunk)
+            if size >= self.min_size:
+                self.streamed += 1
+                return self._compressed_chunks(encoding, head, iterator, close), encoding
+        if close is not None:
+            close()
+        return [b"".join(head)], None
+
+    def _compressed_chunks(self, encoding, head, rest, close):
+        stream = self.stream(encoding)
+        try:
+            data = stream.compress(b"".join(head))
+            if data:
+                yield data
+            for chunk in rest:
+                data = stream.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+                if data:
+                    yield data
+            yield stream.flush()
+        finally:
+            if close is not None:
+                close()
+
+    def compress_response(self, response):
+        if not self.compressible(response.mimetype):
+            return response
+        response.vary.add("Accept-Encoding")
+        if response.status_code != 200 or response.direct_passthrough or "Content-Encoding" in response.headers:
+            return response
+
+        encoding = self.choose(request.headers.get("Accept-Encoding"))
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            chunks, encoding = self.encode_stream(encoding, response.response, getattr(response.response, "close", None))
+            if encoding is None:
+                response.set_data(chunks[0])
+                return response
+            response.response = chunks
+            response.headers.pop("Content-Length", None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_size:
+                return response
+            response.set_data(self.compress(encoding, body))
+
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak)
+        return response
+
+    def stats(self):
+        return {"encodings": list(self.encodings), "compressed": self.compressed, "streamed": self.streamed}
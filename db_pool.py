@@ -0,0 +1,412 @@
+import itertools
+import threading
+import time
+from collections import deque
+from flask import g
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def default_ping(conn):
+    # MySQLdb connections have ping(); anything else (e.g. sqlite3) gets a trivial query
+    if hasattr(conn, "ping"):
+        conn.ping()
+    else:
+        conn.cursor().execute("SELECT 1")
+
+
+class ConnectionPool:
+    # Bounded pool of DB-API connections.
+    # - warm() opens min_size connections up front
+    # - at most max_size connections exist; acquire() waits up to timeout seconds for one to free up
+    # - a connection idle for longer than check_interval is pinged before it is handed out
+    # - a connection is closed after max_uses checkouts or max_age seconds
+    def __init__(self, connect, min_size=1, max_size=10, timeout=5.0, max_uses=1000, max_age=3600.0,
+                 check_interval=1.0, ping=default_ping):
+        if min_size > max_size:
+            raise ValueError("min_size cannot be larger than max_size")
+
+        self._connect = connect
+        self._ping = ping
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.check_interval = check_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._meta = {}  # id(conn) -> [created_at, uses, last_released_at]
+        self._size = 0
+        self._waiting = 0
+
+        self.created = 0
+        self.recycled = 0
+        self.failed_checks = 0
+        self.timeouts = 0
+
+    def warm(self):
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            conn = self._open_reserved(uses=0)
+            with self._cond:
+                self._idle.append(conn)
+                self._cond.notify()
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = self._checkout(deadline)
+            if conn is None:
+                return self._open_reserved()
+
+            meta = self._meta[id(conn)]
+            if self._expired(meta):
+                self._discard(conn, recycled=True)
+                continue
+            if time.monotonic() - meta[2] > self.check_interval and not self._alive(conn):
+                self.failed_checks += 1
+                self._discard(conn)
+                continue
+
+            meta[1] += 1
+            return conn
+
+    def release(self, conn, discard=False):
+        meta = self._meta.get(id(conn))
+        if meta is None:
+            return
+
+        if not discard:
+            try:
+                # Never hand the next borrower someone else's open transaction
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        if discard or self._expired(meta):
+            self._discard(conn, recycled=not discard)
+            return
+
+        meta[2] = time.monotonic()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "size": self._size,
+                "active": self._size - idle,
+                "idle": idle,
+                "waiting": self._waiting,
+                "max_size": self.max_size,
+                "created": self.created,
+                "recycled": self.recycled,
+                "failed_checks": self.failed_checks,
+                "timeouts": self.timeouts,
+            }
+
+    # Returns an idle connection, or None once a slot has been reserved for a new one
+    def _checkout(self, deadline):
+        with self._cond:
+            while True:
+                if self._idle:
+                    # LIFO: the most recently used connection is the least likely to have gone stale
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+    def _open_reserved(self, uses=1):
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        now = time.monotonic()
+        self._meta[id(conn)] = [now, uses, now]
+        self.created += 1
+        return conn
+
+    def _discard(self, conn, recycled=False):
+        self._meta.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+        with self._cond:
+            self._size -= 1
+            if recycled:
+                self.recycled += 1
+            self._cond.notify()
+
+    def _expired(self, meta):
+        created_at, uses, _ = meta
+        return uses >= self.max_uses or time.monotonic() - created_at >= self.max_age
+
+    def _alive(self, conn):
+        try:
+            self._ping(conn)
+            return True
+        except Exception:
+            return False
+
+
+def mysql_connector(config):
+    def connect():
+        # Imported here so the pool can be exercised against sqlite3 without mysqlclient installed
+        import MySQLdb
+
+        kwargs = {
+            "host": config["MYSQL_HOST"],
+            "user": config["MYSQL_USER"],
+            "passwd": config["MYSQL_PASSWORD"],
+            "db": config["MYSQL_DB"],
+            "port": config.get("MYSQL_PORT", 3306),
+            "charset": config.get("MYSQL_CHARSET", "utf8mb4"),
+            "connect_timeout": config.get("MYSQL_CONNECT_TIMEOUT", 10),
+        }
+        if config.get("MYSQL_UNIX_SOCKET"):
+            kwargs["unix_socket"] = config["MYSQL_UNIX_SOCKET"]
+        return MySQLdb.connect(**kwargs)
+    return connect
+
+
+# Replica settings in MYSQL_REPLICAS entries; anything not given is taken from the primary's
+REPLICA_KEYS = {
+    "host": "MYSQL_HOST",
+    "port": "MYSQL_PORT",
+    "user": "MYSQL_USER",
+    "password": "MYSQL_PASSWORD",
+    "unix_socket": "MYSQL_UNIX_SOCKET",
+}
+
+
+def replica_lag(conn):
+    # Seconds the server is behind its source: 0 when it is not replicating at all (nothing to lag
+    # behind), None when replication is configured but stopped
+    cursor = conn.cursor()
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except Exception:
+            cursor.execute("SHOW SLAVE STATUS")  # MySQL before 8.0.22
+        row = cursor.fetchone()
+        if row is None:
+            return 0
+        status = dict(zip([column[0] for column in cursor.description], row))
+        return status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+    finally:
+        cursor.close()
+
+
+class Replica:
+    # One read replica: its own pool and the outcome of its last health check
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.healthy = True
+        self.lag = None
+        self.checked_at = None
+        self.failures = 0
+        self.checking = threading.Lock()
+
+
+class ReplicaSet:
+    # Picks the replica that serves a read, by fewest connections in use ("least_loaded") or in turn
+    # ("round_robin"), among those that passed their last health check. A replica is checked again
+    # every check_interval seconds: it must answer and be at most max_lag seconds behind. Only one
+    # thread runs a due check; the others go on the previous result. choose() returns None when no
+    # replica is healthy, and the caller falls back to the primary.
+    def __init__(self, replicas=(), balance="least_loaded", check_interval=5.0, max_lag=None, lag=replica_lag):
+        if balance not in ("least_loaded", "round_robin"):
+            raise ValueError("balance must be least_loaded or round_robin")
+
+        self.replicas = list(replicas)
+        self.balance = balance
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self._lag = lag
+        self._turn = itertools.count()
+
+    def choose(self):
+        now = time.monotonic()
+        candidates = [replica for replica in self.replicas if self._healthy(replica, now)]
+        if not candidates:
+            return None
+        if self.balance == "round_robin":
+            return candidates[next(self._turn) % len(candidates)]
+        return min(candidates, key=lambda replica: replica.pool.stats()["active"])
+
+    def _healthy(self, replica, now):
+        if replica.checked_at is None or now - replica.checked_at >= self.check_interval:
+            if replica.checking.acquire(blocking=False):
+                try:
+                    self.check(replica)
+                finally:
+                    replica.checking.release()
+        return replica.healthy
+
+    def check(self, replica):
+        replica.checked_at = time.monotonic()
+        try:
+            conn = replica.pool.acquire()
+            try:
+                lag = self._lag(conn)
+            finally:
+                replica.pool.release(conn)
+        except Exception:
+            lag = None
+
+        replica.lag = lag
+        replica.healthy = lag is not None and (self.max_lag is None or lag <= self.max_lag)
+        if not replica.healthy:
+            replica.failures += 1
+        return replica.healthy
+
+    def mark_down(self, replica):
+        # A failed checkout takes the replica out of rotation until its next check is due
+        replica.healthy = False
+        replica.checked_at = time.monotonic()
+        replica.failures += 1
+
+    def stats(self):
+        return [
+            {
+                "name": replica.name,
+                "healthy": replica.healthy,
+                "lag": replica.lag,
+                "failures": replica.failures,
+                "pool": replica.pool.stats(),
+            }
+            for replica in self.replicas
+        ]
+
+
+class PooledMySQL:
+    # Drop-in for flask_mysqldb.MySQL: `mysql.connection` is borrowed from the pool on first use
+    # in an app context and handed back when the context tears down.
+    # `mysql.read_connection` is the same for reads that may be served by a replica (MYSQL_REPLICAS).
+    # wrap(conn), if given, returns the object handed to callers in place of the raw connection.
+    # replica_connect(settings), if given, replaces mysql_connector for the replica pools.
+    def __init__(self, app=None, connect=None, wrap=None, replica_connect=None):
+        self.pool = None
+        self.replicas = ReplicaSet()
+        self._connect = connect
+        self._wrap = wrap
+        self._replica_connect = replica_connect or mysql_connector
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        config.setdefault("MYSQL_POOL_MIN_SIZE", 1)
+        config.setdefault("MYSQL_POOL_MAX_SIZE", 10)
+        config.setdefault("MYSQL_POOL_TIMEOUT", 5.0)
+        config.setdefault("MYSQL_POOL_MAX_USES", 1000)
+        config.setdefault("MYSQL_POOL_MAX_AGE", 3600.0)
+        config.setdefault("MYSQL_POOL_CHECK_INTERVAL", 1.0)
+        config.setdefault("MYSQL_REPLICAS", [])
+        config.setdefault("MYSQL_REPLICA_BALANCE", "least_loaded")
+        config.setdefault("MYSQL_REPLICA_CHECK_INTERVAL", 5.0)
+        config.setdefault("MYSQL_REPLICA_MAX_LAG", 30)
+
+        self.pool = self._make_pool(config, self._connect or mysql_connector(config))
+
+        replicas = []
+        for spec in config["MYSQL_REPLICAS"]:
+            settings = dict(config)
+            settings.update({REPLICA_KEYS[key]: value for key, value in spec.items() if key in REPLICA_KEYS})
+            name = f"{settings['MYSQL_HOST']}:{settings.get('MYSQL_PORT', 3306)}"
+            replicas.append(Replica(name, self._make_pool(config, self._replica_connect(settings))))
+        self.replicas = ReplicaSet(
+            replicas,
+            balance=config["MYSQL_REPLICA_BALANCE"],
+            check_interval=config["MYSQL_REPLICA_CHECK_INTERVAL"],
+            max_lag=config["MYSQL_REPLICA_MAX_LAG"],
+        )
+        app.teardown_appcontext(self.teardown)
+
+    def _make_pool(self, config, connect):
+        return ConnectionPool(
+            connect,
+            min_size=config["MYSQL_POOL_MIN_SIZE"],
+            max_size=config["MYSQL_POOL_MAX_SIZE"],
+            timeout=config["MYSQL_POOL_TIMEOUT"],
+            max_uses=config["MYSQL_POOL_MAX_USES"],
+            max_age=config["MYSQL_POOL_MAX_AGE"],
+            check_interval=config["MYSQL_POOL_CHECK_INTERVAL"],
+        )
+
+    @property
+    def connection(self):
+        if "db_conn" not in g:
+            if self.pool.created == 0:
+                self.pool.warm()
+            g.db_conn = self.pool.acquire()
+            g.db_handle = self._wrap(g.db_conn) if self._wrap else g.db_conn
+        return g.db_handle
+
+    @property
+    def read_connection(self):
+        # The primary when no replica is configured or healthy, when this request already holds a
+        # primary connection, or when g.read_primary is set (read-your-writes); a failed replica
+        # checkout falls back to the primary too
+        if "db_read_handle" in g:
+            return g.db_read_handle
+        if not self.replicas.replicas or "db_conn" in g or g.get("read_primary"):
+            return self.connection
+
+        replica = self.replicas.choose()
+        if replica is None:
+            return self.connection
+        try:
+            conn = replica.pool.acquire()
+        except Exception:
+            self.replicas.mark_down(replica)
+            return self.connection
+
+        g.db_read_conn = (replica, conn)
+        g.db_read_handle = self._wrap(conn) if self._wrap else conn
+        return g.db_read_handle
+
+    def teardown(self, exception):
+        g.pop("db_handle", None)
+        conn = g.pop("db_conn", None)
+        if conn is not None:
+            self.pool.release(conn)
+
+        g.pop("db_read_handle", None)
+        read = g.pop("db_read_conn", None)
+        if read is not None:
+            read[0].pool.release(read[1])
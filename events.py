@@ -0,0 +1,177 @@
+import asyncio
+import bisect
+import json
+import logging
+import time
+from serialize import dumps
+
+logger = logging.getLogger(__name__)
+
+TOPICS = ("vehicles", "locations", "rentals")
+
+# What /events sends when no ?topics= is given; rentals need a staff token
+PUBLIC_TOPICS = ("vehicles", "locations")
+
+# Events read from the log per query
+BATCH_SIZE = 500
+
+RETRY_FRAME = b"retry: 3000\n\n"
+HEARTBEAT_FRAME = b": keep-alive\n\n"
+
+
+def parse_topics(value):
+    if not value:
+        return PUBLIC_TOPICS, None
+    topics = tuple(dict.fromkeys(topic.strip() for topic in value.split(",") if topic.strip()))
+    for topic in topics:
+        if topic not in TOPICS:
+            return None, f"Unknown topic: {topic}"
+    if not topics:
+        return None, "At least one topic is required"
+    return topics, None
+
+
+def parse_last_event_id(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def event_frame(seq, topic, action, ids):
+    data = dumps({"seq": seq, "action": action, "ids": json.loads(ids)})
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (seq, topic.encode(), data)
+
+
+def reset_frame(seq):
+    # Sent instead of the missed events when they are no longer in the log: refetch, then follow
+    return b"id: %d\nevent: reset\ndata: {}\n\n" % seq
+
+
+def read_events(log, last_seq, topics):
+    # Frames for the events after last_seq on the given topics, and the seq to continue from
+    first, latest = log.bounds()
+    if last_seq > latest or last_seq < first - 1:
+        return [reset_frame(latest)], latest
+
+    frames = []
+    while last_seq < latest:
+        rows = log.since(last_seq, BATCH_SIZE)
+        if not rows:
+            break
+        frames.extend(event_frame(*row) for row in rows if row[1] in topics)
+        last_seq = rows[-1][0]
+    return frames, last_seq
+
+
+def poll_events(log, last_seq, topics, poll_interval=1.0, heartbeat=15.0, duration=60.0):
+    # Event stream for the sync app: polls the log itself and ends after duration seconds so it does
+    # not hold a worker thread for good; EventSource reconnects with Last-Event-ID and resumes
+    if last_seq is None:
+        last_seq = log.bounds()[1]
+    yield RETRY_FRAME
+
+    started = quiet_since = time.monotonic()
+    while True:
+        frames, last_seq = read_events(log, last_seq, topics)
+        now = time.monotonic()
+        if frames:
+            yield b"".join(frames)
+            quiet_since = now
+        elif now - quiet_since >= heartbeat:
+            yield HEARTBEAT_FRAME
+            quiet_since = now
+        if now - started >= duration:
+            return
+        time.sleep(poll_interval)
+
+
+class EventBroadcaster:
+    # Fan-out for the async app: one task per worker process polls the shared log and formats each new
+    # event once; every subscriber is a coroutine waiting on the same asyncio.Event, so thousands of
+    # idle clients cost no threads and no queries. The newest `backlog` frames stay in memory for
+    # subscribers that wake up a few events behind; anyone further behind reads the log directly.
+    def __init__(self, log, poll_interval=0.25, backlog=1000):
+        self.log = log
+        self.poll_interval = poll_interval
+        self.backlog = backlog
+        self.latest = 0
+        self.subscribers = 0
+        self._seqs = []
+        self._frames = []  # (topic, frame), in step with _seqs
+        self._changed = None
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self.latest = self.log.bounds()[1]
+            self._changed = asyncio.Event()
+            self._task = asyncio.ensure_future(self._poll())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                rows = self.log.since(self.latest, BATCH_SIZE)
+            except Exception as e:
+                logger.warning("could not read the event log: %s", e)
+                continue
+            if rows:
+                self.publish(rows)
+
+    def publish(self, rows):
+        for row in rows:
+            self._seqs.append(row[0])
+            self._frames.append((row[1], event_frame(*row)))
+        if len(self._seqs) > 2 * self.backlog:
+            del self._seqs[:-self.backlog]
+            del self._frames[:-self.backlog]
+        self.latest = rows[-1][0]
+
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self, last_seq, topics, heartbeat=15.0):
+        self.start()
+        self.subscribers += 1
+        try:
+            if last_seq is None:
+                last_seq = self.latest
+            yield RETRY_FRAME
+            if last_seq != self.latest:
+                # Resuming: the log has everything since Last-Event-ID, or says it is too old
+                frames, last_seq = read_events(self.log, last_seq, topics)
+                if frames:
+                    yield b"".join(frames)
+
+            while True:
+                changed = self._changed
+                if last_seq < self.latest:
+                    start = bisect.bisect_right(self._seqs, last_seq)
+                    if start == 0 and (not self._seqs or self._seqs[0] > last_seq + 1):
+                        frames, last_seq = read_events(self.log, last_seq, topics)
+                    else:
+                        frames = [frame for topic, frame in self._frames[start:] if topic in topics]
+                        last_seq = self.latest
+                    if frames:
+                        yield b"".join(frames)
+                    continue
+
+                try:
+                    await asyncio.wait_for(changed.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT_FRAME
+        finally:
+            self.subscribers -= 1
+
+    def stats(self):
+        return {"latest": self.latest, "subscribers": self.subscribers}
@@ -0,0 +1,112 @@
+import hashlib
+import threading
+import time
+from functools import wraps
+from flask import request, jsonify, make_response
+
+# Longest Idempotency-Key accepted
+MAX_KEY_LENGTH = 255
+
+# Returned by _wait_for when the request waited on gave its key up
+RELEASED = object()
+
+# How often a request waiting on a concurrent duplicate looks for its response
+POLL_INTERVAL = 0.05
+
+
+def request_fingerprint():
+    # What a retry has to repeat exactly: the query string changes what a handler does as much as the body
+    digest = hashlib.sha256(b"%s %s?%s\n" % (request.method.encode(), request.path.encode(), request.query_string))
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+class IdempotencyKeys:
+    # Replays the stored response of a POST sent again with the same Idempotency-Key, without running
+    # the handler. Keys are scoped to the user, method and path. Responses live in store
+    # (store.IdempotencyStore) for ttl seconds, so retries reaching any worker are deduplicated.
+    # - a duplicate that arrives while the first request is still running waits up to wait seconds for
+    #   its response instead of running again, then gets 409
+    # - a claim left behind by a crashed worker is taken over once it is stale_after seconds old
+    # - the same key with a different body or query string (e.g. ?atomic=true) gets 422
+    # - 5xx responses and exceptions are not stored, so the client can retry them
+    # - every evict_every claims, a worker drops expired keys and the oldest beyond max_keys
+    def __init__(self, store, ttl=86400.0, max_keys=100000, wait=10.0, stale_after=60.0, evict_every=1000):
+        self.store = store
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.wait = wait
+        self.stale_after = stale_after
+        self.evict_every = evict_every
+        self._claims = 0
+        self._lock = threading.Lock()
+        self.replayed = 0
+        self.coalesced = 0
+        self.evicted = 0
+
+    def idempotent(self, f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get("Idempotency-Key")
+            if key is None:
+                return f(*args, **kwargs)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return jsonify({"error": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"}), 400
+
+            scoped = f"{getattr(request, 'username', '')}:{request.method}:{request.path}:{key}"
+            fingerprint = request_fingerprint()
+            now = time.time()
+            existing = self.store.claim(scoped, fingerprint, now, now - self.ttl, now - self.stale_after)
+
+            if existing is None:
+                self._count_claim(now)
+                try:
+                    response = make_response(f(*args, **kwargs))
+                except BaseException:
+                    self.store.release(scoped)
+                    raise
+                if response.status_code >= 500 or response.is_streamed:
+                    self.store.release(scoped)
+                else:
+                    self.store.complete(scoped, response.status_code, response.get_data(), response.mimetype)
+                return response
+
+            if existing[0] != fingerprint:
+                return jsonify({"error": "Idempotency-Key was already used with a different request"}), 422
+            if existing[1] is None:
+                self.coalesced += 1
+                existing = self._wait_for(scoped)
+                if existing is None:
+                    return jsonify({"error": "A request with this Idempotency-Key is still in progress"}), 409
+                if existing is RELEASED:
+                    # The first request failed without a stored response: claim the key again
+                    return wrapper(*args, **kwargs)
+
+            self.replayed += 1
+            response = make_response(existing[2], existing[1])
+            response.mimetype = existing[3]
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+        return wrapper
+
+    def _wait_for(self, key):
+        # Polls the shared store, since the request being waited on may run in another worker
+        deadline = time.monotonic() + self.wait
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            row = self.store.get(key)
+            if row is None:
+                return RELEASED
+            if row[1] is not None:
+                return row
+        return None
+
+    def _count_claim(self, now):
+        with self._lock:
+            self._claims += 1
+            due = self._claims % self.evict_every == 0
+        if due:
+            self.evicted += self.store.evict(now - self.ttl, self.max_keys)
+
+    def stats(self):
+        return {"replayed": self.replayed, "coalesced": self.coalesced, "evicted": self.evicted}
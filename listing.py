@@ -0,0 +1,107 @@
+import math
+from availability import parse_date
+
+# Suffix of a range filter parameter -> SQL operator, e.g. ?date_from__gte=2024-05-01
+RANGE_OPERATORS = {"gte": ">=", "lte": "<=", "gt": ">", "lt": "<"}
+
+# Query parameters handled by pagination or delta sync rather than as filters
+PAGE_PARAMS = ("limit", "after", "since")
+
+# Version column the triggers in migrations/003 stamp on every insert and update
+ROW_VERSION = "row_version"
+
+
+def parse_bool(value):
+    value = value.lower()
+    if value in ("1", "true", "yes"):
+        return True
+    if value in ("0", "false", "no"):
+        return False
+    raise ValueError(value)
+
+
+def parse_iso_date(value):
+    return parse_date(value)
+
+
+def parse_number(value):
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(value)
+    return number
+
+
+class ListSpec:
+    # The columns a list endpoint may return and filter on. columns maps each column to the function
+    # that parses a query-string value for it; only columns named in ranges accept __gte/__lte/__gt/__lt.
+    # Column names in the generated SQL only ever come from this whitelist, values are always parameters.
+    def __init__(self, table, key, columns, ranges=()):
+        self.table = table
+        self.key = key
+        self.columns = columns
+        self.ranges = ranges
+
+    def fields(self, value):
+        # Returns (columns, error); the key is always selected because the next cursor comes from it
+        if not value:
+            return list(self.columns), None
+
+        fields = [field.strip() for field in value.split(",") if field.strip()]
+        unknown = [field for field in fields if field not in self.columns]
+        if unknown:
+            return None, f"Unknown field: {unknown[0]}"
+        if self.key not in fields:
+            fields.insert(0, self.key)
+        return list(dict.fromkeys(fields)), None
+
+    def filters(self, args):
+        # Returns (conditions, params, error) from every query parameter that is not fields= or paging
+        conditions = []
+        params = []
+        for name, value in args.items(multi=True):
+            if name == "fields" or name in PAGE_PARAMS:
+                continue
+
+            column, _, suffix = name.partition("__")
+            if column not in self.columns or (suffix and (suffix not in RANGE_OPERATORS or column not in self.ranges)):
+                return None, None, f"Unknown filter: {name}"
+            try:
+                params.append(self.columns[column](value))
+            except ValueError:
+                return None, None, f"Invalid value for {name}"
+            conditions.append(f"{column} {RANGE_OPERATORS[suffix] if suffix else '='} %s")
+        return conditions, params, None
+
+    def query(self, args, after, limit):
+        # Returns ((sql, params, columns), None) or (None, error) for one keyset page
+        columns, error = self.fields(args.get("fields"))
+        if error:
+            return None, error
+        conditions, params, error = self.filters(args)
+        if error:
+            return None, error
+
+        where = " AND ".join(conditions + [f"{self.key} > %s"])
+        sql = f"SELECT {', '.join(columns)} FROM {self.table} WHERE {where} ORDER BY {self.key} LIMIT %s"
+        return (sql, tuple(params) + (after, limit), columns), None
+
+    def changes(self, args):
+        # Returns ((sql, columns), None) or (None, error) for the rows written after (version, key) and
+        # before a horizon version, in (version, key) order. The SQL takes (since, since, after, horizon,
+        # limit) and selects row_version last.
+        # Filters are refused: a row changed so that it no longer matches would never be reported.
+        columns, error = self.fields(args.get("fields"))
+        if error:
+            return None, error
+        conditions, _, error = self.filters(args)
+        if error:
+            return None, error
+        if conditions:
+            return None, "Filters cannot be combined with since"
+
+        sql = (
+            f"SELECT {', '.join(columns)}, {ROW_VERSION} FROM {self.table} "
+            f"WHERE {ROW_VERSION} >= %s AND ({ROW_VERSION} > %s OR {self.key} > %s) AND {ROW_VERSION} < %s "
+            f"ORDER BY {ROW_VERSION}, {self.key} LIMIT %s"
+        )
+        return (sql, columns), None
@@ -0,0 +1,185 @@
+import os
+import re
+import time
+from flask import g, request
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+
+# First table a statement reads or writes, for the per-query label
+STATEMENT_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+`?(\w+)", re.IGNORECASE)
+
+# Statement labels remembered per process; bulk statements vary with their placeholder count
+LABEL_CACHE_SIZE = 1024
+
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+
+class QueryStats:
+    # SQL work done while serving one request
+    __slots__ = ("statements", "seconds", "rows")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.rows = 0
+
+
+class Metrics:
+    # Prometheus instrumentation of the request lifecycle and of every statement run through
+    # mysql.connection. Metrics live in their own registry; when PROMETHEUS_MULTIPROC_DIR is set,
+    # prometheus_client writes them to per-process files instead and /metrics sums all workers.
+    # slow_queries, if given, sees every statement too (see slow_queries.SlowQueryLog).
+    def __init__(self, registry=None, slow_queries=None):
+        self.registry = registry or CollectorRegistry()
+        self.slow_queries = slow_queries
+        self.requests = Histogram(
+            "http_request_duration_seconds", "Time to build the response, by route and status",
+            ["method", "route", "status"], registry=self.registry,
+        )
+        self.request_statements = Histogram(
+            "http_request_sql_statements", "SQL statements executed per request",
+            ["route"], buckets=STATEMENT_BUCKETS, registry=self.registry,
+        )
+        self.request_sql_seconds = Histogram(
+            "http_request_sql_seconds", "Time spent in SQL per request",
+            ["route"], registry=self.registry,
+        )
+        self.request_rows = Histogram(
+            "http_request_sql_rows", "Rows fetched from MySQL per request",
+            ["route"], buckets=ROW_BUCKETS, registry=self.registry,
+        )
+        self.queries = Histogram(
+            "sql_query_duration_seconds", "Time per SQL statement, by operation and first table",
+            ["operation", "table"], registry=self.registry,
+        )
+        self.auth = Counter(
+            "auth_outcomes_total", "Authentication and authorization results",
+            ["check", "outcome"], registry=self.registry,
+        )
+        self._labels = {}
+
+    def init_app(self, app):
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _start_request(self):
+        g.request_started = time.perf_counter()
+        g.sql_stats = QueryStats()
+
+    def _finish_request(self, response):
+        started = g.pop("request_started", None)
+        if started is None:
+            return response
+
+        # Streamed bodies are still being sent at this point: the timing covers building the response
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        self.requests.labels(request.method, route, str(response.status_code)).observe(time.perf_counter() - started)
+
+        stats = g.pop("sql_stats", None)
+        if stats is not None:
+            self.request_statements.labels(route).observe(stats.statements)
+            self.request_sql_seconds.labels(route).observe(stats.seconds)
+            self.request_rows.labels(route).observe(stats.rows)
+        return response
+
+    def auth_outcome(self, check, outcome):
+        self.auth.labels(check, outcome).inc()
+
+    def wrap(self, conn):
+        # Hands out instrumented cursors; statements count towards the current request, if any
+        return InstrumentedConnection(conn, self, g.get("sql_stats"))
+
+    def statement_label(self, query):
+        label = self._labels.get(query)
+        if label is None:
+            if isinstance(query, bytes):
+                query = query.decode(errors="replace")
+            words = query.split(None, 1)
+            table = STATEMENT_TABLE.search(query)
+            label = (words[0].upper() if words else "", table.group(1) if table else "")
+            if len(self._labels) >= LABEL_CACHE_SIZE:
+                self._labels.clear()
+            self._labels[query] = label
+        return label
+
+    def record_query(self, cursor, query, args, seconds, stats, many=False):
+        self.queries.labels(*self.statement_label(query)).observe(seconds)
+        if stats is not None:
+            stats.statements += 1
+            stats.seconds += seconds
+        if self.slow_queries is not None:
+            self.slow_queries.observe(cursor, query, args, seconds, many)
+
+    def render(self):
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = self.registry
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class InstrumentedConnection:
+    def __init__(self, conn, metrics, stats):
+        self._conn = conn
+        self._metrics = metrics
+        self._stats = stats
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._metrics, self._stats)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class InstrumentedCursor:
+    # Times execute/executemany and counts fetched rows; everything else goes to the real cursor
+    def __init__(self, cursor, metrics, stats):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_metrics", metrics)
+        object.__setattr__(self, "_stats", stats)
+
+    def execute(self, query, *args):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(query, *args)
+        finally:
+            seconds = time.perf_counter() - started
+            self._metrics.record_query(self._cursor, query, args[0] if args else None, seconds, self._stats)
+
+    def executemany(self, query, args):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, args)
+        finally:
+            seconds = time.perf_counter() - started
+            self._metrics.record_query(self._cursor, query, args, seconds, self._stats, many=True)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None and self._stats is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        if self._stats is not None:
+            self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if self._stats is not None:
+            self._stats.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # e.g. bulk_insert sets max_stmt_length on the cursor
+        setattr(self._cursor, name, value)
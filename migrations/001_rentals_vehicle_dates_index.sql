@@ -0,0 +1,5 @@
+-- Double-booking check in add_rental / update_rental:
+--   WHERE vehicle_id = ? AND date_to >= ? AND date_from <= ?
+-- Seeking on (vehicle_id, date_to) only touches rentals that end on or after the requested start,
+-- so the check stays cheap however much rental history a vehicle has.
+CREATE INDEX idx_rentals_vehicle_dates ON Rentals (vehicle_id, date_to, date_from);
@@ -0,0 +1,17 @@
+-- Revenue and utilization summaries, kept up to date by the rental write handlers (aggregates.py).
+-- Dashboard queries read these instead of scanning Rentals. Rebuild them with:
+--   flask --app app rebuild-aggregates
+CREATE TABLE RentalVehicleStats (
+    vehicle_id INT NOT NULL PRIMARY KEY,
+    rentals INT NOT NULL DEFAULT 0,
+    rental_days INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(12, 2) NOT NULL DEFAULT 0
+);
+
+-- rentals_started and revenue are booked on the rental's date_from; vehicles_out counts every day of a rental
+CREATE TABLE RentalDailyStats (
+    day DATE NOT NULL PRIMARY KEY,
+    rentals_started INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    vehicles_out INT NOT NULL DEFAULT 0
+);
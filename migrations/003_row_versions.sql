@@ -0,0 +1,88 @@
+-- Row versions and delete tombstones for delta sync (GET /<table>?since=<version>).
+-- A row's version is the time of the statement that last inserted or updated it, in microseconds
+-- since the epoch (UTC), and every delete records the row's id in Tombstones the same way. Nothing
+-- is shared between writers: rows written by one statement get the same version and are ordered by
+-- their primary key. A version is stamped before its transaction commits, so a sync only returns
+-- changes below sync_horizon(), which stays behind the start of every transaction still open.
+-- Rows that already exist get version 0, so ?since=0 pages through the whole table in id order.
+-- With binary logging on, creating the functions and triggers needs log_bin_trust_function_creators
+-- (or SUPER).
+CREATE FUNCTION sync_clock() RETURNS BIGINT NOT DETERMINISTIC NO SQL
+    RETURN TIMESTAMPDIFF(MICROSECOND, '1970-01-01 00:00:00', UTC_TIMESTAMP(6));
+
+-- Every version below the horizon belongs to a committed (or rolled back) transaction: a transaction's
+-- stamps are no older than its start, and the horizon is the start of the oldest transaction open on
+-- the server other than the caller's, floored to the second, or the clock when none is, less settle
+-- microseconds. settle covers the 0.1 second the server caches innodb_trx for and a first statement
+-- that starts (and takes its stamp) before its transaction does, e.g. while waiting for a metadata lock.
+-- trx_started is in the server's time zone, as UNIX_TIMESTAMP reads it unless the session's time_zone
+-- was changed. The definer needs PROCESS, without which innodb_trx shows no other transactions.
+-- Read it before any row a sync returns, so those reads see every transaction it let through.
+CREATE FUNCTION sync_horizon(settle BIGINT) RETURNS BIGINT NOT DETERMINISTIC READS SQL DATA SQL SECURITY DEFINER
+    RETURN LEAST(sync_clock(), COALESCE(
+        (SELECT MIN(UNIX_TIMESTAMP(trx_started)) * 1000000 FROM information_schema.innodb_trx
+         WHERE trx_mysql_thread_id <> CONNECTION_ID()),
+        sync_clock()
+    )) - settle;
+
+-- One row per synced table; versions below pruned_version may have lost their tombstones
+CREATE TABLE SyncTables (
+    table_name VARCHAR(32) NOT NULL PRIMARY KEY,
+    pruned_version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE Tombstones (
+    table_name VARCHAR(32) NOT NULL,
+    row_id INT NOT NULL,
+    row_version BIGINT NOT NULL,
+    PRIMARY KEY (table_name, row_id),
+    INDEX idx_tombstones_version (table_name, row_version, row_id)
+);
+
+-- The secondary indexes also hold the primary key, so they are in (row_version, id) order
+ALTER TABLE Customers
+    ADD COLUMN row_version BIGINT NOT NULL DEFAULT 0,
+    ADD INDEX idx_customers_row_version (row_version);
+ALTER TABLE Vehicles
+    ADD COLUMN row_version BIGINT NOT NULL DEFAULT 0,
+    ADD INDEX idx_vehicles_row_version (row_version);
+ALTER TABLE Locations
+    ADD COLUMN row_version BIGINT NOT NULL DEFAULT 0,
+    ADD INDEX idx_locations_row_version (row_version);
+ALTER TABLE Rentals
+    ADD COLUMN row_version BIGINT NOT NULL DEFAULT 0,
+    ADD INDEX idx_rentals_row_version (row_version);
+
+INSERT INTO SyncTables (table_name) VALUES ('Customers'), ('Vehicles'), ('Locations'), ('Rentals');
+
+CREATE TRIGGER customers_version_insert BEFORE INSERT ON Customers FOR EACH ROW
+    SET NEW.row_version = sync_clock();
+CREATE TRIGGER customers_version_update BEFORE UPDATE ON Customers FOR EACH ROW
+    SET NEW.row_version = sync_clock();
+CREATE TRIGGER customers_tombstone AFTER DELETE ON Customers FOR EACH ROW
+    INSERT INTO Tombstones (table_name, row_id, row_version) VALUES ('Customers', OLD.customer_id, sync_clock())
+    ON DUPLICATE KEY UPDATE row_version = VALUES(row_version);
+
+CREATE TRIGGER vehicles_version_insert BEFORE INSERT ON Vehicles FOR EACH ROW
+    SET NEW.row_version = sync_clock();
+CREATE TRIGGER vehicles_version_update BEFORE UPDATE ON Vehicles FOR EACH ROW
+    SET NEW.row_version = sync_clock();
+CREATE TRIGGER vehicles_tombstone AFTER DELETE ON Vehicles FOR EACH ROW
+    INSERT INTO Tombstones (table_name, row_id, row_version) VALUES ('Vehicles', OLD.vehicle_id, sync_clock())
+    ON DUPLICATE KEY UPDATE row_version = VALUES(row_version);
+
+CREATE TRIGGER locations_version_insert BEFORE INSERT ON Locations FOR EACH ROW
+    SET NEW.row_version = sync_clock();
+CREATE TRIGGER locations_version_update BEFORE UPDATE ON Locations FOR EACH ROW
+    SET NEW.row_version = sync_clock();
+CREATE TRIGGER locations_tombstone AFTER DELETE ON Locations FOR EACH ROW
+    INSERT INTO Tombstones (table_name, row_id, row_version) VALUES ('Locations', OLD.location_id, sync_clock())
+    ON DUPLICATE KEY UPDATE row_version = VALUES(row_version);
+
+CREATE TRIGGER rentals_version_insert BEFORE INSERT ON Rentals FOR EACH ROW
+    SET NEW.row_version = sync_clock();
+CREATE TRIGGER rentals_version_update BEFORE UPDATE ON Rentals FOR EACH ROW
+    SET NEW.row_version = sync_clock();
+CREATE TRIGGER rentals_tombstone AFTER DELETE ON Rentals FOR EACH ROW
+    INSERT INTO Tombstones (table_name, row_id, row_version) VALUES ('Rentals', OLD.rental_id, sync_clock())
+    ON DUPLICATE KEY UPDATE row_version = VALUES(row_version);
@@ -0,0 +1,91 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response
+
+
+class ResponseCache:
+    # Serialized 200 responses of public GET routes, keyed by path and query string.
+    # Every entry is stamped with the version of the table it was read from (see store.TableVersions);
+    # writes bump the version, so the next read in any worker misses and goes back to MySQL.
+    # With a compressor (see compression.Compressor), each entry also keeps its body compressed once
+    # per negotiated encoding, so repeated hits send the stored bytes instead of compressing again.
+    def __init__(self, versions, maxsize=256, compressor=None):
+        self.versions = versions
+        self.maxsize = maxsize
+        self.compressor = compressor
+        self._entries = OrderedDict()  # (table, full_path) -> (version, etag, body, mimetype, {encoding: body})
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, table):
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                # Read the version before the query: a write landing in between leaves this entry
+                # stamped with the old version, so it is refetched rather than served stale
+                version = self.versions.get(table)
+                key = (table, request.full_path)
+
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None and entry[0] == version:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                    else:
+                        entry = None
+                        self.misses += 1
+
+                if entry is None:
+                    response = make_response(f(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+
+                    body = response.get_data()
+                    entry = (version, hashlib.sha1(body).hexdigest(), body, response.mimetype, {})
+                    with self._lock:
+                        self._entries[key] = entry
+                        self._entries.move_to_end(key)
+                        while len(self._entries) > self.maxsize:
+                            self._entries.popitem(last=False)
+
+                encoding = self._encoding(entry)
+                if encoding is None:
+                    response = make_response(entry[2])
+                    response.set_etag(entry[1])
+                else:
+                    response = make_response(self._compressed(entry, encoding))
+                    response.headers["Content-Encoding"] = encoding
+                    response.set_etag(f"{entry[1]}-{encoding}")
+                response.mimetype = entry[3]
+                response.headers["Cache-Control"] = "no-cache"
+                # Turns the response into a bodyless 304 when If-None-Match carries this ETag
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+    def _encoding(self, entry):
+        compressor = self.compressor
+        if compressor is None or len(entry[2]) < compressor.min_size or not compressor.compressible(entry[3]):
+            return None
+        return compressor.choose(request.headers.get("Accept-Encoding"))
+
+    def _compressed(self, entry, encoding):
+        # Two threads missing the same variant both compress it; the bytes are identical
+        body = entry[4].get(encoding)
+        if body is None:
+            body = entry[4][encoding] = self.compressor.compress(encoding, entry[2])
+        return body
+
+    def invalidate(self, *tables):
+        self.versions.bump(*tables)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
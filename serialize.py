@@ -0,0 +1,106 @@
+import datetime
+import decimal
+import json
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder below produces the same JSON, only slower
+    orjson = None
+
+# Rows encoded per dumps() call when streaming an array
+CHUNK_SIZE = 500
+
+# Formatted dates remembered per encoder; rental dates repeat heavily and http_date is slow
+DATE_MEMO_SIZE = 4096
+
+
+def iso_date(value):
+    return value.isoformat()
+
+
+def make_default(date_format=http_date):
+    # Fallback for the values MySQLdb returns that JSON has no type for. Decimal becomes a string and
+    # dates go through date_format; http_date matches what flask.jsonify has always sent.
+    formatted = {}
+
+    def default(value):
+        if isinstance(value, decimal.Decimal):
+            return str(value)
+        if isinstance(value, datetime.date):
+            text = formatted.get(value)
+            if text is None:
+                if len(formatted) >= DATE_MEMO_SIZE:
+                    formatted.clear()
+                text = formatted[value] = date_format(value)
+            return text
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+    return default
+
+
+if orjson is not None:
+    def dumps(value, default=make_default()):
+        # Dates are passed through to default so both encoders format them the same way
+        return orjson.dumps(value, default=default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+else:
+    def dumps(value, default=make_default()):
+        return json.dumps(value, default=default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class RowEncoder:
+    # Encodes cursor rows for one fixed column list straight to JSON bytes. The column names are
+    # bound once per table, each chunk of rows becomes one dumps() call, and no handler builds
+    # per-row dicts by hand.
+    def __init__(self, columns, date_format=http_date):
+        self.columns = tuple(columns)
+        self.default = make_default(date_format)
+
+    def objects(self, rows):
+        columns = self.columns
+        return [dict(zip(columns, row)) for row in rows]
+
+    def array(self, rows, chunk_size=CHUNK_SIZE):
+        # Yields a JSON array of rows piece by piece, so a large result is never one giant string
+        yield b"["
+        first = True
+        for chunk in chunked(rows, chunk_size):
+            body = dumps(self.objects(chunk), self.default)[1:-1]
+            yield body if first else b"," + body
+            first = False
+        yield b"]"
+
+    def ndjson(self, rows):
+        return b"".join(dumps(row, self.default) + b"\n" for row in self.objects(rows))
+
+
+def chunked(rows, size):
+    if isinstance(rows, (list, tuple)):
+        for start in range(0, len(rows), size):
+            yield rows[start:start + size]
+        return
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_page(name, encoder, rows, next_cursor):
+    # Body of a list endpoint, {"<name>": [...], "next": cursor}, as a stream of bytes
+    yield b'{"' + name.encode() + b'":'
+    yield from encoder.array(rows)
+    yield b',"next":' + dumps(next_cursor) + b"}"
+
+
+def stream_changes(name, encoder, rows, deleted, version, after, more):
+    # Body of a delta sync, {"<name>": [...], "deleted": [ids], "version": v, "after": id or null, "more": bool}
+    yield b'{"' + name.encode() + b'":'
+    yield from encoder.array(rows)
+    yield (
+        b',"deleted":' + dumps(deleted) + b',"version":' + dumps(version) + b',"after":' + dumps(after)
+        + b',"more":' + dumps(more) + b"}"
+    )
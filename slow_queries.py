@@ -0,0 +1,123 @@
+import datetime
+import json
+import logging
+import re
+import threading
+import time
+from flask import has_request_context, request
+
+logger = logging.getLogger("slow_queries")
+
+# Runs of placeholders, as in "IN (%s, %s, %s)", so bulk statements of any size share one shape
+PLACEHOLDER_RUN = re.compile(r"%s(?:\s*,\s*%s)+")
+
+# Statements MySQL can EXPLAIN
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "INSERT", "REPLACE")
+
+
+def statement_template(query):
+    if isinstance(query, bytes):
+        query = query.decode(errors="replace")
+    return PLACEHOLDER_RUN.sub("%s, ...", " ".join(query.split()))
+
+
+def param_shape(args, many=False):
+    # The types of the parameters, never their values, e.g. "(int, str x 2)" or "500 x (int, str)"
+    if many:
+        args = list(args or ())
+        return f"{len(args)} x {param_shape(args[0])}" if args else "0 x ()"
+    if args is None:
+        return "()"
+    if isinstance(args, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in args.items()) + "}"
+
+    runs = []
+    for value in args:
+        name = type(value).__name__
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return "(" + ", ".join(name if count == 1 else f"{name} x {count}" for name, count in runs) + ")"
+
+
+def current_route():
+    if has_request_context() and request.url_rule is not None:
+        return f"{request.method} {request.url_rule.rule}"
+    return None
+
+
+class SlowQueryLog:
+    # Logs every statement that takes threshold seconds or longer: template, parameter types,
+    # duration, row count and the route that ran it. With explain_file set, the statement is also
+    # EXPLAINed with the same parameters and the plan appended to that file as one JSON line, at
+    # most once per explain_interval seconds for each statement template.
+    # Cursors of the classes in unbuffered stream their results from the server, so their
+    # connection cannot run the EXPLAIN until they are drained; those statements are only logged.
+    def __init__(self, threshold=0.5, explain_file=None, explain_interval=300.0, unbuffered=()):
+        self.threshold = threshold
+        self.explain_file = explain_file
+        self.explain_interval = explain_interval
+        self.unbuffered = unbuffered
+        self._explained = {}  # template -> time of its last EXPLAIN
+        self._lock = threading.Lock()
+        self.logged = 0
+        self.explained = 0
+
+    def observe(self, cursor, query, args, seconds, many=False):
+        if not self.threshold or seconds < self.threshold:
+            return
+
+        template = statement_template(query)
+        route = current_route()
+        self.logged += 1
+        logger.warning(
+            "slow query %.3fs route=%s rows=%s params=%s sql=%s",
+            seconds, route, getattr(cursor, "rowcount", None), param_shape(args, many), template,
+        )
+
+        if self.explain_file and not many and self._should_explain(cursor, template):
+            self._explain(cursor, query, args, template, seconds, route)
+
+    def _should_explain(self, cursor, template):
+        if isinstance(cursor, self.unbuffered) or not template.upper().startswith(EXPLAINABLE):
+            return False
+
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained.get(template)
+            if last is not None and now - last < self.explain_interval:
+                return False
+            self._explained[template] = now
+        return True
+
+    def _explain(self, cursor, query, args, template, seconds, route):
+        try:
+            explain_cursor = cursor.connection.cursor()
+            try:
+                if args is None:
+                    explain_cursor.execute(f"EXPLAIN {query}")
+                else:
+                    explain_cursor.execute(f"EXPLAIN {query}", args)
+                columns = [column[0] for column in explain_cursor.description or ()]
+                plan = [dict(zip(columns, row)) for row in explain_cursor.fetchall()]
+            finally:
+                explain_cursor.close()
+        except Exception as e:
+            logger.warning("could not EXPLAIN slow query: %s", e)
+            return
+
+        entry = {
+            "at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "route": route,
+            "seconds": round(seconds, 6),
+            "sql": template,
+            "plan": plan,
+        }
+        with self._lock:
+            with open(self.explain_file, "a") as file:
+                file.write(json.dumps(entry, default=str) + "\n")
+            self.explained += 1
+
+    def stats(self):
+        return {"threshold": self.threshold, "logged": self.logged, "explained": self.explained}
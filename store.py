@@ -0,0 +1,259 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class SQLiteStore:
+    # State shared by every worker process through one local SQLite file.
+    # WAL mode lets readers in all workers run alongside a single writer, every thread gets its own
+    # connection, and connections are reopened after a fork so workers never share a handle.
+    schema = ""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def db(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.schema)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self.on_connect(conn)
+        return conn
+
+    def on_connect(self, conn):
+        pass
+
+    @contextmanager
+    def transaction(self):
+        conn = self.db
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+class UserStore(SQLiteStore):
+    schema = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL,
+            token TEXT
+        );
+    """
+
+    def __init__(self, path, legacy_file=None):
+        super().__init__(path)
+        self.legacy_file = legacy_file
+
+    def on_connect(self, conn):
+        # One-off migration from the old users.json, only while the table is still empty
+        if self.legacy_file and conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None:
+            self.import_json(self.legacy_file)
+
+    def get(self, username):
+        row = self.db.execute(
+            "SELECT password, role, token FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        user = {"password": row[0], "role": row[1]}
+        if row[2] is not None:
+            user["token"] = row[2]
+        return user
+
+    def add(self, username, password_hash, role):
+        try:
+            self.db.execute(
+                "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                (username, password_hash, role),
+            )
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def set_token(self, username, token):
+        self.db.execute("UPDATE users SET token = ? WHERE username = ?", (token, username))
+
+    def import_json(self, path):
+        try:
+            with open(path, "r") as file:
+                users = json.load(file)
+        except FileNotFoundError:
+            return 0
+
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (username, password, role, token) VALUES (?, ?, ?, ?)",
+                [
+                    (username, user["password"], user.get("role", "user"), user.get("token"))
+                    for username, user in users.items()
+                ],
+            )
+        return len(users)
+
+
+class TableVersions(SQLiteStore):
+    # A counter per table, bumped after every committed write through the API, so a cache in any
+    # worker can tell that its copy of a table is out of date.
+    schema = """
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+    """
+
+    def get(self, name):
+        row = self.db.execute("SELECT version FROM table_versions WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, *names):
+        versions = {}
+        with self.transaction() as conn:
+            for name in names:
+                conn.execute(
+                    "INSERT INTO table_versions (name, version) VALUES (?, 1) "
+                    "ON CONFLICT (name) DO UPDATE SET version = version + 1",
+                    (name,),
+                )
+                versions[name] = conn.execute(
+                    "SELECT version FROM table_versions WHERE name = ?", (name,)
+                ).fetchone()[0]
+        return versions
+
+
+class ReadPins(SQLiteStore):
+    # Users who wrote recently, and until when (wall clock, shared by every worker) their reads stay
+    # on the primary instead of a replica that may not have caught up yet
+    schema = """
+        CREATE TABLE IF NOT EXISTS read_pins (
+            username TEXT PRIMARY KEY,
+            until REAL NOT NULL
+        );
+    """
+
+    def pin(self, username, seconds):
+        self.db.execute(
+            "INSERT INTO read_pins (username, until) VALUES (?, ?) "
+            "ON CONFLICT (username) DO UPDATE SET until = excluded.until",
+            (username, time.time() + seconds),
+        )
+
+    def pinned(self, username):
+        row = self.db.execute("SELECT until FROM read_pins WHERE username = ?", (username,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+
+class IdempotencyStore(SQLiteStore):
+    # Responses of requests sent with an Idempotency-Key. A row is claimed (status NULL) before the
+    # request runs and completed with its response afterwards; claiming is one IMMEDIATE transaction,
+    # so exactly one request in any worker gets to run for a key.
+    schema = """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            created REAL NOT NULL,
+            status INTEGER,
+            body BLOB,
+            mimetype TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created);
+    """
+
+    def claim(self, key, fingerprint, now, expired_before, stale_before):
+        # Returns None when the caller now owns the key, otherwise the existing
+        # (fingerprint, status, body, mimetype); expired rows and abandoned claims are replaced
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT fingerprint, created, status, body, mimetype FROM idempotency_keys WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and (row[1] < expired_before or (row[2] is None and row[1] < stale_before)):
+                conn.execute("DELETE FROM idempotency_keys WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                conn.execute(
+                    "INSERT INTO idempotency_keys (key, fingerprint, created) VALUES (?, ?, ?)", (key, fingerprint, now)
+                )
+                return None
+            return row[0], row[2], row[3], row[4]
+
+    def get(self, key):
+        return self.db.execute(
+            "SELECT fingerprint, status, body, mimetype FROM idempotency_keys WHERE key = ?", (key,)
+        ).fetchone()
+
+    def complete(self, key, status, body, mimetype):
+        self.db.execute(
+            "UPDATE idempotency_keys SET status = ?, body = ?, mimetype = ? WHERE key = ?", (status, body, mimetype, key)
+        )
+
+    def release(self, key):
+        self.db.execute("DELETE FROM idempotency_keys WHERE key = ? AND status IS NULL", (key,))
+
+    def evict(self, expired_before, max_keys):
+        # Drops expired rows, then the oldest ones beyond max_keys; returns how many went
+        with self.transaction() as conn:
+            removed = conn.execute("DELETE FROM idempotency_keys WHERE created < ?", (expired_before,)).rowcount
+            excess = conn.execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0] - max_keys
+            if excess > 0:
+                removed += conn.execute(
+                    "DELETE FROM idempotency_keys WHERE key IN "
+                    "(SELECT key FROM idempotency_keys ORDER BY created LIMIT ?)", (excess,)
+                ).rowcount
+        return removed
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0]
+
+
+class EventLog(SQLiteStore):
+    # Append-only change feed shared by every worker. AUTOINCREMENT keeps sequence numbers increasing
+    # even after old events are trimmed, so a client's Last-Event-ID is never reused. Only the newest
+    # `retain` events are kept.
+    schema = """
+        CREATE TABLE IF NOT EXISTS events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT NOT NULL,
+            action TEXT NOT NULL,
+            ids TEXT NOT NULL,
+            created REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path, retain=10000):
+        super().__init__(path)
+        self.retain = retain
+
+    def append(self, topic, action, ids):
+        with self.transaction() as conn:
+            seq = conn.execute(
+                "INSERT INTO events (topic, action, ids, created) VALUES (?, ?, ?, ?)",
+                (topic, action, json.dumps(list(ids)), time.time()),
+            ).lastrowid
+            conn.execute("DELETE FROM events WHERE seq <= ?", (seq - self.retain,))
+        return seq
+
+    def since(self, seq, limit=500):
+        return self.db.execute(
+            "SELECT seq, topic, action, ids FROM events WHERE seq > ? ORDER BY seq LIMIT ?", (seq, limit)
+        ).fetchall()
+
+    def bounds(self):
+        # (oldest seq still kept, newest seq ever issued); the oldest is newest + 1 when nothing is kept
+        latest = self.db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+        latest = latest[0] if latest else 0
+        first = self.db.execute("SELECT MIN(seq) FROM events").fetchone()[0]
+        return (first if first is not None else latest + 1), latest
@@ -0,0 +1,47 @@
+import datetime
+from unittest.mock import MagicMock
+from aggregates import RentalAggregates, rebuild_summaries
+
+def day(n):
+    return datetime.date(2021, 9, n)
+
+def test_aggregates_count_both_dates():
+    aggregates = RentalAggregates()
+    aggregates.add(1, "2021-09-01", "2021-09-03", 150.00)
+
+    assert aggregates.vehicles == {1: [1, 3, 150.0]}
+    assert aggregates.days[day(1)] == [1, 150.0, 1]
+    assert aggregates.days[day(2)] == [0, 0.0, 1]
+    assert aggregates.days[day(3)] == [0, 0.0, 1]
+
+def test_aggregates_skip_rows_that_cancel_out():
+    aggregates = RentalAggregates()
+    aggregates.add(1, day(1), day(2), 100.00)
+    aggregates.remove(1, day(1), day(3), 100.00)
+    cursor = MagicMock()
+
+    aggregates.apply(cursor)
+
+    vehicle_stats, daily_stats = [c[0][1] for c in cursor.executemany.call_args_list]
+    assert vehicle_stats == [(1, 0, -1, 0.0)]
+    assert daily_stats == [(day(3), 0, 0.0, -1)]
+
+def test_aggregates_without_vehicle_only_count_days():
+    aggregates = RentalAggregates()
+    aggregates.add(None, day(1), day(1), 50.00)
+
+    assert aggregates.vehicles == {}
+    assert aggregates.days == {day(1): [1, 50.0, 1]}
+
+def test_rebuild_summaries_clears_then_applies():
+    cursor = MagicMock()
+    rentals = [(1, day(1), day(2), 100.00), (2, day(2), day(2), 40.00)]
+
+    aggregates = rebuild_summaries(cursor, lambda: rentals)
+
+    assert [c[0][0] for c in cursor.execute.call_args_list] == [
+        "DELETE FROM RentalVehicleStats",
+        "DELETE FROM RentalDailyStats"
+    ]
+    assert aggregates.days[day(2)] == [1, 40.0, 2]
+    assert cursor.executemany.call_count == 2
@@ -1,19 +1,151 @@
 import pytest
-from app import app  
+import jwt
+import datetime
+import json
+import gzip
+from werkzeug.security import generate_password_hash
+from app import app, mysql, compressor, credential_cache, token_cache, response_cache, rental_index, fleet, rate_table
+from store import UserStore, TableVersions, ReadPins, IdempotencyStore, EventLog
+from db_pool import ConnectionPool, Replica, ReplicaSet
+
+@pytest.fixture(autouse=True)
+def reset_caches(mocker, tmp_path):
+    credential_cache.clear()
+    token_cache.clear()
+    response_cache.clear()
+    versions = TableVersions(str(tmp_path / "versions.db"))
+    for cache in (response_cache, fleet, rate_table):
+        mocker.patch.object(cache, 'versions', versions)
+    for snapshot in (fleet, rate_table):
+        mocker.patch.object(snapshot, 'version', None)
+    mocker.patch.object(rental_index, 'seq', None)
+    log = EventLog(str(tmp_path / "events.db"))
+    mocker.patch('app.change_log', log)
+    mocker.patch.object(rental_index, 'log', log)
+
+@pytest.fixture
+def mock_conn(mocker):
+    return mocker.patch('db_pool.PooledMySQL.connection')
 
 @pytest.fixture
-def mock_db(mocker):
-    mock_conn = mocker.patch('flask_mysqldb.MySQL.connection')
+def mock_db(mock_conn, mocker):
     mock_cursor = mocker.MagicMock()
     mock_conn.cursor.return_value = mock_cursor
     return mock_cursor
 
+@pytest.fixture
+def user_store(mocker, tmp_path):
+    store = UserStore(str(tmp_path / "state.db"))
+    mocker.patch('app.users', store)
+    return store
+
+@pytest.fixture
+def replica_db(mocker, tmp_path):
+    # One healthy replica whose connections all hand out this cursor
+    replica_cursor = mocker.MagicMock()
+    replica_conn = mocker.MagicMock()
+    replica_conn.cursor.return_value = replica_cursor
+    pool = ConnectionPool(lambda: replica_conn)
+    mocker.patch.object(mysql, 'replicas', ReplicaSet([Replica('replica:3306', pool)], lag=lambda conn: 0))
+    mocker.patch('app.read_pins', ReadPins(str(tmp_path / "pins.db")))
+    return replica_cursor
+
+def auth_headers(user_store, username, role):
+    user_store.add(username, generate_password_hash('secret'), role)
+    token = jwt.encode({
+        "username": username,
+        "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    }, app.config["SECRET_KEY"], algorithm="HS256")
+    return {"Authorization": token}
+
+@pytest.fixture
+def staff_headers(user_store):
+    return auth_headers(user_store, 'staff', 'staff')
+
+@pytest.fixture
+def admin_headers(user_store):
+    return auth_headers(user_store, 'admin', 'admin')
+
 def test_index():
     client = app.test_client()
     response = client.get('/')
     assert response.status_code == 200
     assert b"VEHICLE RENTAL SYSTEM MANAGEMENT" in response.data
 
+def test_health():
+    client = app.test_client()
+    response = client.get('/health')
+
+    assert response.status_code == 200
+    assert response.get_json()["pool"]["max_size"] == 10
+
+# TESTING ON USERS
+def test_register_and_login(user_store):
+    client = app.test_client()
+    response = client.post('/register', json={'username': 'kyle', 'password': 'pw'})
+    assert response.status_code == 201
+
+    response = client.post('/login', json={'username': 'kyle', 'password': 'pw'})
+    assert response.status_code == 200
+    assert user_store.get('kyle')['token'] == response.get_json()['token']
+
+def test_register_duplicate(user_store):
+    client = app.test_client()
+    client.post('/register', json={'username': 'kyle', 'password': 'pw'})
+    response = client.post('/register', json={'username': 'kyle', 'password': 'other'})
+
+    assert response.status_code == 400
+    assert b"User already exists" in response.data
+
+def test_login_invalid_credentials(user_store):
+    client = app.test_client()
+    client.post('/register', json={'username': 'kyle', 'password': 'pw'})
+    response = client.post('/login', json={'username': 'kyle', 'password': 'wrong'})
+
+    assert response.status_code == 401
+
+def test_login_caches_verified_credentials(user_store, mocker):
+    client = app.test_client()
+    client.post('/register', json={'username': 'kyle', 'password': 'pw'})
+    kdf = mocker.patch('app.check_password_hash', return_value=True)
+
+    client.post('/login', json={'username': 'kyle', 'password': 'pw-cached'})
+    response = client.post('/login', json={'username': 'kyle', 'password': 'pw-cached'})
+
+    assert response.status_code == 200
+    assert kdf.call_count == 1
+
+def test_token_decoded_once(mock_db, staff_headers, mocker):
+    mock_db.fetchall.return_value = [(1, 'John Doe', 'john.doe@example.com')]
+    decode = mocker.spy(jwt, 'decode')
+
+    client = app.test_client()
+    client.get('/customers', headers=staff_headers)
+    response = client.get('/customers', headers=staff_headers)
+
+    assert response.status_code == 200
+    assert decode.call_count == 1
+
+def test_expired_token_rejected(mock_db):
+    token = jwt.encode({
+        "username": "staff",
+        "exp": datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    }, app.config["SECRET_KEY"], algorithm="HS256")
+
+    client = app.test_client()
+    response = client.get('/customers', headers={"Authorization": token})
+
+    assert response.status_code == 401
+    assert b"Token has expired" in response.data
+
+def test_tampered_token_rejected(mock_db, staff_headers):
+    client = app.test_client()
+    client.get('/customers', headers=staff_headers)
+    response = client.get('/customers', headers={"Authorization": staff_headers["Authorization"][:-2] + "xx"})
+
+    assert response.status_code == 401
+    assert b"Invalid token" in response.data
+
 # TESTING ON CUSTOMER
 def test_get_customers_empty(mock_db):
     mock_db.fetchall.return_value = []
@@ -34,6 +166,39 @@ def test_get_customers(mock_db):
     assert b"John Doe" in response.data
     assert b"john.doe@example.com" in response.data
 
+def test_get_customers_reads_from_replica(mock_db, replica_db, staff_headers):
+    replica_db.fetchall.return_value = [(1, 'John Doe', 'john.doe@example.com')]
+
+    client = app.test_client()
+    response = client.get('/customers', headers=staff_headers)
+
+    assert response.status_code == 200
+    assert b"John Doe" in response.data
+    mock_db.execute.assert_not_called()
+
+def test_writer_reads_own_writes_from_primary(mock_db, replica_db, staff_headers, admin_headers):
+    mock_db.lastrowid = 7
+    mock_db.fetchall.return_value = [(7, 'Ronald', 'ronald@gmail.com')]
+    replica_db.fetchall.return_value = [(1, 'John Doe', 'john.doe@example.com')]
+
+    client = app.test_client()
+    response = client.post('/customers', headers=staff_headers, json={
+        'customer_name': 'Ronald', 'customer_contact': 'ronald@gmail.com'
+    })
+    assert response.status_code == 201
+
+    assert b"Ronald" in client.get('/customers', headers=staff_headers).data
+    # Other users are not pinned
+    assert b"John Doe" in client.get('/customers', headers=admin_headers).data
+
+def test_vehicles_list_stays_on_primary(mock_db, replica_db):
+    mock_db.fetchall.return_value = [(1, 'ABC123', 'Toyota Corolla', 50.00, 'Car')]
+
+    response = app.test_client().get('/vehicles')
+
+    assert response.status_code == 200
+    replica_db.execute.assert_not_called()
+
 def test_post_customer_missing_fields(mock_db):
     client = app.test_client()
     response = client.post('/customers', json={}) 
@@ -82,6 +247,15 @@ def test_delete_customer_success(mock_db):
     
     assert b"Customer deleted successfully" in response.data
 
+def test_metrics_counts_auth_outcomes(mock_db):
+    client = app.test_client()
+    client.get('/customers')
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert b'auth_outcomes_total{check="token",outcome="missing"}' in response.data
+    assert b'route="/customers",status="401"' in response.data
+
 # TESTING ON VEHICLE
 def test_get_vehicles_empty(mock_db):
     mock_db.fetchall.return_value = []
@@ -103,6 +277,118 @@ def test_get_vehicles(mock_db):
     assert response.status_code == 200
     assert b"Toyota Corolla" in response.data
 
+def test_get_vehicles_default_page_size(mock_db):
+    mock_db.fetchall.return_value = [
+        (1, 'ABC123', 'Toyota Corolla', 50.00, 'Car')
+    ]
+
+    client = app.test_client()
+    response = client.get('/vehicles')
+
+    assert mock_db.execute.call_args[0][1] == (0, 101)
+    assert response.get_json()["next"] is None
+
+def test_get_vehicles_next_cursor(mock_db):
+    mock_db.fetchall.return_value = [
+        (3, 'ABC123', 'Toyota Corolla', 50.00, 'Car'),
+        (4, 'DEF456', 'Honda Civic', 55.00, 'Car'),
+        (7, 'GHI789', 'Ford Ranger', 80.00, 'Truck')
+    ]
+
+    client = app.test_client()
+    response = client.get('/vehicles?limit=2&after=2')
+
+    assert mock_db.execute.call_args[0][1] == (2, 3)
+    data = response.get_json()
+    assert len(data["vehicles"]) == 2
+    assert data["next"] == 4
+
+def test_get_vehicles_fields_and_filters(mock_db):
+    mock_db.fetchall.return_value = [(1, 'ABC123')]
+
+    client = app.test_client()
+    response = client.get('/vehicles?fields=reg_number&vehicle_type=Car&daily_hire_rate__lte=60')
+
+    assert response.status_code == 200
+    assert response.get_json()["vehicles"] == [{"vehicle_id": 1, "reg_number": "ABC123"}]
+    sql, params = mock_db.execute.call_args[0]
+    assert sql == (
+        "SELECT vehicle_id, reg_number FROM Vehicles "
+        "WHERE vehicle_type = %s AND daily_hire_rate <= %s AND vehicle_id > %s ORDER BY vehicle_id LIMIT %s"
+    )
+    assert params == ('Car', 60.0, 0, 101)
+
+def test_get_vehicles_unknown_filter(mock_db):
+    client = app.test_client()
+    response = client.get('/vehicles?colour=red')
+
+    assert response.status_code == 400
+    assert b"Unknown filter: colour" in response.data
+    mock_db.execute.assert_not_called()
+
+def test_get_vehicles_served_from_cache(mock_db):
+    mock_db.fetchall.return_value = [
+        (1, 'ABC123', 'Toyota Corolla', 50.00, 'Car')
+    ]
+
+    client = app.test_client()
+    first = client.get('/vehicles')
+    second = client.get('/vehicles')
+
+    assert mock_db.execute.call_count == 1
+    assert second.data == first.data
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+def test_get_vehicles_not_modified(mock_db):
+    mock_db.fetchall.return_value = [
+        (1, 'ABC123', 'Toyota Corolla', 50.00, 'Car')
+    ]
+
+    client = app.test_client()
+    etag = client.get('/vehicles').headers["ETag"]
+    response = client.get('/vehicles', headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+
+def test_get_vehicles_refetched_after_write(mock_db, staff_headers):
+    mock_db.fetchall.return_value = [
+        (1, 'ABC123', 'Toyota Corolla', 50.00, 'Car')
+    ]
+
+    client = app.test_client()
+    etag = client.get('/vehicles').headers["ETag"]
+    client.put('/vehicles/1', headers=staff_headers, json={
+        'reg_number': 'ABC123', 'model_name': 'Toyota Yaris', 'daily_hire_rate': 50.00, 'vehicle_type': 'Car'
+    })
+    mock_db.fetchall.return_value = [
+        (1, 'ABC123', 'Toyota Yaris', 50.00, 'Car')
+    ]
+    response = client.get('/vehicles', headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert b"Toyota Yaris" in response.data
+
+def test_get_vehicles_cached_gzip_is_compressed_once(mock_db, mocker):
+    mock_db.fetchall.return_value = [
+        (n, f'REG{n:03d}', 'Toyota Corolla', 50.00, 'Car') for n in range(1, 51)
+    ]
+    compress = mocker.spy(compressor, 'compress')
+
+    client = app.test_client()
+    plain = client.get('/vehicles')
+    first = client.get('/vehicles', headers={"Accept-Encoding": "gzip"})
+    second = client.get('/vehicles', headers={"Accept-Encoding": "gzip"})
+
+    assert first.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(first.data) == plain.data
+    assert second.data == first.data
+    assert compress.call_count == 1
+    assert first.headers["ETag"] != plain.headers["ETag"]
+
+    response = client.get('/vehicles', headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["ETag"]})
+    assert response.status_code == 304
+
 def test_post_vehicle_missing_fields(mock_db):
     client = app.test_client()
     response = client.post('/vehicles', json={}) 
@@ -119,6 +405,49 @@ def test_post_vehicle_success(mock_db):
     
     assert b"Vehicle created successfully", "vehicle_id" in response.data
 
+def test_post_vehicles_bulk(mock_db, staff_headers):
+    mock_db.lastrowid = 10
+
+    client = app.test_client()
+    response = client.post('/vehicles/bulk', headers=staff_headers, json=[
+        {'reg_number': 'FSA123', 'model_name': 'Mirage', 'daily_hire_rate': 50.00, 'vehicle_type': 'Sedan'},
+        {'reg_number': 'FSA124', 'model_name': 'Mirage'},
+        {'reg_number': 'FSA125', 'model_name': 'Vios', 'daily_hire_rate': 55.00, 'vehicle_type': 'Sedan'}
+    ])
+
+    assert response.status_code == 207
+    data = response.get_json()
+    assert data["ids"] == [10, None, 11]
+    assert data["errors"] == [{"index": 1, "error": "Daily hire rate is required and must be a valid number"}]
+    assert mock_db.executemany.call_count == 1
+    assert len(mock_db.executemany.call_args[0][1]) == 2
+
+def test_post_vehicles_bulk_atomic_rejects_invalid_items(mock_db, staff_headers):
+    client = app.test_client()
+    response = client.post('/vehicles/bulk?atomic=true', headers=staff_headers, json=[
+        {'reg_number': 'FSA123', 'model_name': 'Mirage', 'daily_hire_rate': 50.00, 'vehicle_type': 'Sedan'},
+        {'reg_number': 'FSA124'}
+    ])
+
+    assert response.status_code == 400
+    mock_db.executemany.assert_not_called()
+
+def test_post_vehicles_bulk_reports_database_errors_per_item(mock_db, staff_headers):
+    mock_db.executemany.side_effect = Exception("Duplicate entry 'FSA123'")
+    mock_db.execute.side_effect = [Exception("Duplicate entry 'FSA123'"), None]
+    mock_db.lastrowid = 12
+
+    client = app.test_client()
+    response = client.post('/vehicles/bulk', headers=staff_headers, json=[
+        {'reg_number': 'FSA123', 'model_name': 'Mirage', 'daily_hire_rate': 50.00, 'vehicle_type': 'Sedan'},
+        {'reg_number': 'FSA125', 'model_name': 'Vios', 'daily_hire_rate': 55.00, 'vehicle_type': 'Sedan'}
+    ])
+
+    assert response.status_code == 207
+    data = response.get_json()
+    assert data["ids"] == [None, 12]
+    assert data["errors"][0]["index"] == 0
+
 def test_put_vehicle_missing_fields(mock_db):
     client = app.test_client()
     response = client.put('/vehicles/1', json={}) 
@@ -153,6 +482,151 @@ def test_delete_vehicle_success(mock_db):
     
     assert b"Vehicle deleted successfully" in response.data
 
+def test_delete_vehicle_commits_once(mock_db, mock_conn, admin_headers):
+    mock_db.rowcount = 1
+
+    client = app.test_client()
+    response = client.delete('/vehicles/1', headers=admin_headers)
+
+    assert response.status_code == 200
+    assert mock_db.execute.call_count == 6
+    assert mock_conn.commit.call_count == 1
+
+def test_delete_vehicle_not_found_rolls_back(mock_db, mock_conn, admin_headers):
+    mock_db.rowcount = 0
+
+    client = app.test_client()
+    response = client.delete('/vehicles/999', headers=admin_headers)
+
+    assert response.status_code == 404
+    mock_conn.commit.assert_not_called()
+    mock_conn.rollback.assert_called_once()
+
+def test_delete_vehicles_bulk(mock_db, mock_conn, admin_headers, change_log):
+    mock_db.fetchall.side_effect = [[(1,), (3,)], [(4,)], [(9,), (7,)]]
+
+    client = app.test_client()
+    response = client.delete('/vehicles/bulk', headers=admin_headers, json={'ids': [1, 2, 3, 3]})
+
+    assert response.status_code == 200
+    assert response.get_json() == {"deleted": 2, "not_found": [2]}
+    statements = [c[0][0] for c in mock_db.execute.call_args_list]
+    assert statements == [
+        "SELECT vehicle_id FROM Vehicles WHERE vehicle_id IN (%s, %s, %s) FOR UPDATE",
+        "DELETE FROM RentalVehicleStats WHERE vehicle_id IN (%s, %s)",
+        "SELECT location_id FROM Locations WHERE vehicle_id IN (%s, %s) FOR UPDATE",
+        "UPDATE Locations SET vehicle_id = NULL WHERE vehicle_id IN (%s, %s)",
+        "SELECT rental_id FROM Rentals WHERE vehicle_id IN (%s, %s) FOR UPDATE",
+        "UPDATE Rentals SET vehicle_id = NULL WHERE vehicle_id IN (%s, %s)",
+        "DELETE FROM Vehicles WHERE vehicle_id IN (%s, %s)"
+    ]
+    assert mock_conn.commit.call_count == 1
+    assert [row[1:] for row in change_log.since(0)] == [
+        ("vehicles", "deleted", "[1, 3]"),
+        ("locations", "updated", "[4]"),
+        ("rentals", "updated", "[7, 9]"),
+    ]
+
+def test_delete_vehicle_publishes_detached_locations_and_rentals(mock_db, admin_headers, change_log):
+    mock_db.rowcount = 1
+    mock_db.fetchall.side_effect = [[(4,), (2,)], [(8,)]]
+
+    client = app.test_client()
+    response = client.delete('/vehicles/1', headers=admin_headers)
+
+    assert response.status_code == 200
+    assert [row[1:] for row in change_log.since(0)] == [
+        ("vehicles", "deleted", "[1]"),
+        ("locations", "updated", "[2, 4]"),
+        ("rentals", "updated", "[8]"),
+    ]
+
+def test_delete_customer_publishes_detached_rentals(mock_db, admin_headers, change_log):
+    mock_db.rowcount = 1
+    mock_db.fetchall.return_value = [(5,), (6,)]
+
+    client = app.test_client()
+    response = client.delete('/customers/1', headers=admin_headers)
+
+    assert response.status_code == 200
+    assert change_log.since(0) == [(1, "rentals", "updated", "[5, 6]")]
+
+def test_delete_rentals_bulk_publishes_each_deleted_id_once(mock_db, admin_headers, change_log):
+    mock_db.fetchall.side_effect = [[(3,), (1,)], []]
+
+    client = app.test_client()
+    response = client.delete('/rentals/bulk', headers=admin_headers, json={'ids': [1, 3, 3, 5]})
+
+    assert response.get_json() == {"deleted": 2, "not_found": [5]}
+    assert change_log.since(0) == [(1, "rentals", "deleted", "[1, 3]")]
+
+def test_delete_vehicles_bulk_requires_ids(mock_db, admin_headers):
+    client = app.test_client()
+    response = client.delete('/vehicles/bulk', headers=admin_headers, json={'ids': ['1']})
+
+    assert response.status_code == 400
+
+def test_get_available_vehicles(mock_db, mocker):
+    mocker.patch.object(fleet, '_load', return_value=[
+        (1, 'ABC123', 'Toyota Corolla', 50.00, 'Car', 1, 'Kampala'),
+        (2, 'DEF456', 'Honda Civic', 55.00, 'Car', 2, 'Entebbe'),
+        (3, 'GHI789', 'Ford Ranger', 80.00, 'Truck', 1, 'Kampala')
+    ])
+    mocker.patch.object(rental_index, '_load', return_value=[
+        (1, 1, datetime.date(2021, 9, 1), datetime.date(2021, 9, 5))
+    ])
+    mocker.patch.object(rental_index, '_today', return_value=datetime.date(2021, 9, 1))
+
+    client = app.test_client()
+    response = client.get('/vehicles/available?from=2021-09-04&to=2021-09-06&type=Car')
+
+    assert response.status_code == 200
+    assert [v["vehicle_id"] for v in response.get_json()["vehicles"]] == [2]
+
+    response = client.get('/vehicles/available?from=2021-09-06&to=2021-09-08&location=Kampala')
+    assert [v["vehicle_id"] for v in response.get_json()["vehicles"]] == [1, 3]
+
+def test_get_available_vehicles_invalid_dates(mock_db):
+    client = app.test_client()
+
+    assert client.get('/vehicles/available?from=2021-09-06').status_code == 400
+    assert client.get('/vehicles/available?from=2021-09-06&to=2021-09-01').status_code == 400
+
+def test_get_available_vehicles_before_the_index_asks_mysql(mock_db, mocker):
+    mocker.patch.object(fleet, '_load', return_value=[
+        (1, 'ABC123', 'Toyota Corolla', 50.00, 'Car', 1, 'Kampala'),
+        (2, 'DEF456', 'Honda Civic', 55.00, 'Car', 2, 'Entebbe')
+    ])
+    mocker.patch.object(rental_index, '_load', return_value=[])
+    mocker.patch.object(rental_index, '_today', return_value=datetime.date(2021, 9, 10))
+    mock_db.fetchall.return_value = [(2,)]
+
+    client = app.test_client()
+    response = client.get('/vehicles/available?from=2021-09-04&to=2021-09-06')
+
+    assert [v["vehicle_id"] for v in response.get_json()["vehicles"]] == [1]
+    assert mock_db.execute.call_args[0][1] == (datetime.date(2021, 9, 4), datetime.date(2021, 9, 6))
+
+def test_add_rental_updates_availability_index(mock_db, staff_headers, mocker):
+    mocker.patch.object(rental_index, '_load', return_value=[])
+    load_ids = mocker.patch.object(rental_index, '_load_ids', return_value=[(7, 1, datetime.date(2021, 9, 1), datetime.date(2021, 9, 2))])
+    mocker.patch.object(rental_index, '_today', return_value=datetime.date(2021, 9, 1))
+    rental_index.ensure_current()
+    reloads = rental_index.reloads
+    mock_db.fetchone.side_effect = [(1,), None]
+    mock_db.lastrowid = 7
+
+    client = app.test_client()
+    client.post('/rentals', headers=staff_headers, json={
+        'customer_id': 1, 'vehicle_id': 1, 'date_from': '2021-09-01', 'date_to': '2021-09-02', 'total_cost': 100.00
+    })
+    rental_index.ensure_current()
+
+    # The rental comes back through the change feed, as one from another worker would
+    load_ids.assert_called_once_with([7], datetime.date(2021, 9, 1))
+    assert rental_index.overlapping(1, datetime.date(2021, 9, 2), datetime.date(2021, 9, 3)) == [7]
+    assert rental_index.reloads == reloads
+
 # TESTING ON LOCATIONS
 
 def test_get_locations_empty(mock_db):
@@ -246,6 +720,61 @@ def test_get_rentals(mock_db):
     assert response.status_code == 200
     assert b"2021-09-01" in response.data
 
+def test_export_rentals_ndjson(mock_db, staff_headers):
+    mock_db.fetchmany.side_effect = [
+        [(1, 1, 1, '2021-09-01', '2021-09-02', 100.00)],
+        [(2, 1, 2, '2021-09-03', '2021-09-04', 120.00)],
+        []
+    ]
+
+    client = app.test_client()
+    response = client.get('/rentals/export', headers=staff_headers)
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.data.decode().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[1])["rental_id"] == 2
+    mock_db.close.assert_called_once()
+
+def test_export_rentals_ndjson_gzip(mock_db, staff_headers):
+    mock_db.fetchmany.side_effect = [
+        [(n, 1, 1, '2021-09-01', '2021-09-02', 100.00) for n in range(1, 101)],
+        [(n, 1, 2, '2021-09-03', '2021-09-04', 120.00) for n in range(101, 201)],
+        []
+    ]
+
+    client = app.test_client()
+    response = client.get('/rentals/export', headers={**staff_headers, "Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert len(lines) == 200
+    assert json.loads(lines[-1])["rental_id"] == 200
+    mock_db.close.assert_called_once()
+
+def test_export_rentals_csv(mock_db, staff_headers):
+    mock_db.fetchmany.side_effect = [
+        [(1, 1, 1, '2021-09-01', '2021-09-02', 100.00)],
+        []
+    ]
+
+    client = app.test_client()
+    response = client.get('/rentals/export?format=csv', headers=staff_headers)
+
+    assert response.status_code == 200
+    assert response.data.decode().splitlines() == [
+        "rental_id,customer_id,vehicle_id,date_from,date_to,total_cost",
+        "1,1,1,2021-09-01,2021-09-02,100.0"
+    ]
+
+def test_export_rentals_invalid_format(mock_db, staff_headers):
+    client = app.test_client()
+    response = client.get('/rentals/export?format=xml', headers=staff_headers)
+
+    assert response.status_code == 400
+
 def test_post_rental_missing_fields(mock_db):
     client = app.test_client()
     response = client.post('/rentals', json={}) 
@@ -262,6 +791,239 @@ def test_post_rental_success(mock_db):
     
     assert b"Rental created successfully", "rental_id" in response.data
 
+def test_post_rental_double_booking(mock_db, staff_headers):
+    mock_db.fetchone.side_effect = [(1,), (4, 2, 1, '2021-09-02', '2021-09-05', 200.00)]
+
+    client = app.test_client()
+    response = client.post('/rentals', headers=staff_headers, json={
+        'customer_id': 1, 'vehicle_id': 1, 'date_from': '2021-09-01', 'date_to': '2021-09-02', 'total_cost': 100.00
+    })
+
+    assert response.status_code == 409
+    assert response.get_json()["conflict"]["rental_id"] == 4
+    assert "FOR UPDATE" in mock_db.execute.call_args_list[0][0][0]
+    # A locking read, so the check sees rentals committed after this transaction's snapshot
+    assert mock_db.execute.call_args_list[1][0][0].endswith("LIMIT 1 LOCK IN SHARE MODE")
+    assert mock_db.execute.call_args_list[1][0][1] == (1, '2021-09-01', '2021-09-02', 0)
+
+def test_post_rental_retry_with_idempotency_key(mock_db, staff_headers, mocker, tmp_path):
+    mocker.patch('app.idempotency.store', IdempotencyStore(str(tmp_path / "idempotency.db")))
+    mock_db.fetchone.side_effect = [(1,), None]
+    mock_db.lastrowid = 7
+    headers = {**staff_headers, "Idempotency-Key": "rental-123"}
+    body = {'customer_id': 1, 'vehicle_id': 1, 'date_from': '2021-09-01', 'date_to': '2021-09-02', 'total_cost': 100.00}
+
+    client = app.test_client()
+    first = client.post('/rentals', headers=headers, json=body)
+    executed = mock_db.execute.call_count
+    second = client.post('/rentals', headers=headers, json=body)
+
+    assert first.status_code == second.status_code == 201
+    assert second.get_json() == first.get_json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert mock_db.execute.call_count == executed
+
+def test_post_rental_unknown_vehicle(mock_db, staff_headers):
+    mock_db.fetchone.return_value = None
+
+    client = app.test_client()
+    response = client.post('/rentals', headers=staff_headers, json={
+        'customer_id': 1, 'vehicle_id': 99, 'date_from': '2021-09-01', 'date_to': '2021-09-02', 'total_cost': 100.00
+    })
+
+    assert response.status_code == 404
+    assert b"Vehicle not found" in response.data
+
+def test_post_rental_dates_out_of_order(mock_db, staff_headers):
+    client = app.test_client()
+    response = client.post('/rentals', headers=staff_headers, json={
+        'customer_id': 1, 'vehicle_id': 1, 'date_from': '2021-09-05', 'date_to': '2021-09-02', 'total_cost': 100.00
+    })
+
+    assert response.status_code == 400
+    assert b"Date from must not be after date to" in response.data
+
+def test_post_rental_rejects_basic_and_week_dates(mock_db, staff_headers, mocker):
+    mocker.patch.object(rate_table, '_load', return_value=[(1, 50.00)])
+
+    client = app.test_client()
+    for date_from in ('20240501', '2024-W01-1'):
+        response = client.post('/rentals', headers=staff_headers, json={
+            'customer_id': 1, 'vehicle_id': 1, 'date_from': date_from, 'date_to': '2024-05-03'
+        })
+
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "Dates must be valid dates (YYYY-MM-DD)"
+    mock_db.execute.assert_not_called()
+
+def test_put_rental_excludes_itself_from_conflicts(mock_db, staff_headers):
+    mock_db.fetchone.side_effect = [(2, datetime.date(2021, 9, 1), datetime.date(2021, 9, 2), 100.00), (1,), None]
+    mock_db.rowcount = 1
+
+    client = app.test_client()
+    response = client.put('/rentals/4', headers=staff_headers, json={
+        'customer_id': 1, 'vehicle_id': 1, 'date_from': '2021-09-01', 'date_to': '2021-09-03', 'total_cost': 150.00
+    })
+
+    assert response.status_code == 200
+    assert mock_db.execute.call_args_list[2][0][1] == (1, '2021-09-01', '2021-09-03', 4)
+
+def test_put_rental_moves_summary_totals(mock_db, staff_headers):
+    mock_db.fetchone.side_effect = [(2, datetime.date(2021, 9, 1), datetime.date(2021, 9, 2), 100.00), (1,), None]
+    mock_db.rowcount = 1
+
+    client = app.test_client()
+    response = client.put('/rentals/4', headers=staff_headers, json={
+        'customer_id': 1, 'vehicle_id': 1, 'date_from': '2021-09-02', 'date_to': '2021-09-03', 'total_cost': 150.00
+    })
+
+    assert response.status_code == 200
+    vehicle_stats, daily_stats = [c[0][1] for c in mock_db.executemany.call_args_list]
+    assert vehicle_stats == [(1, 1, 2, 150.0), (2, -1, -2, -100.0)]
+    assert daily_stats == [
+        (datetime.date(2021, 9, 1), -1, -100.0, -1),
+        (datetime.date(2021, 9, 2), 1, 150.0, 0),
+        (datetime.date(2021, 9, 3), 0, 0.0, 1)
+    ]
+
+def test_put_rental_reprices_for_new_vehicle_and_dates(mock_db, staff_headers, mocker):
+    mocker.patch.object(rate_table, '_load', return_value=[(1, 50.00), (3, 80.00)])
+    mock_db.fetchone.side_effect = [(1, datetime.date(2021, 9, 1), datetime.date(2021, 9, 2), 100.00), (3,), None]
+    mock_db.rowcount = 1
+
+    client = app.test_client()
+    response = client.put('/rentals/4', headers=staff_headers, json={
+        'customer_id': 1, 'vehicle_id': 3, 'date_from': '2021-09-01', 'date_to': '2021-09-03'
+    })
+
+    assert response.status_code == 200
+    assert response.get_json()["total_cost"] == 240.0
+    update = [c[0] for c in mock_db.execute.call_args_list if c[0][0].startswith("UPDATE Rentals")]
+    assert update[0][1] == (1, 3, '2021-09-01', '2021-09-03', 240.0, 4)
+
+def test_put_rental_not_found(mock_db, staff_headers):
+    mock_db.fetchone.return_value = None
+
+    client = app.test_client()
+    response = client.put('/rentals/999', headers=staff_headers, json={
+        'customer_id': 1, 'vehicle_id': 1, 'date_from': '2021-09-01', 'date_to': '2021-09-03', 'total_cost': 150.00
+    })
+
+    assert response.status_code == 404
+
+def test_post_rentals_bulk_rejects_overlaps(mock_db, staff_headers):
+    mock_db.fetchall.side_effect = [
+        [(1,), (2,)],
+        [(4, 2, datetime.date(2021, 9, 1), datetime.date(2021, 9, 3))]
+    ]
+    mock_db.lastrowid = 20
+
+    client = app.test_client()
+    response = client.post('/rentals/bulk', headers=staff_headers, json=[
+        {'customer_id': 1, 'vehicle_id': 1, 'date_from': '2021-09-01', 'date_to': '2021-09-02', 'total_cost': 100.00},
+        {'customer_id': 1, 'vehicle_id': 1, 'date_from': '2021-09-02', 'date_to': '2021-09-04', 'total_cost': 100.00},
+        {'customer_id': 1, 'vehicle_id': 2, 'date_from': '2021-09-03', 'date_to': '2021-09-04', 'total_cost': 100.00}
+    ])
+
+    assert response.status_code == 207
+    data = response.get_json()
+    assert data["ids"] == [20, None, None]
+    assert data["errors"][0]["conflict_position"] == 0
+    assert data["errors"][1]["conflict_rental_id"] == 4
+    overlap_query = mock_db.execute.call_args_list[1][0][0]
+    assert overlap_query.startswith("SELECT rental_id, vehicle_id, date_from, date_to FROM Rentals")
+    assert overlap_query.endswith("LOCK IN SHARE MODE")
+
+def test_post_rental_prices_server_side(mock_db, staff_headers, mocker):
+    mocker.patch.object(rate_table, '_load', return_value=[(1, 50.00)])
+    mock_db.fetchone.side_effect = [(1,), None]
+    mock_db.lastrowid = 7
+
+    client = app.test_client()
+    response = client.post('/rentals', headers=staff_headers, json={
+        'customer_id': 1, 'vehicle_id': 1, 'date_from': '2021-09-01', 'date_to': '2021-09-03'
+    })
+
+    assert response.status_code == 201
+    assert response.get_json()["total_cost"] == 150.0
+    assert mock_db.execute.call_args_list[-1][0][1] == (1, 1, '2021-09-01', '2021-09-03', 150.0)
+
+def test_post_quotes(mock_db, mocker):
+    mocker.patch.object(rate_table, '_load', return_value=[(1, 50.00), (2, 80.00)])
+
+    client = app.test_client()
+    response = client.post('/quotes', json=[
+        {'vehicle_id': 1, 'date_from': '2021-09-01', 'date_to': '2021-09-02'},
+        {'vehicle_id': 2, 'date_from': '2021-09-01', 'date_to': '2021-09-01'},
+        {'vehicle_id': 9, 'date_from': '2021-09-01', 'date_to': '2021-09-01'},
+        {'vehicle_id': 1, 'date_from': '2021-09-05', 'date_to': '2021-09-01'}
+    ])
+
+    assert response.status_code == 200
+    quotes = response.get_json()["quotes"]
+    assert [quote.get("total_cost") for quote in quotes] == [100.0, 80.0, None, None]
+    assert quotes[0]["days"] == 2
+    assert quotes[2]["error"] == "Vehicle not found"
+    assert quotes[3]["error"] == "Date from must not be after date to"
+
+def test_post_quotes_rejects_basic_and_week_dates(mock_db, mocker):
+    mocker.patch.object(rate_table, '_load', return_value=[(1, 50.00)])
+
+    client = app.test_client()
+    response = client.post('/quotes', json=[
+        {'vehicle_id': 1, 'date_from': '2024-W01-1', 'date_to': '2024-01-03'},
+        {'vehicle_id': 1, 'date_from': '20240501', 'date_to': '2024-05-03'},
+        {'vehicle_id': 1, 'date_from': '2024-05-01', 'date_to': '2024-05-03'}
+    ])
+
+    assert response.status_code == 200
+    quotes = response.get_json()["quotes"]
+    assert quotes[0] == quotes[1] == {"error": "Dates must be valid dates (YYYY-MM-DD)"}
+    assert quotes[2]["days"] == 3
+
+def test_rebuild_aggregates_command(mock_conn, mock_db, mocker):
+    mocker.patch('app.load_rental_totals', return_value=[
+        (1, datetime.date(2021, 9, 1), datetime.date(2021, 9, 2), 100.00),
+        (2, datetime.date(2021, 9, 2), datetime.date(2021, 9, 2), 80.00),
+    ])
+
+    result = app.test_cli_runner().invoke(args=['rebuild-aggregates'])
+
+    assert result.exit_code == 0
+    assert result.output == "Rebuilt totals for 2 vehicles and 2 days\n"
+    mock_conn.commit.assert_called_once()
+
+def test_get_daily_stats(mock_db, staff_headers):
+    mock_db.fetchall.return_value = [(datetime.date(2021, 9, 2), 1, 150.00, 2)]
+    mock_db.fetchone.return_value = (4,)
+
+    client = app.test_client()
+    response = client.get('/stats/daily?from=2021-09-01&to=2021-09-02', headers=staff_headers)
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [day["vehicles_out"] for day in data["days"]] == [0, 2]
+    assert data["days"][1]["utilization"] == 0.5
+    assert data["revenue"] == 150.0
+    assert data["utilization"] == 0.25
+
+def test_get_daily_stats_limits_range(mock_db, staff_headers):
+    client = app.test_client()
+    response = client.get('/stats/daily?from=2020-01-01&to=2021-09-02', headers=staff_headers)
+
+    assert response.status_code == 400
+
+def test_get_vehicle_type_revenue(mock_db, staff_headers):
+    mock_db.fetchall.return_value = [('Car', 2, 5, 12, 900.00), ('Truck', 1, 1, 3, 240.00)]
+
+    client = app.test_client()
+    response = client.get('/stats/revenue/vehicle-types', headers=staff_headers)
+
+    assert response.status_code == 200
+    assert response.get_json()["vehicle_types"][0] == {
+        "vehicle_type": "Car", "vehicles": 2, "rentals": 5, "rental_days": 12, "revenue": 900.0
+    }
+
 def test_put_rental_missing_fields(mock_db):
     client = app.test_client()
     response = client.put('/rentals/1', json={}) 
@@ -296,5 +1058,267 @@ def test_delete_rental_success(mock_db):
     
     assert b"Rental deleted successfully" in response.data
 
+@pytest.fixture
+def change_log(mocker, tmp_path):
+    log = EventLog(str(tmp_path / "change_log.db"))
+    mocker.patch('app.change_log', log)
+    mocker.patch.object(rental_index, 'log', log)
+    return log
+
+def test_writes_publish_change_events(mock_db, staff_headers, admin_headers, change_log):
+    mock_db.rowcount = 1
+    mock_db.lastrowid = 10
+    client = app.test_client()
+
+    client.post('/vehicles/bulk', headers=staff_headers, json=[
+        {'reg_number': 'FSA123', 'model_name': 'Mirage', 'daily_hire_rate': 50.00, 'vehicle_type': 'Sedan'},
+        {'reg_number': 'FSA124', 'model_name': 'Mirage'},
+        {'reg_number': 'FSA125', 'model_name': 'Vios', 'daily_hire_rate': 55.00, 'vehicle_type': 'Sedan'}
+    ])
+    client.put('/locations/4', headers=staff_headers, json={'location_name': 'Airport', 'vehicle_id': 10})
+    client.delete('/rentals/7', headers=admin_headers)
+
+    assert change_log.since(0) == [
+        (1, "vehicles", "created", "[10, 11]"),
+        (2, "locations", "updated", "[4]"),
+        (3, "rentals", "deleted", "[7]"),
+    ]
+
+def test_failed_writes_publish_nothing(mock_db, admin_headers, change_log):
+    mock_db.rowcount = 0
+
+    client = app.test_client()
+    response = client.delete('/vehicles/999', headers=admin_headers)
+
+    assert response.status_code == 404
+    assert change_log.since(0) == []
+
+def test_events_stream_resumes_from_last_event_id(mocker, change_log):
+    mocker.patch.dict(app.config, {"EVENTS_SYNC_STREAM_SECONDS": 0})
+    change_log.append("vehicles", "updated", [1])
+    change_log.append("rentals", "created", [2])
+    change_log.append("locations", "deleted", [3])
+
+    client = app.test_client()
+    response = client.get('/events', headers={'Last-Event-ID': '1'})
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert response.data == (
+        b"retry: 3000\n\n"
+        b'id: 3\nevent: locations\ndata: {"seq":3,"action":"deleted","ids":[3]}\n\n'
+    )
+
+def test_events_rentals_topic_requires_staff(mocker, user_store, staff_headers):
+    mocker.patch.dict(app.config, {"EVENTS_SYNC_STREAM_SECONDS": 0})
+    client = app.test_client()
+
+    assert client.get('/events?topics=rentals').status_code == 401
+    assert client.get('/events?topics=rentals', headers=auth_headers(user_store, 'kiosk', 'user')).status_code == 403
+    assert client.get('/events?topics=rentals', headers=staff_headers).status_code == 200
+    assert client.get('/events?topics=customers').get_json() == {"error": "Unknown topic: customers"}
+
+def test_vehicles_since_returns_changes_and_tombstones(mock_db):
+    mock_db.fetchone.side_effect = [(20, 12), (0,)]
+    mock_db.fetchall.side_effect = [
+        [(3, 'FSA123', 'Mirage', 50.0, 'Sedan', 11)],
+        [(8, 10), (9, 11)],
+    ]
+
+    client = app.test_client()
+    response = client.get('/vehicles?since=9&after=2')
+
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "vehicles": [{"vehicle_id": 3, "reg_number": "FSA123", "model_name": "Mirage", "daily_hire_rate": 50.0, "vehicle_type": "Sedan"}],
+        "deleted": [8, 9],
+        "version": 12,
+        "after": None,
+        "more": False,
+    }
+    # The horizon is read before the table, so the rows read after it include every change below it
+    assert [call[0] for call in mock_db.execute.call_args_list[:2]] == [
+        ("SELECT sync_clock(), sync_horizon(%s)", (1000000,)),
+        ("SELECT pruned_version FROM SyncTables WHERE table_name = %s", ("Vehicles",)),
+    ]
+    sql, params = mock_db.execute.call_args_list[2][0]
+    assert sql.endswith(
+        "FROM Vehicles WHERE row_version >= %s AND (row_version > %s OR vehicle_id > %s) AND row_version < %s "
+        "ORDER BY row_version, vehicle_id LIMIT %s"
+    )
+    assert params == (9, 9, 2, 12, 101)
+    assert mock_db.execute.call_args_list[3][0][1] == ("Vehicles", 9, 9, 2, 12, 101)
+
+def test_rentals_since_cuts_ties_by_id_on_the_primary(mock_db, replica_db, staff_headers):
+    mock_db.fetchone.side_effect = [(20, 12), (0,)]
+    mock_db.fetchall.side_effect = [[(4, 10), (7, 10)], [(5, 10)]]
+
+    client = app.test_client()
+    data = client.get('/rentals?since=9&limit=2&fields=rental_id', headers=staff_headers).get_json()
+
+    # Three changes from one statement: the page ends between two of them, so the next one
+    # resumes from version 10 after rental 5
+    assert data == {"rentals": [{"rental_id": 4}], "deleted": [5], "version": 10, "after": 5, "more": True}
+    # Versions are stamped on the primary's clock, so the sync does not read from a replica
+    replica_db.execute.assert_not_called()
+
+def test_locations_since_rejects_bad_and_stale_versions(mock_db):
+    # (clock, horizon) then pruned_version, for each request that gets past the argument check
+    mock_db.fetchone.side_effect = [(20, 12), (5,), (20, 12), (5,), (20, 12), None]
+    client = app.test_client()
+
+    assert client.get('/locations?since=abc').get_json() == {"error": "Since must be a non-negative integer"}
+    assert client.get('/locations?since=4').status_code == 410
+    # Ahead of the clock, which went back after the version was handed out
+    assert client.get('/locations?since=21').status_code == 410
+    assert client.get('/locations?since=6').status_code == 501
+
+def test_locations_since_waits_while_the_horizon_is_behind(mock_db):
+    # The oldest open transaction holds the horizon below the client's version: nothing is sent
+    # until it commits, and the version does not go back
+    mock_db.fetchone.side_effect = [(20, 12), (5,)]
+    mock_db.fetchall.side_effect = [[], []]
+
+    data = app.test_client().get('/locations?since=15&after=3').get_json()
+
+    assert data == {"locations": [], "deleted": [], "version": 15, "after": None, "more": False}
+    assert mock_db.execute.call_args_list[2][0][1][-2:] == (15, 101)
+
+def test_prune_tombstones_command(mock_conn, mock_db):
+    mock_db.fetchall.return_value = [("Vehicles", 500)]
+    mock_db.rowcount = 3
+
+    result = app.test_cli_runner().invoke(args=['prune-tombstones', '--days', '1'])
+
+    assert result.exit_code == 0
+    assert result.output == "Pruned 3 tombstones from 1 tables\n"
+    assert [call[0][1] for call in mock_db.execute.call_args_list] == [(86400000000,), ("Vehicles", 500), (501, "Vehicles")]
+    mock_conn.commit.assert_called_once()
+
+@pytest.fixture
+def batch_conn(mocker):
+    # A real pool over one mocked connection, so the batch's connection swap is exercised
+    conn = mocker.MagicMock()
+    mocker.patch.object(mysql, 'pool', ConnectionPool(lambda: conn))
+    return conn
+
+def transaction_calls(conn):
+    # The last rollback is the pool resetting the connection on release
+    return [call[0] for call in conn.method_calls if call[0] in ("commit", "rollback")]
+
+def batch_statements(conn):
+    return [call[0][0] for call in conn.cursor.return_value.execute.call_args_list if call[0][0].startswith(("SAVEPOINT", "ROLLBACK"))]
+
+def test_batch_runs_operations_in_one_transaction(batch_conn, staff_headers, change_log):
+    batch_conn.cursor.return_value.lastrowid = 7
+    batch_conn.cursor.return_value.rowcount = 1
+
+    client = app.test_client()
+    response = client.post('/batch', headers=staff_headers, json={"operations": [
+        {"method": "POST", "path": "/vehicles", "body": {
+            "reg_number": "FSA123", "model_name": "Mirage", "daily_hire_rate": 50.00, "vehicle_type": "Sedan"
+        }},
+        {"method": "PUT", "path": "/locations/4", "body": {"location_name": "Airport", "vehicle_id": "$0.vehicle_id"}},
+        {"method": "PUT", "path": "/vehicles/$0.vehicle_id", "body": {
+            "reg_number": "FSA123", "model_name": "Mirage", "daily_hire_rate": 45.00, "vehicle_type": "Sedan"
+        }}
+    ]})
+
+    assert response.status_code == 200
+    assert [result["status"] for result in response.get_json()["results"]] == [201, 200, 200]
+    assert response.get_json()["results"][0]["body"]["vehicle_id"] == 7
+    executed = [call[0] for call in batch_conn.cursor.return_value.execute.call_args_list]
+    assert ("UPDATE Locations SET location_name = %s, vehicle_id = %s, is_available = %s WHERE location_id = %s", ("Airport", 7, True, 4)) in executed
+    assert transaction_calls(batch_conn) == ["commit", "rollback"]
+    assert [row[1:3] for row in change_log.since(0)] == [("vehicles", "created"), ("locations", "updated"), ("vehicles", "updated")]
+
+def test_batch_rolls_back_failed_operation_only(batch_conn, staff_headers, change_log):
+    batch_conn.cursor.return_value.lastrowid = 7
+
+    client = app.test_client()
+    response = client.post('/batch', headers=staff_headers, json={"operations": [
+        {"method": "POST", "path": "/customers", "body": {"customer_name": "Kyle", "customer_contact": "0700"}},
+        {"method": "POST", "path": "/vehicles", "body": {"reg_number": "FSA123"}},
+        {"method": "PUT", "path": "/customers/$1.vehicle_id", "body": {}},
+        {"method": "GET", "path": "/customers"},
+        {"method": "POST", "path": "/nowhere"}
+    ]})
+
+    assert response.status_code == 207
+    results = response.get_json()["results"]
+    assert [result["status"] for result in results] == [201, 400, 400, 400, 404]
+    assert results[2]["body"] == {"error": "$1.vehicle_id refers to a failed operation"}
+    assert batch_statements(batch_conn).count("ROLLBACK TO SAVEPOINT batch_operation") == 4
+    assert transaction_calls(batch_conn) == ["commit", "rollback"]
+    assert change_log.since(0) == []
+
+def test_batch_rental_after_other_operations_uses_locking_overlap_read(batch_conn, staff_headers, change_log):
+    # The batch's snapshot was taken by the first operation, so only a locking read sees a rental
+    # another worker committed since then
+    cursor = batch_conn.cursor.return_value
+    cursor.lastrowid = 5
+    cursor.fetchone.side_effect = [(3,), (9, 1, 3, datetime.date(2024, 5, 2), datetime.date(2024, 5, 4), 100.00)]
+
+    client = app.test_client()
+    response = client.post('/batch', headers=staff_headers, json={"operations": [
+        {"method": "POST", "path": "/customers", "body": {"customer_name": "Kyle", "customer_contact": "0700"}},
+        {"method": "POST", "path": "/rentals", "body": {
+            "customer_id": "$0.customer_id", "vehicle_id": 3, "date_from": "2024-05-01", "date_to": "2024-05-03", "total_cost": 150.00
+        }}
+    ]})
+
+    assert response.status_code == 207
+    results = response.get_json()["results"]
+    assert [result["status"] for result in results] == [201, 409]
+    assert results[1]["body"]["conflict"]["rental_id"] == 9
+    overlap = [call[0] for call in cursor.execute.call_args_list if call[0][0].startswith("SELECT rental_id")]
+    assert overlap == [(
+        "SELECT rental_id, customer_id, vehicle_id, date_from, date_to, total_cost FROM Rentals "
+        "WHERE vehicle_id = %s AND date_to >= %s AND date_from <= %s AND rental_id <> %s LIMIT 1 LOCK IN SHARE MODE",
+        (3, "2024-05-01", "2024-05-03", 0),
+    )]
+    assert batch_statements(batch_conn)[-1] == "ROLLBACK TO SAVEPOINT batch_operation"
+    assert transaction_calls(batch_conn) == ["commit", "rollback"]
+    assert change_log.since(0) == []
+
+def test_batch_atomic_failure_commits_nothing(batch_conn, staff_headers, change_log):
+    batch_conn.cursor.return_value.lastrowid = 7
+    batch_conn.cursor.return_value.rowcount = 0
+
+    client = app.test_client()
+    response = client.post('/batch?atomic=true', headers=staff_headers, json={"operations": [
+        {"method": "POST", "path": "/vehicles", "body": {
+            "reg_number": "FSA123", "model_name": "Mirage", "daily_hire_rate": 50.00, "vehicle_type": "Sedan"
+        }},
+        {"method": "PUT", "path": "/locations/99", "body": {"location_name": "Airport", "vehicle_id": "$0.vehicle_id"}},
+        {"method": "POST", "path": "/customers", "body": {"customer_name": "Kyle", "customer_contact": "0700"}}
+    ]})
+
+    assert response.status_code == 404
+    assert response.get_json()["error"] == "Operation 1 failed, nothing was committed"
+    assert len(response.get_json()["results"]) == 2
+    assert transaction_calls(batch_conn) == ["rollback", "rollback"]
+    assert change_log.since(0) == []
+
+def test_batch_keeps_each_routes_role_checks(batch_conn, user_store):
+    client = app.test_client()
+    response = client.post('/batch', headers=auth_headers(user_store, 'kiosk', 'user'), json={"operations": [
+        {"method": "DELETE", "path": "/vehicles/1"}
+    ]})
+
+    assert response.status_code == 400
+    assert response.get_json()["results"] == [{"status": 403, "body": {"error": "Access forbidden: insufficient permissions"}}]
+
+def test_batch_validates_operations(staff_headers):
+    client = app.test_client()
+
+    assert client.post('/batch', json={"operations": []}).status_code == 401
+    assert client.post('/batch', headers=staff_headers, json={"operations": []}).get_json() == {
+        "error": "A non-empty list of operations is required"
+    }
+    response = client.post('/batch', headers=staff_headers, json={"operations": [{"method": "POST", "path": "/x"}] * 51})
+    assert response.get_json() == {"error": "At most 50 operations can be sent at once"}
+
 if __name__ == "__main__":
     pytest.main()
\ No newline at end of file
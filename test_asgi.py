@@ -0,0 +1,368 @@
+import asyncio
+import datetime
+import gzip
+import json
+import aiosqlite
+import jwt
+import pytest
+from werkzeug.security import generate_password_hash
+from app import app, compressor, token_cache
+from async_db import AsyncMySQL
+from asgi import AsyncApp
+from events import EventBroadcaster
+from db_pool import PoolTimeout
+from store import UserStore, EventLog
+
+SCHEMA = """
+CREATE TABLE Customers (customer_id INTEGER PRIMARY KEY, customer_name TEXT, customer_contact TEXT, row_version INTEGER);
+CREATE TABLE SyncTables (table_name TEXT PRIMARY KEY, pruned_version INTEGER);
+CREATE TABLE Tombstones (table_name TEXT, row_id INTEGER, row_version INTEGER);
+CREATE TABLE Rentals (rental_id INTEGER PRIMARY KEY, customer_id INTEGER, vehicle_id INTEGER,
+                      date_from TEXT, date_to TEXT, total_cost TEXT);
+"""
+
+
+class SQLitePool:
+    # Stand-in for an aiomysql pool on aiosqlite: one shared connection, %s placeholders become ?
+    def __init__(self, path, size=2):
+        self.path = path
+        self.conn = None
+        self.free = None
+        self.size = size
+        self.acquired = 0
+        self.closed = False
+
+    async def open(self):
+        self.conn = await aiosqlite.connect(self.path)
+        self.free = asyncio.Semaphore(self.size)
+        return self
+
+    async def acquire(self):
+        await self.free.acquire()
+        self.acquired += 1
+        return self
+
+    def release(self, conn):
+        self.free.release()
+
+    def cursor(self):
+        return SQLiteCursor(self.conn)
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        await self.conn.close()
+
+
+class SQLiteCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = None
+
+    async def __aenter__(self):
+        self.cursor = await self.conn.cursor()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.cursor.close()
+
+    async def execute(self, query, args=None):
+        await self.cursor.execute(query.replace("%s", "?"), args or ())
+
+    async def fetchall(self):
+        return await self.cursor.fetchall()
+
+
+@pytest.fixture
+def database():
+    # Each event loop (one per call()) gets a fresh in-memory database
+    async def create_pool():
+        pool = await SQLitePool(":memory:").open()
+        await pool.conn.executescript(SCHEMA)
+        # The clock is at 10 and a transaction open since version 8 holds the sync horizon there.
+        # Customers 4 and 5 were inserted by one statement, customer 2 was updated (version 7) after
+        # customer 6 was deleted (version 6), and customer 7 was deleted at the horizon, so not sent yet.
+        await pool.conn.create_function("sync_clock", 0, lambda: 10)
+        await pool.conn.create_function("sync_horizon", 1, lambda settle: 8)
+        await pool.conn.executemany(
+            "INSERT INTO Customers VALUES (?, ?, ?, ?)",
+            [(n, f"Customer {n}", f"0700{n:06d}", version) for n, version in ((1, 1), (2, 7), (3, 3), (4, 4), (5, 4))],
+        )
+        await pool.conn.execute("INSERT INTO SyncTables VALUES ('Customers', 2)")
+        await pool.conn.executemany("INSERT INTO Tombstones VALUES ('Customers', ?, ?)", [(6, 6), (7, 8)])
+        await pool.conn.execute("INSERT INTO Rentals VALUES (1, 1, 3, '2024-05-01', '2024-05-03', '150.00')")
+        await pool.conn.commit()
+        return pool
+    return AsyncMySQL({"MYSQL_POOL_TIMEOUT": 0.2}, create_pool=create_pool)
+
+
+@pytest.fixture
+def staff_token(mocker, tmp_path):
+    token_cache.clear()
+    store = UserStore(str(tmp_path / "state.db"))
+    store.add("staff", generate_password_hash("secret"), "staff")
+    store.add("customer", generate_password_hash("secret"), "user")
+    mocker.patch("app.users", store)
+    return make_token("staff")
+
+
+def make_token(username):
+    return jwt.encode({
+        "username": username,
+        "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    }, app.config["SECRET_KEY"], algorithm="HS256")
+
+
+def call(application, path, query="", headers=None):
+    # Runs one request through the ASGI app (with lifespan around it) and returns (status, headers, body)
+    async def run():
+        lifespan = asyncio.Queue()
+        await lifespan.put({"type": "lifespan.startup"})
+        await lifespan.put({"type": "lifespan.shutdown"})
+        startup = asyncio.Event()
+        proceed = asyncio.Event()
+
+        async def lifespan_receive():
+            message = await lifespan.get()
+            if message["type"] == "lifespan.shutdown":
+                await proceed.wait()
+            return message
+
+        async def lifespan_send(message):
+            if message["type"] == "lifespan.startup.complete":
+                startup.set()
+
+        server = asyncio.ensure_future(application({"type": "lifespan"}, lifespan_receive, lifespan_send))
+        await startup.wait()
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": query.encode(),
+            "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+            "server": ("testserver", 80),
+            "client": ("127.0.0.1", 50000),
+        }
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        await application(scope, receive, send)
+        proceed.set()
+        await server
+        return messages
+
+    messages = asyncio.run(run())
+    start = messages[0]
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    assert messages[-1].get("more_body", False) is False
+    return start["status"], dict(start["headers"]), body
+
+
+def test_customers_are_served_from_async_pool(database, staff_token):
+    application = AsyncApp(app, database)
+    status, headers, body = call(application, "/customers", "limit=2", {"Authorization": staff_token})
+
+    assert status == 200
+    assert headers[b"content-type"] == b"application/json"
+    data = json.loads(body)
+    assert [customer["customer_id"] for customer in data["customers"]] == [1, 2]
+    assert data["next"] == 2
+
+
+def test_customers_gzip(database, staff_token, mocker):
+    mocker.patch.object(compressor, "min_size", 100)
+    application = AsyncApp(app, database)
+    headers = {"Authorization": staff_token, "Accept-Encoding": "gzip"}
+
+    status, response_headers, body = call(application, "/customers", headers=headers)
+    assert status == 200
+    assert response_headers[b"content-encoding"] == b"gzip"
+    assert len(json.loads(gzip.decompress(body))["customers"]) == 5
+
+    status, response_headers, body = call(application, "/customers", "limit=1&fields=customer_name", headers)
+    assert b"content-encoding" not in response_headers
+    assert json.loads(body)["customers"] == [{"customer_id": 1, "customer_name": "Customer 1"}]
+
+
+def test_customers_projection_and_second_page(database, staff_token):
+    application = AsyncApp(app, database)
+    status, _, body = call(application, "/customers", "after=4&fields=customer_name", {"Authorization": staff_token})
+
+    assert status == 200
+    assert json.loads(body) == {"customers": [{"customer_id": 5, "customer_name": "Customer 5"}], "next": None}
+
+
+def test_customers_require_token(database, staff_token):
+    application = AsyncApp(app, database)
+
+    status, _, body = call(application, "/customers")
+    assert status == 401
+    assert json.loads(body) == {"error": "Token is missing"}
+
+    status, _, body = call(application, "/customers", headers={"Authorization": "not-a-token"})
+    assert status == 401
+    assert json.loads(body) == {"error": "Invalid token"}
+
+
+def test_rentals_require_staff_role(database, staff_token):
+    application = AsyncApp(app, database)
+
+    status, _, body = call(application, "/rentals", headers={"Authorization": make_token("customer")})
+    assert status == 403
+
+    status, _, body = call(application, "/rentals", headers={"Authorization": staff_token})
+    assert status == 200
+    assert json.loads(body)["rentals"][0]["rental_id"] == 1
+
+
+def test_bad_filter_and_empty_page(database, staff_token):
+    application = AsyncApp(app, database)
+
+    status, _, body = call(application, "/customers", "fields=password", {"Authorization": staff_token})
+    assert status == 400
+
+    status, _, body = call(application, "/customers", "after=100", {"Authorization": staff_token})
+    assert status == 404
+    assert json.loads(body) == {"error": "No customers found"}
+
+
+def test_pool_timeout_is_503(database, staff_token, mocker):
+    async def exhausted(*args):
+        raise PoolTimeout("no connection")
+    mocker.patch.object(database, "fetchall", exhausted)
+    application = AsyncApp(app, database)
+
+    status, _, body = call(application, "/customers", headers={"Authorization": staff_token})
+    assert status == 503
+    assert json.loads(body) == {"error": "Database busy, try again later"}
+
+
+def test_other_routes_fall_back_to_flask(database):
+    application = AsyncApp(app, database)
+    status, headers, body = call(application, "/")
+
+    assert status == 200
+    assert b"VEHICLE RENTAL SYSTEM MANAGEMENT" in body
+
+
+def test_acquire_timeout_raises_pool_timeout(database):
+    async def run():
+        await database.start()
+        held = [await database.pool.acquire() for _ in range(database.pool.size)]
+        try:
+            with pytest.raises(PoolTimeout):
+                await database.fetchall("SELECT 1")
+        finally:
+            for conn in held:
+                database.pool.release(conn)
+            await database.close()
+
+    asyncio.run(run())
+    assert database.timeouts == 1
+
+
+def test_customers_delta_sync_pages_in_version_order(database, staff_token):
+    application = AsyncApp(app, database)
+    headers = {"Authorization": staff_token}
+
+    status, _, body = call(application, "/customers", "since=3&limit=2&fields=customer_name", headers)
+    assert status == 200
+    assert json.loads(body) == {
+        "customers": [
+            {"customer_id": 3, "customer_name": "Customer 3"},
+            {"customer_id": 4, "customer_name": "Customer 4"},
+        ],
+        "deleted": [],
+        "version": 4,
+        "after": 4,
+        "more": True,
+    }
+
+    # Customer 5 has the same version as customer 4 and is picked up after it
+    status, _, body = call(application, "/customers", "since=4&after=4&limit=2&fields=customer_name", headers)
+    assert json.loads(body) == {
+        "customers": [{"customer_id": 5, "customer_name": "Customer 5"}],
+        "deleted": [6],
+        "version": 6,
+        "after": 6,
+        "more": True,
+    }
+
+    status, _, body = call(application, "/customers", "since=6&after=6&limit=2&fields=customer_name", headers)
+    assert json.loads(body) == {
+        "customers": [{"customer_id": 2, "customer_name": "Customer 2"}],
+        "deleted": [],
+        "version": 8,
+        "after": None,
+        "more": False,
+    }
+
+    status, _, body = call(application, "/customers", "since=8", headers)
+    assert json.loads(body) == {"customers": [], "deleted": [], "version": 8, "after": None, "more": False}
+
+    # The horizon fell back behind a version already sent: nothing new until it passes it again
+    status, _, body = call(application, "/customers", "since=9", headers)
+    assert json.loads(body) == {"customers": [], "deleted": [], "version": 9, "after": None, "more": False}
+
+
+def test_customers_delta_sync_from_pruned_version_is_gone(database, staff_token):
+    application = AsyncApp(app, database)
+    headers = {"Authorization": staff_token}
+
+    assert call(application, "/customers", "since=1", headers)[0] == 410
+    # Ahead of the clock: the clock went back since this version was handed out
+    assert call(application, "/customers", "since=11", headers)[0] == 410
+    # A full sync does not need the pruned tombstones
+    assert call(application, "/customers", "since=0&limit=1", headers)[0] == 200
+    status, _, body = call(application, "/customers", "since=3&customer_name=x", headers)
+    assert (status, json.loads(body)) == (400, {"error": "Filters cannot be combined with since"})
+
+
+def test_events_stream_until_client_disconnects(database, tmp_path):
+    log = EventLog(str(tmp_path / "events.db"))
+    log.append("vehicles", "created", [1])
+    broadcaster = EventBroadcaster(log, poll_interval=0.01)
+    application = AsyncApp(app, database, broadcaster=broadcaster)
+
+    async def run():
+        broadcaster.start()
+        messages = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+            if b"event: locations" in message.get("body", b""):
+                disconnect.set()
+
+        scope = {"type": "http", "method": "GET", "path": "/events", "query_string": b"", "headers": [(b"last-event-id", b"0")]}
+        stream = asyncio.ensure_future(application(scope, receive, send))
+        await asyncio.sleep(0.05)
+        assert broadcaster.subscribers == 1
+        log.append("locations", "updated", [2])
+        await asyncio.wait_for(stream, 5)
+        await broadcaster.stop()
+        return messages
+
+    messages = asyncio.run(run())
+    assert messages[0]["status"] == 200
+    assert (b"content-type", b"text/event-stream") in messages[0]["headers"]
+    body = b"".join(message["body"] for message in messages[1:])
+    assert body.startswith(b"retry: 3000\n\nid: 1\nevent: vehicles\n")
+    assert body.endswith(b'id: 2\nevent: locations\ndata: {"seq":2,"action":"updated","ids":[2]}\n\n')
+    assert broadcaster.subscribers == 0
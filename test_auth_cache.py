@@ -0,0 +1,70 @@
+import time
+from auth_cache import CredentialCache, TokenCache
+
+def test_credential_cache_hit_and_miss():
+    cache = CredentialCache()
+    assert not cache.check("kyle", "pw", "hash")
+
+    cache.add("kyle", "pw", "hash")
+
+    assert cache.check("kyle", "pw", "hash")
+    assert not cache.check("kyle", "wrong", "hash")
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 2}
+
+def test_credential_cache_misses_after_password_change():
+    cache = CredentialCache()
+    cache.add("kyle", "pw", "old-hash")
+
+    assert not cache.check("kyle", "pw", "new-hash")
+    assert cache.stats()["size"] == 0
+
+def test_credential_cache_expires():
+    cache = CredentialCache(ttl=0)
+    cache.add("kyle", "pw", "hash")
+
+    assert not cache.check("kyle", "pw", "hash")
+
+def test_credential_cache_evicts_least_recently_used():
+    cache = CredentialCache(maxsize=2)
+    cache.add("a", "pw", "hash")
+    cache.add("b", "pw", "hash")
+    cache.check("a", "pw", "hash")
+    cache.add("c", "pw", "hash")
+
+    assert cache.check("a", "pw", "hash")
+    assert not cache.check("b", "pw", "hash")
+
+def test_credential_cache_never_stores_plaintext():
+    cache = CredentialCache()
+    cache.add("kyle", "s3cret", "hash")
+
+    assert all(b"s3cret" not in key for key in cache._entries)
+
+def test_token_cache_hit_until_exp():
+    cache = TokenCache()
+    cache.add("token", {"username": "kyle", "exp": time.time() + 60})
+
+    assert cache.get("token")["username"] == "kyle"
+    assert cache.stats()["hits"] == 1
+
+def test_token_cache_drops_expired_entries():
+    cache = TokenCache()
+    cache.add("token", {"username": "kyle", "exp": time.time() - 1})
+
+    assert cache.get("token") is None
+    assert cache.stats()["size"] == 0
+
+def test_token_cache_skips_tokens_without_exp():
+    cache = TokenCache()
+    cache.add("token", {"username": "kyle"})
+
+    assert cache.get("token") is None
+
+def test_token_cache_is_bounded():
+    cache = TokenCache(maxsize=2)
+    exp = time.time() + 60
+    for token in ("a", "b", "c"):
+        cache.add(token, {"exp": exp})
+
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
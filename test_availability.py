@@ -0,0 +1,104 @@
+import datetime
+import pytest
+from availability import RentalIndex, parse_date
+from store import EventLog
+
+def day(n):
+    return datetime.date(2021, 9, n)
+
+class Rentals:
+    # Stand-in for the Rentals table behind an index: counts full and by-id loads
+    def __init__(self, rows):
+        self.rows = {row[0]: row for row in rows}
+        self.full_loads = 0
+        self.loaded_ids = []
+
+    def load(self, start):
+        self.full_loads += 1
+        return [row for row in self.rows.values() if row[3] >= start]
+
+    def load_ids(self, ids, start):
+        self.loaded_ids.append(ids)
+        return [self.rows[i] for i in ids if i in self.rows and self.rows[i][3] >= start]
+
+def make_index(tmp_path, rows, log=None, start=day(1)):
+    rentals = rows if isinstance(rows, Rentals) else Rentals(rows)
+    log = log or EventLog(str(tmp_path / "state.db"))
+    index = RentalIndex(log, rentals.load, rentals.load_ids, today=lambda: start)
+    index.ensure_current()
+    return index
+
+def test_rental_index_overlap_is_inclusive(tmp_path):
+    index = make_index(tmp_path, [(1, 10, day(5), day(8))])
+
+    assert index.overlapping(10, day(8), day(9)) == [1]
+    assert index.overlapping(10, day(1), day(5)) == [1]
+    assert index.is_free(10, day(9), day(12))
+    assert index.is_free(10, day(1), day(4))
+    assert index.is_free(11, day(5), day(8))
+
+def test_rental_index_finds_long_rentals_that_started_earlier(tmp_path):
+    index = make_index(tmp_path, [(1, 10, day(1), day(20)), (2, 10, day(21), day(22))])
+
+    assert index.overlapping(10, day(15), day(16)) == [1]
+
+def test_rental_index_applies_only_the_rentals_in_new_events(tmp_path):
+    rentals = Rentals([(1, 10, day(5), day(8)), (2, 10, day(10), day(12))])
+    log = EventLog(str(tmp_path / "state.db"))
+    index = make_index(tmp_path, rentals, log)
+
+    rentals.rows[3] = (3, 10, day(14), day(15))
+    log.append("rentals", "created", [3])
+    rentals.rows[2] = (2, None, day(10), day(12))
+    log.append("rentals", "updated", [2])
+    del rentals.rows[1]
+    log.append("rentals", "deleted", [1])
+    log.append("vehicles", "updated", [10])
+    index.ensure_current()
+
+    assert (rentals.full_loads, rentals.loaded_ids) == (1, [[1, 2, 3]])
+    assert index.overlapping(10, day(1), day(30)) == [3]
+    index.ensure_current()
+    assert rentals.loaded_ids == [[1, 2, 3]]
+
+def test_rental_index_follows_writes_of_other_workers_without_reloading(tmp_path):
+    rentals = Rentals([(1, 10, day(5), day(8))])
+    log = EventLog(str(tmp_path / "state.db"))
+    worker_a, worker_b = make_index(tmp_path, rentals, log), make_index(tmp_path, rentals, log)
+
+    for rental_id in range(2, 7):
+        rentals.rows[rental_id] = (rental_id, 10, day(rental_id * 3), day(rental_id * 3 + 1))
+        log.append("rentals", "created", [rental_id])
+        worker_a.ensure_current()
+        worker_b.ensure_current()
+
+    assert (worker_a.reloads, worker_b.reloads) == (1, 1)
+    assert rentals.full_loads == 2
+    assert worker_b.overlapping(10, day(18), day(18)) == [6]
+
+def test_rental_index_reloads_when_the_feed_was_trimmed(tmp_path):
+    rentals = Rentals([(1, 10, day(5), day(8))])
+    log = EventLog(str(tmp_path / "state.db"), retain=2)
+    index = make_index(tmp_path, rentals, log)
+
+    for rental_id in range(2, 6):
+        rentals.rows[rental_id] = (rental_id, 10, day(20), day(21))
+        log.append("rentals", "created", [rental_id])
+    index.ensure_current()
+
+    assert (index.reloads, rentals.loaded_ids) == (2, [])
+    assert index.overlapping(10, day(20), day(20)) == [2, 3, 4, 5]
+
+def test_rental_index_keeps_only_rentals_that_had_not_ended(tmp_path):
+    rentals = Rentals([(1, 10, day(1), day(3)), (2, 10, day(3), day(6))])
+    index = make_index(tmp_path, rentals, start=day(4))
+
+    assert index.overlapping(10, day(1), day(30)) == [2]
+    assert index.covers(day(4)) and not index.covers(day(3))
+
+def test_parse_date_only_takes_year_month_day():
+    assert parse_date("2024-05-01") == datetime.date(2024, 5, 1)
+    assert parse_date(datetime.datetime(2024, 5, 1, 12)) == datetime.date(2024, 5, 1)
+    for value in ("20240501", "2024-W01-1", "2024-05-01T00:00", "2024-5-1", 20240501):
+        with pytest.raises(ValueError):
+            parse_date(value)
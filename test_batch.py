@@ -0,0 +1,51 @@
+from unittest.mock import MagicMock
+from batch import BatchConnection, resolve_references
+
+RESULTS = [
+    {"status": 201, "body": {"customer_id": 5}},
+    {"status": 207, "body": {"ids": [10, None, 11], "created": 2}},
+    {"status": 409, "body": {"error": "Vehicle is already rented"}},
+]
+
+
+def test_references_keep_the_referenced_type():
+    path, body, error = resolve_references("/rentals", {
+        "customer_id": "$0.customer_id",
+        "vehicle_ids": ["$1.ids.0", "$1.ids.2"],
+        "note": "paid $0.customer_id in cash",
+    }, RESULTS)
+
+    assert error is None
+    assert path == "/rentals"
+    assert body == {"customer_id": 5, "vehicle_ids": [10, 11], "note": "paid $0.customer_id in cash"}
+
+
+def test_references_in_path_segments():
+    assert resolve_references("/customers/$0.customer_id?atomic=true", None, RESULTS) == (
+        "/customers/5?atomic=true", None, None
+    )
+
+
+def test_unresolved_references():
+    assert resolve_references("/x", {"id": "$3.id"}, RESULTS)[2] == "$3.id refers to an operation that has not run yet"
+    assert resolve_references("/x", {"id": "$2.id"}, RESULTS)[2] == "$2.id refers to a failed operation"
+    assert resolve_references("/x", {"id": "$0.rental_id"}, RESULTS)[2] == "$0.rental_id is not in the response of operation 0"
+    assert resolve_references("/x", {"id": "$1.ids.3"}, RESULTS)[2] == "$1.ids.3 is not in the response of operation 1"
+
+
+def test_batch_connection_holds_commits_and_rolls_back_to_savepoint():
+    conn = MagicMock()
+    batch = BatchConnection(conn)
+
+    batch.savepoint()
+    batch.cursor().execute("INSERT INTO Customers VALUES (1)")
+    batch.commit()
+    batch.rollback()
+
+    conn.commit.assert_not_called()
+    conn.rollback.assert_not_called()
+    assert [call[0][0] for call in conn.cursor.return_value.execute.call_args_list] == [
+        "SAVEPOINT batch_operation",
+        "INSERT INTO Customers VALUES (1)",
+        "ROLLBACK TO SAVEPOINT batch_operation",
+    ]
@@ -0,0 +1,129 @@
+import gzip
+import pytest
+from flask import Flask, Response
+from compression import Compressor
+
+
+def make_app(**config):
+    app = Flask(__name__)
+    app.config.update(COMPRESSION_MIN_SIZE=100, **config)
+    compressor = Compressor(app)
+
+    @app.route("/big")
+    def big():
+        return Response(b'{"rows":[' + b'{"id":1},' * 100 + b'{"id":2}]}', mimetype="application/json")
+
+    @app.route("/small")
+    def small():
+        return Response(b'{"id":1}', mimetype="application/json")
+
+    @app.route("/stream")
+    def stream():
+        return Response((b'{"id":%d}\n' % n for n in range(200)), mimetype="application/x-ndjson")
+
+    @app.route("/short-stream")
+    def short_stream():
+        return Response((b'{"id":%d}\n' % n for n in range(2)), mimetype="application/x-ndjson")
+
+    @app.route("/image")
+    def image():
+        return Response(b"\x89PNG" * 100, mimetype="image/png")
+    return app, compressor
+
+
+def test_choose_follows_client_quality_then_server_order():
+    _, compressor = make_app(COMPRESSION_ENCODINGS=("br", "gzip"))
+
+    assert compressor.choose("gzip, br") == "br"
+    assert compressor.choose("gzip;q=1.0, br;q=0.5") == "gzip"
+    assert compressor.choose("br;q=0, gzip") == "gzip"
+    assert compressor.choose("*") == "br"
+    assert compressor.choose("identity") is None
+    assert compressor.choose(None) is None
+
+
+def test_unknown_and_unavailable_encodings_are_dropped(mocker):
+    mocker.patch("compression.brotli", None)
+    _, compressor = make_app(COMPRESSION_ENCODINGS=("br", "deflate", "gzip"))
+
+    assert compressor.encodings == ("gzip",)
+    assert compressor.choose("br") is None
+
+
+def test_large_body_is_gzipped():
+    app, _ = make_app(COMPRESSION_ENCODINGS=("gzip",))
+    response = app.test_client().get("/big", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert int(response.headers["Content-Length"]) == len(response.data)
+    assert gzip.decompress(response.data).startswith(b'{"rows":[{"id":1},')
+
+
+def test_small_body_and_other_types_are_sent_as_is():
+    app, _ = make_app()
+    client = app.test_client()
+
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.data == b'{"id":1}'
+
+    response = client.get("/image", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert "Vary" not in response.headers
+
+
+def test_no_accept_encoding_means_identity():
+    app, _ = make_app()
+    response = app.test_client().get("/big")
+
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+
+def test_streamed_body_is_compressed_as_it_goes():
+    app, compressor = make_app(COMPRESSION_ENCODINGS=("gzip",))
+    response = app.test_client().get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    lines = gzip.decompress(response.data).splitlines()
+    assert len(lines) == 200
+    assert lines[-1] == b'{"id":199}'
+    assert compressor.streamed == 1
+
+
+def test_short_stream_is_sent_whole_and_uncompressed():
+    app, _ = make_app(COMPRESSION_ENCODINGS=("gzip",))
+    response = app.test_client().get("/short-stream", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in response.headers
+    assert response.data == b'{"id":0}\n{"id":1}\n'
+
+
+def test_encode_stream_closes_source():
+    _, compressor = make_app()
+    closed = []
+
+    chunks, encoding = compressor.encode_stream("gzip", [b"x" * 60] * 5, lambda: closed.append(True))
+    assert encoding == "gzip"
+    assert gzip.decompress(b"".join(chunks)) == b"x" * 300
+    assert closed == [True]
+
+    chunks, encoding = compressor.encode_stream("gzip", ["short"], lambda: closed.append(True))
+    assert (chunks, encoding) == ([b"short"], None)
+    assert closed == [True, True]
+
+
+def test_brotli_and_zstd_round_trip():
+    brotli = pytest.importorskip("brotli")
+    zstandard = pytest.importorskip("zstandard")
+    _, compressor = make_app(COMPRESSION_BR_LEVEL=4, COMPRESSION_ZSTD_LEVEL=5)
+    body = b'{"id":1,"name":"Customer"},' * 500
+
+    assert brotli.decompress(compressor.compress("br", body)) == body
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(compressor.compress("zstd", body)) == body
+
+    chunks, encoding = compressor.encode_stream("br", [body[:5000], body[5000:]])
+    assert encoding == "br"
+    assert brotli.decompress(b"".join(chunks)) == body
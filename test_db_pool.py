@@ -0,0 +1,151 @@
+import sqlite3
+import threading
+import pytest
+from flask import Flask
+from db_pool import ConnectionPool, PoolTimeout, PooledMySQL, Replica, ReplicaSet
+
+def sqlite_connect():
+    return sqlite3.connect(":memory:", check_same_thread=False)
+
+def test_pool_reuses_connections():
+    pool = ConnectionPool(sqlite_connect, max_size=2)
+
+    conn = pool.acquire()
+    pool.release(conn)
+
+    assert pool.acquire() is conn
+    assert pool.stats()["created"] == 1
+
+def test_pool_warm_opens_min_size():
+    pool = ConnectionPool(sqlite_connect, min_size=3, max_size=5)
+    pool.warm()
+
+    stats = pool.stats()
+    assert stats["idle"] == 3
+    assert stats["active"] == 0
+
+def test_pool_checkout_timeout():
+    pool = ConnectionPool(sqlite_connect, max_size=1, timeout=0.05)
+    pool.acquire()
+
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+
+def test_pool_waiter_gets_released_connection():
+    pool = ConnectionPool(sqlite_connect, max_size=1, timeout=2)
+    conn = pool.acquire()
+    acquired = []
+
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    waiter.start()
+    while pool.stats()["waiting"] == 0:
+        pass
+    pool.release(conn)
+    waiter.join()
+
+    assert acquired == [conn]
+    assert pool.stats()["waiting"] == 0
+
+def test_pool_recycles_after_max_uses():
+    pool = ConnectionPool(sqlite_connect, max_size=1, max_uses=2)
+
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    pool.release(first)
+
+    assert pool.acquire() is not first
+    assert pool.stats()["recycled"] == 1
+
+def test_pool_replaces_dead_connection():
+    pool = ConnectionPool(sqlite_connect, max_size=1, check_interval=0)
+
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.close()
+
+    replacement = pool.acquire()
+    assert replacement is not conn
+    replacement.execute("SELECT 1")
+    assert pool.stats()["failed_checks"] == 1
+
+def test_pool_rolls_back_on_release():
+    pool = ConnectionPool(sqlite_connect, max_size=1)
+
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    conn.execute("INSERT INTO t VALUES (1)")
+    pool.release(conn)
+
+    conn = pool.acquire()
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone() == (0,)
+
+def replica_set(*names, lag=lambda conn: 0, **kwargs):
+    replicas = [Replica(name, ConnectionPool(sqlite_connect, max_size=4)) for name in names]
+    return ReplicaSet(replicas, lag=lag, **kwargs)
+
+def test_replicas_round_robin():
+    replicas = replica_set("a", "b", balance="round_robin")
+
+    assert [replicas.choose().name for _ in range(4)] == ["a", "b", "a", "b"]
+
+def test_replicas_least_loaded():
+    replicas = replica_set("a", "b")
+    busy = replicas.replicas[0].pool.acquire()
+
+    assert replicas.choose().name == "b"
+    replicas.replicas[0].pool.release(busy)
+    replicas.replicas[1].pool.acquire()
+    assert replicas.choose().name == "a"
+
+def test_replicas_lagging_or_unreachable_are_skipped_until_next_check():
+    lags = iter([120, None, 0, 0])  # a, then b, per round of checks
+    replicas = replica_set("a", "b", lag=lambda conn: next(lags), max_lag=30, check_interval=60)
+
+    assert replicas.choose() is None
+    stats = {replica["name"]: replica for replica in replicas.stats()}
+    assert stats["a"]["healthy"] is False and stats["a"]["lag"] == 120
+    assert stats["b"]["healthy"] is False and stats["b"]["failures"] == 1
+
+    # Not due for another check yet
+    assert replicas.choose() is None
+
+    replicas.check_interval = 0
+    assert replicas.choose().name == "a"
+
+def test_replicas_mark_down():
+    replicas = replica_set("a", check_interval=60)
+    replica = replicas.choose()
+    replicas.mark_down(replica)
+
+    assert replicas.choose() is None
+    assert replica.failures == 1
+
+def test_read_connection_uses_replica_then_falls_back(tmp_path):
+    app = Flask(__name__)
+    app.config["MYSQL_REPLICAS"] = [{"host": "replica-1"}]
+    opened = []
+
+    def replica_connect(settings):
+        def connect():
+            opened.append(settings["MYSQL_HOST"])
+            return sqlite_connect()
+        return connect
+    mysql = PooledMySQL(app, connect=sqlite_connect, replica_connect=replica_connect)
+    mysql.replicas._lag = lambda conn: 0
+
+    with app.app_context():
+        assert mysql.read_connection is not mysql.connection
+    assert opened == ["replica-1"]
+    assert mysql.replicas.stats()[0]["pool"]["idle"] == 1
+
+    # Once this request holds the primary, its reads stay there
+    with app.app_context():
+        primary = mysql.connection
+        assert mysql.read_connection is primary
+
+    mysql.replicas.mark_down(mysql.replicas.replicas[0])
+    with app.app_context():
+        assert mysql.read_connection is mysql.connection
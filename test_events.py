@@ -0,0 +1,160 @@
+import asyncio
+import json
+from events import (
+    EventBroadcaster, parse_topics, parse_last_event_id, read_events, poll_events, event_frame,
+    RETRY_FRAME, HEARTBEAT_FRAME,
+)
+from store import EventLog
+
+
+def make_log(tmp_path, retain=100):
+    return EventLog(str(tmp_path / "state.db"), retain=retain)
+
+
+def parse(frames):
+    # [(id, event, data)] from a run of SSE frames
+    events = []
+    for block in b"".join(frames).decode().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":") and ": " in line)
+        if "event" in fields:
+            events.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_parse_topics_and_last_event_id():
+    assert parse_topics(None) == (("vehicles", "locations"), None)
+    assert parse_topics("rentals, vehicles,rentals") == (("rentals", "vehicles"), None)
+    assert parse_topics("customers") == (None, "Unknown topic: customers")
+    assert parse_topics(",") == (None, "At least one topic is required")
+
+    assert parse_last_event_id("42") == 42
+    assert parse_last_event_id("") is None
+    assert parse_last_event_id("abc") is None
+
+
+def test_event_frame_format():
+    assert event_frame(7, "vehicles", "updated", "[3, 4]") == (
+        b'id: 7\nevent: vehicles\ndata: {"seq":7,"action":"updated","ids":[3,4]}\n\n'
+    )
+
+
+def test_read_events_filters_topics(tmp_path):
+    log = make_log(tmp_path)
+    log.append("vehicles", "created", [1])
+    log.append("rentals", "created", [10])
+    log.append("locations", "updated", [2])
+
+    frames, last_seq = read_events(log, 0, ("vehicles", "locations"))
+    assert last_seq == 3
+    assert parse(frames) == [
+        (1, "vehicles", {"seq": 1, "action": "created", "ids": [1]}),
+        (3, "locations", {"seq": 3, "action": "updated", "ids": [2]}),
+    ]
+    assert read_events(log, 3, ("vehicles",)) == ([], 3)
+
+
+def test_read_events_resets_when_events_were_trimmed_or_unknown(tmp_path):
+    log = make_log(tmp_path, retain=2)
+    for vehicle_id in range(1, 6):
+        log.append("vehicles", "updated", [vehicle_id])
+
+    # Events 2 and 3 are gone: the client has to refetch instead of missing them
+    frames, last_seq = read_events(log, 1, ("vehicles",))
+    assert (frames, last_seq) == ([b"id: 5\nevent: reset\ndata: {}\n\n"], 5)
+
+    # Exactly caught up to the oldest kept event is fine
+    frames, last_seq = read_events(log, 3, ("vehicles",))
+    assert [event[0] for event in parse(frames)] == [4, 5]
+
+    # An id from another log (e.g. the state file was recreated) resets too
+    frames, last_seq = read_events(log, 99, ("vehicles",))
+    assert parse(frames) == [(5, "reset", {})]
+
+
+def test_poll_events_starts_at_latest_and_ends_after_duration(tmp_path):
+    log = make_log(tmp_path)
+    log.append("vehicles", "created", [1])
+
+    assert list(poll_events(log, None, ("vehicles",), duration=0)) == [RETRY_FRAME]
+
+    frames = list(poll_events(log, 0, ("vehicles",), duration=0))
+    assert frames[0] == RETRY_FRAME
+    assert [event[0] for event in parse(frames)] == [1]
+
+
+def test_broadcaster_fans_out_new_events(tmp_path):
+    log = make_log(tmp_path)
+    log.append("vehicles", "created", [1])
+    broadcaster = EventBroadcaster(log, poll_interval=0.01)
+
+    async def collect(topics, count):
+        frames = []
+        stream = broadcaster.subscribe(None, topics, heartbeat=5)
+        async for frame in stream:
+            frames.append(frame)
+            if len(parse(frames)) == count:
+                break
+        await stream.aclose()
+        return parse(frames)
+
+    async def run():
+        broadcaster.start()
+        subscribers = [asyncio.ensure_future(collect(("vehicles", "locations"), 2)) for _ in range(50)]
+        rentals = asyncio.ensure_future(collect(("rentals",), 1))
+        await asyncio.sleep(0.05)
+        assert broadcaster.subscribers == 51
+
+        log.append("vehicles", "updated", [1])
+        log.append("rentals", "created", [5])
+        log.append("locations", "deleted", [2])
+        results = await asyncio.gather(*subscribers, rentals)
+        await broadcaster.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert all(result == [
+        (2, "vehicles", {"seq": 2, "action": "updated", "ids": [1]}),
+        (4, "locations", {"seq": 4, "action": "deleted", "ids": [2]}),
+    ] for result in results[:-1])
+    assert results[-1] == [(3, "rentals", {"seq": 3, "action": "created", "ids": [5]})]
+    assert broadcaster.subscribers == 0
+
+
+def test_broadcaster_resumes_from_last_event_id_and_sends_heartbeats(tmp_path):
+    log = make_log(tmp_path)
+    for vehicle_id in range(1, 4):
+        log.append("vehicles", "updated", [vehicle_id])
+    broadcaster = EventBroadcaster(log, poll_interval=0.01)
+
+    async def run():
+        stream = broadcaster.subscribe(1, ("vehicles",), heartbeat=0.01)
+        frames = [await stream.__anext__() for _ in range(3)]
+        await stream.aclose()
+        await broadcaster.stop()
+        return frames
+
+    frames = asyncio.run(run())
+    assert frames[0] == RETRY_FRAME
+    assert [event[0] for event in parse(frames[1:2])] == [2, 3]
+    assert frames[2] == HEARTBEAT_FRAME
+
+
+def test_broadcaster_reads_the_log_when_too_far_behind_its_backlog(tmp_path):
+    log = make_log(tmp_path)
+    broadcaster = EventBroadcaster(log, backlog=2)
+
+    async def run():
+        broadcaster.start()
+        stream = broadcaster.subscribe(None, ("vehicles",), heartbeat=5)
+        await stream.__anext__()
+        for vehicle_id in range(1, 7):
+            log.append("vehicles", "updated", [vehicle_id])
+        # Only seqs 3 to 6 are left in memory, so 1 and 2 come from the log
+        broadcaster.publish(log.since(0))
+        del broadcaster._seqs[:2], broadcaster._frames[:2]
+        frame = await stream.__anext__()
+        await stream.aclose()
+        await broadcaster.stop()
+        return frame
+
+    assert [event[0] for event in parse([asyncio.run(run())])] == [1, 2, 3, 4, 5, 6]
@@ -0,0 +1,118 @@
+import threading
+import pytest
+from flask import Flask, jsonify
+from idempotency import IdempotencyKeys
+from store import IdempotencyStore
+
+
+@pytest.fixture
+def setup(tmp_path):
+    app = Flask(__name__)
+    keys = IdempotencyKeys(IdempotencyStore(str(tmp_path / "state.db")), wait=2.0, evict_every=2, max_keys=1)
+    calls = []
+    gate = threading.Event()
+    gate.set()
+
+    @app.route("/things", methods=["POST"])
+    @keys.idempotent
+    def create():
+        gate.wait()
+        calls.append(1)
+        if len(calls) == 1 and app.config.get("FAIL_FIRST"):
+            return jsonify({"error": "busy"}), 503
+        return jsonify({"thing_id": len(calls)}), 201
+    return app, keys, calls, gate
+
+
+def test_without_key_every_request_runs(setup):
+    app, _, calls, _ = setup
+    client = app.test_client()
+    client.post("/things", json={"name": "a"})
+    client.post("/things", json={"name": "a"})
+
+    assert len(calls) == 2
+
+
+def test_retry_replays_stored_response(setup):
+    app, keys, calls, _ = setup
+    client = app.test_client()
+    first = client.post("/things", json={"name": "a"}, headers={"Idempotency-Key": "k1"})
+    second = client.post("/things", json={"name": "a"}, headers={"Idempotency-Key": "k1"})
+
+    assert len(calls) == 1
+    assert second.status_code == 201
+    assert second.get_json() == first.get_json() == {"thing_id": 1}
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert keys.stats()["replayed"] == 1
+
+
+def test_same_key_different_body_is_rejected(setup):
+    app, _, calls, _ = setup
+    client = app.test_client()
+    client.post("/things", json={"name": "a"}, headers={"Idempotency-Key": "k1"})
+    response = client.post("/things", json={"name": "b"}, headers={"Idempotency-Key": "k1"})
+
+    assert response.status_code == 422
+    assert len(calls) == 1
+
+
+def test_same_key_different_query_string_is_rejected(setup):
+    app, _, calls, _ = setup
+    client = app.test_client()
+    client.post("/things", json={"name": "a"}, headers={"Idempotency-Key": "k1"})
+    response = client.post("/things?atomic=true", json={"name": "a"}, headers={"Idempotency-Key": "k1"})
+
+    assert response.status_code == 422
+    assert len(calls) == 1
+
+
+def test_invalid_key(setup):
+    app, _, calls, _ = setup
+    response = app.test_client().post("/things", json={}, headers={"Idempotency-Key": "x" * 300})
+
+    assert response.status_code == 400
+    assert calls == []
+
+
+def test_server_errors_are_not_stored(setup):
+    app, _, calls, _ = setup
+    app.config["FAIL_FIRST"] = True
+    client = app.test_client()
+
+    assert client.post("/things", json={}, headers={"Idempotency-Key": "k1"}).status_code == 503
+    assert client.post("/things", json={}, headers={"Idempotency-Key": "k1"}).status_code == 201
+    assert len(calls) == 2
+
+
+def test_concurrent_duplicates_coalesce(setup):
+    app, keys, calls, gate = setup
+    gate.clear()
+    responses = []
+
+    def send():
+        responses.append(app.test_client().post("/things", json={}, headers={"Idempotency-Key": "k1"}))
+
+    threads = [threading.Thread(target=send) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while keys.coalesced < 2:
+        threading.Event().wait(0.01)
+    gate.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(response.status_code for response in responses) == [201, 201, 201]
+    assert {response.get_json()["thing_id"] for response in responses} == {1}
+
+
+def test_old_keys_are_evicted(setup):
+    app, keys, calls, _ = setup
+    client = app.test_client()
+    for key in ("k1", "k2"):
+        client.post("/things", json={}, headers={"Idempotency-Key": key})
+
+    assert keys.store.count() == 1
+    assert keys.stats()["evicted"] == 1
+    client.post("/things", json={}, headers={"Idempotency-Key": "k1"})
+    assert len(calls) == 3
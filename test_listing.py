@@ -0,0 +1,65 @@
+import datetime
+from werkzeug.datastructures import MultiDict
+from listing import ListSpec, parse_bool, parse_iso_date, parse_number
+
+SPEC = ListSpec("Rentals", "rental_id", {
+    "rental_id": int,
+    "customer_id": int,
+    "date_from": parse_iso_date,
+    "total_cost": parse_number,
+    "returned": parse_bool
+}, ranges=("date_from", "total_cost"))
+
+def test_query_without_args_selects_every_column():
+    query, error = SPEC.query(MultiDict(), 0, 101)
+
+    assert error is None
+    assert query == (
+        "SELECT rental_id, customer_id, date_from, total_cost, returned FROM Rentals "
+        "WHERE rental_id > %s ORDER BY rental_id LIMIT %s",
+        (0, 101),
+        ["rental_id", "customer_id", "date_from", "total_cost", "returned"]
+    )
+
+def test_query_projects_fields_and_keeps_key():
+    (sql, _, columns), _ = SPEC.query(MultiDict({"fields": "total_cost,customer_id"}), 0, 11)
+
+    assert sql.startswith("SELECT rental_id, total_cost, customer_id FROM Rentals")
+    assert columns == ["rental_id", "total_cost", "customer_id"]
+
+def test_query_compiles_filters_to_parameters():
+    args = MultiDict([
+        ("customer_id", "3"), ("date_from__gte", "2021-09-01"), ("date_from__lt", "2021-10-01"),
+        ("returned", "false"), ("limit", "10")
+    ])
+
+    (sql, params, _), error = SPEC.query(args, 5, 11)
+
+    assert error is None
+    assert "WHERE customer_id = %s AND date_from >= %s AND date_from < %s AND returned = %s AND rental_id > %s" in sql
+    assert params == (3, datetime.date(2021, 9, 1), datetime.date(2021, 10, 1), False, 5, 11)
+
+def test_query_rejects_names_outside_the_whitelist():
+    assert SPEC.query(MultiDict({"fields": "rental_id,password"}), 0, 11) == (None, "Unknown field: password")
+    assert SPEC.query(MultiDict({"customer_id__gte": "1"}), 0, 11) == (None, "Unknown filter: customer_id__gte")
+    assert SPEC.query(MultiDict({"total_cost__like": "1"}), 0, 11) == (None, "Unknown filter: total_cost__like")
+    assert SPEC.query(MultiDict({"1=1; --": "1"}), 0, 11) == (None, "Unknown filter: 1=1; --")
+
+def test_query_rejects_unparseable_values():
+    assert SPEC.query(MultiDict({"customer_id": "abc"}), 0, 11) == (None, "Invalid value for customer_id")
+    assert SPEC.query(MultiDict({"total_cost__lte": "nan"}), 0, 11) == (None, "Invalid value for total_cost__lte")
+    assert SPEC.query(MultiDict({"returned": "maybe"}), 0, 11) == (None, "Invalid value for returned")
+    assert SPEC.query(MultiDict({"date_from__gte": "20240501"}), 0, 11) == (None, "Invalid value for date_from__gte")
+
+def test_changes_selects_row_version_and_refuses_filters():
+    (sql, columns), error = SPEC.changes(MultiDict({"fields": "total_cost", "since": "40", "limit": "10"}))
+
+    assert error is None
+    assert sql == (
+        "SELECT rental_id, total_cost, row_version FROM Rentals "
+        "WHERE row_version >= %s AND (row_version > %s OR rental_id > %s) AND row_version < %s "
+        "ORDER BY row_version, rental_id LIMIT %s"
+    )
+    assert columns == ["rental_id", "total_cost"]
+    assert SPEC.changes(MultiDict({"since": "40", "customer_id": "3"})) == (None, "Filters cannot be combined with since")
+    assert SPEC.changes(MultiDict({"fields": "password"})) == (None, "Unknown field: password")
@@ -0,0 +1,59 @@
+import sqlite3
+from flask import Flask
+from metrics import Metrics, QueryStats, InstrumentedConnection
+
+def sample(metrics, name, labels):
+    return metrics.registry.get_sample_value(name, labels)
+
+def make_connection(metrics, stats):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE Rentals (rental_id INTEGER PRIMARY KEY, total_cost REAL)")
+    return InstrumentedConnection(conn, metrics, stats)
+
+def test_cursor_counts_statements_and_rows():
+    metrics = Metrics()
+    stats = QueryStats()
+    cursor = make_connection(metrics, stats).cursor()
+
+    cursor.executemany("INSERT INTO Rentals (total_cost) VALUES (?)", [(100,), (120,), (80,)])
+    cursor.execute("SELECT rental_id FROM Rentals WHERE total_cost > ?", (90,))
+    assert len(cursor.fetchall()) == 2
+    cursor.execute("SELECT rental_id FROM Rentals")
+    assert cursor.fetchone() == (1,)
+
+    assert stats.statements == 3
+    assert stats.rows == 3
+    assert stats.seconds > 0
+    assert sample(metrics, "sql_query_duration_seconds_count", {"operation": "SELECT", "table": "Rentals"}) == 2
+    assert sample(metrics, "sql_query_duration_seconds_count", {"operation": "INSERT", "table": "Rentals"}) == 1
+
+def test_cursor_forwards_attributes():
+    cursor = make_connection(Metrics(), None).cursor()
+
+    cursor.arraysize = 7
+    cursor.execute("UPDATE Rentals SET total_cost = 0")
+
+    assert cursor._cursor.arraysize == 7
+    assert cursor.rowcount == 0
+
+def test_request_metrics_and_render():
+    metrics = Metrics()
+    app = Flask(__name__)
+    metrics.init_app(app)
+
+    @app.route("/rentals/<int:rental_id>")
+    def get_rental(rental_id):
+        metrics.auth_outcome("token", "valid")
+        return "", 404
+
+    app.test_client().get("/rentals/5")
+    app.test_client().get("/missing")
+
+    labels = {"method": "GET", "route": "/rentals/<int:rental_id>", "status": "404"}
+    assert sample(metrics, "http_request_duration_seconds_count", labels) == 1
+    assert sample(metrics, "http_request_duration_seconds_count", dict(labels, route="unmatched")) == 1
+    assert sample(metrics, "http_request_sql_statements_count", {"route": "/rentals/<int:rental_id>"}) == 1
+
+    body, content_type = metrics.render()
+    assert content_type.startswith("text/plain")
+    assert b'auth_outcomes_total{check="token",outcome="valid"} 1.0' in body
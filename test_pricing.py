@@ -0,0 +1,49 @@
+import numpy as np
+from pricing import quote, RateTable
+from store import TableVersions
+
+def dates(*values):
+    return np.array(values, dtype="datetime64[D]")
+
+def test_quote_counts_both_dates():
+    costs, days = quote(np.array([50.0]), dates("2021-09-01"), dates("2021-09-02"))
+
+    assert days.tolist() == [2]
+    assert costs.tolist() == [100.0]
+
+def test_quote_weekend_multiplier():
+    # Friday to Monday: two weekdays and two weekend days
+    costs, _ = quote(np.array([100.0]), dates("2021-09-03"), dates("2021-09-06"), weekend_multiplier=1.5)
+
+    assert costs.tolist() == [500.0]
+
+def test_quote_long_hire_multiplier():
+    costs, days = quote(
+        np.array([10.0, 10.0]),
+        dates("2021-09-01", "2021-09-01"),
+        dates("2021-09-06", "2021-09-07"),
+        long_hire_days=7,
+        long_hire_multiplier=0.5
+    )
+
+    assert days.tolist() == [6, 7]
+    assert costs.tolist() == [60.0, 35.0]
+
+def test_rate_table_lookup(tmp_path):
+    table = RateTable(TableVersions(str(tmp_path / "state.db")), lambda: [(3, 80), (1, 50.5)])
+
+    rates, found = table.lookup([1, 2, 3, 4])
+
+    assert rates.tolist() == [50.5, 0.0, 80.0, 0.0]
+    assert found.tolist() == [True, False, True, False]
+
+def test_rate_table_reloads_when_vehicles_change(tmp_path):
+    versions = TableVersions(str(tmp_path / "state.db"))
+    vehicles = [(1, 50)]
+    table = RateTable(versions, lambda: list(vehicles))
+    table.lookup([1])
+
+    vehicles[0] = (1, 60)
+    assert table.lookup([1])[0].tolist() == [50.0]
+    versions.bump("Vehicles")
+    assert table.lookup([1])[0].tolist() == [60.0]
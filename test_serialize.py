@@ -0,0 +1,54 @@
+import datetime
+import decimal
+import importlib
+import json
+import sys
+from flask import Flask
+import serialize
+from serialize import RowEncoder, stream_page, iso_date
+
+ROWS = [
+    (1, 'ABC123', decimal.Decimal('50.00'), datetime.date(2021, 9, 1), None),
+    (2, 'Škoda', decimal.Decimal('55.50'), datetime.date(2021, 9, 2), True),
+]
+COLUMNS = ("vehicle_id", "reg_number", "daily_hire_rate", "date_from", "is_available")
+
+def test_stream_page_matches_jsonify():
+    flask_app = Flask(__name__)
+    with flask_app.app_context():
+        expected = flask_app.json.loads(flask_app.json.dumps({
+            "vehicles": [dict(zip(COLUMNS, row)) for row in ROWS], "next": 2
+        }))
+
+    body = b"".join(stream_page("vehicles", RowEncoder(COLUMNS), ROWS, 2))
+
+    assert json.loads(body) == expected
+    assert json.loads(body)["vehicles"][0]["date_from"] == "Wed, 01 Sep 2021 00:00:00 GMT"
+
+def test_array_streams_in_chunks():
+    chunks = list(RowEncoder(("id",)).array(iter([(n,) for n in range(5)]), chunk_size=2))
+
+    assert len(chunks) == 5
+    assert json.loads(b"".join(chunks)) == [{"id": n} for n in range(5)]
+    assert b"".join(RowEncoder(("id",)).array([])) == b"[]"
+
+def test_ndjson_with_iso_dates():
+    lines = RowEncoder(COLUMNS, date_format=iso_date).ndjson(ROWS).splitlines()
+
+    assert len(lines) == 2
+    assert json.loads(lines[1]) == {
+        "vehicle_id": 2, "reg_number": "Škoda", "daily_hire_rate": "55.50", "date_from": "2021-09-02", "is_available": True
+    }
+
+def test_stdlib_fallback_encodes_the_same(monkeypatch):
+    expected = json.loads(b"".join(stream_page("vehicles", RowEncoder(COLUMNS), ROWS, None)))
+
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    fallback = importlib.reload(serialize)
+    try:
+        assert fallback.orjson is None
+        body = b"".join(fallback.stream_page("vehicles", fallback.RowEncoder(COLUMNS), ROWS, None))
+        assert json.loads(body) == expected
+    finally:
+        monkeypatch.undo()
+        importlib.reload(serialize)
@@ -0,0 +1,51 @@
+import datetime
+import json
+import logging
+import sqlite3
+from metrics import Metrics, InstrumentedConnection
+from slow_queries import SlowQueryLog, statement_template, param_shape
+
+def make_cursor(slow_queries):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE Rentals (rental_id INTEGER PRIMARY KEY, customer_id INTEGER)")
+    conn.executemany("INSERT INTO Rentals (customer_id) VALUES (?)", [(1,), (2,), (1,)])
+    return InstrumentedConnection(conn, Metrics(slow_queries=slow_queries), None).cursor()
+
+def test_statement_template_collapses_placeholder_lists():
+    query = """SELECT vehicle_id FROM Vehicles
+        WHERE vehicle_id IN (%s, %s, %s) FOR UPDATE"""
+
+    assert statement_template(query) == "SELECT vehicle_id FROM Vehicles WHERE vehicle_id IN (%s, ...) FOR UPDATE"
+
+def test_param_shape_hides_values():
+    assert param_shape((1, 2, "x", datetime.date(2021, 9, 1))) == "(int x 2, str, date)"
+    assert param_shape([(1, "a"), (2, "b")], many=True) == "2 x (int, str)"
+    assert param_shape(None) == "()"
+
+def test_slow_query_is_logged_and_explained_once(tmp_path, caplog):
+    explain_file = tmp_path / "explain.jsonl"
+    slow_queries = SlowQueryLog(threshold=1e-9, explain_file=str(explain_file), explain_interval=300)
+    cursor = make_cursor(slow_queries)
+
+    with caplog.at_level(logging.WARNING, logger="slow_queries"):
+        cursor.execute("SELECT rental_id FROM Rentals WHERE customer_id = ?", (1,))
+        cursor.execute("SELECT rental_id FROM Rentals WHERE customer_id = ?", (2,))
+
+    assert slow_queries.logged == 2
+    assert "params=(int) sql=SELECT rental_id FROM Rentals WHERE customer_id = ?" in caplog.text
+    entries = [json.loads(line) for line in explain_file.read_text().splitlines()]
+    assert len(entries) == 1
+    assert entries[0]["sql"] == "SELECT rental_id FROM Rentals WHERE customer_id = ?"
+    assert entries[0]["plan"]
+
+def test_fast_and_unbuffered_queries_are_not_explained(tmp_path):
+    explain_file = tmp_path / "explain.jsonl"
+    fast = SlowQueryLog(threshold=60, explain_file=str(explain_file))
+    make_cursor(fast).execute("SELECT * FROM Rentals")
+
+    unbuffered = SlowQueryLog(threshold=1e-9, explain_file=str(explain_file), unbuffered=(sqlite3.Cursor,))
+    make_cursor(unbuffered).execute("SELECT * FROM Rentals")
+
+    assert fast.logged == 0
+    assert unbuffered.logged == 1
+    assert not explain_file.exists()
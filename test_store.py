@@ -0,0 +1,109 @@
+import json
+from store import UserStore, TableVersions, ReadPins, IdempotencyStore, EventLog
+
+def test_user_store_add_and_get(tmp_path):
+    store = UserStore(str(tmp_path / "state.db"))
+
+    assert store.add("kyle", "hash", "staff")
+    assert store.get("kyle") == {"password": "hash", "role": "staff"}
+    assert store.get("nobody") is None
+
+def test_user_store_rejects_duplicates(tmp_path):
+    store = UserStore(str(tmp_path / "state.db"))
+
+    assert store.add("kyle", "hash", "staff")
+    assert not store.add("kyle", "other", "admin")
+    assert store.get("kyle")["password"] == "hash"
+
+def test_user_store_set_token(tmp_path):
+    store = UserStore(str(tmp_path / "state.db"))
+    store.add("kyle", "hash", "staff")
+    store.set_token("kyle", "abc")
+
+    assert store.get("kyle")["token"] == "abc"
+
+def test_user_store_shared_between_instances(tmp_path):
+    # Two stores on one file stand in for two worker processes
+    path = str(tmp_path / "state.db")
+    first = UserStore(path)
+    second = UserStore(path)
+    second.get("kyle")
+
+    first.add("kyle", "hash", "user")
+
+    assert second.get("kyle")["role"] == "user"
+
+def test_user_store_imports_legacy_json(tmp_path):
+    legacy = tmp_path / "users.json"
+    legacy.write_text(json.dumps({
+        "kyle": {"password": "hash", "role": "admin", "token": "abc"},
+        "ana": {"password": "hash2"}
+    }))
+
+    store = UserStore(str(tmp_path / "state.db"), legacy_file=str(legacy))
+
+    assert store.get("kyle") == {"password": "hash", "role": "admin", "token": "abc"}
+    assert store.get("ana")["role"] == "user"
+
+def test_table_versions_bump(tmp_path):
+    path = str(tmp_path / "state.db")
+    versions = TableVersions(path)
+
+    assert versions.get("Vehicles") == 0
+    assert versions.bump("Vehicles", "Locations") == {"Vehicles": 1, "Locations": 1}
+    assert versions.bump("Vehicles") == {"Vehicles": 2}
+    assert TableVersions(path).get("Vehicles") == 2
+
+def test_read_pins_expire(tmp_path):
+    pins = ReadPins(str(tmp_path / "state.db"))
+    pins.pin("kyle", 60)
+    pins.pin("anna", -1)
+
+    assert pins.pinned("kyle")
+    assert not pins.pinned("anna")
+    assert not pins.pinned("nobody")
+    assert ReadPins(str(tmp_path / "state.db")).pinned("kyle")
+
+def test_idempotency_store_claim_complete_and_evict(tmp_path):
+    store = IdempotencyStore(str(tmp_path / "state.db"))
+
+    assert store.claim("a", "f1", 100.0, 0.0, 0.0) is None
+    assert store.claim("a", "f1", 101.0, 0.0, 0.0) == ("f1", None, None, None)
+    store.complete("a", 201, b'{"id":1}', "application/json")
+    assert store.claim("a", "f1", 102.0, 0.0, 0.0) == ("f1", 201, b'{"id":1}', "application/json")
+
+    # Expired keys are claimed afresh
+    assert store.claim("a", "f2", 200.0, 150.0, 0.0) is None
+
+    store.claim("b", "f", 201.0, 0.0, 0.0)
+    store.claim("c", "f", 202.0, 0.0, 0.0)
+    assert store.evict(0.0, 2) == 1
+    assert store.get("a") is None
+    assert store.count() == 2
+
+def test_idempotency_store_release_keeps_completed(tmp_path):
+    store = IdempotencyStore(str(tmp_path / "state.db"))
+    store.claim("a", "f", 1.0, 0.0, 0.0)
+    store.claim("b", "f", 1.0, 0.0, 0.0)
+    store.complete("b", 200, b"", "application/json")
+
+    store.release("a")
+    store.release("b")
+    assert store.get("a") is None
+    assert store.get("b") is not None
+
+def test_event_log_append_since_and_trim(tmp_path):
+    log = EventLog(str(tmp_path / "state.db"), retain=3)
+    assert log.bounds() == (1, 0)
+
+    for vehicle_id in range(1, 6):
+        assert log.append("vehicles", "updated", [vehicle_id]) == vehicle_id
+
+    assert log.bounds() == (3, 5)
+    assert log.since(3) == [(4, "vehicles", "updated", "[4]"), (5, "vehicles", "updated", "[5]")]
+    assert [row[0] for row in log.since(0, limit=2)] == [3, 4]
+
+    # Sequence numbers are never reused, even once everything older has been trimmed
+    log.db.execute("DELETE FROM events")
+    assert log.bounds() == (6, 5)
+    assert EventLog(str(tmp_path / "state.db")).append("locations", "created", [9]) == 6